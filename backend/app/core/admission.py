@@ -0,0 +1,282 @@
+import asyncio
+import heapq
+import itertools
+import json
+import math
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional
+
+import httpx
+
+from app.core import metrics
+
+# Admission control for LLM upstream calls (SiliconFlow).
+# Every request on the "siliconflow" HTTP client waits for a per-model slot; waiters are served by
+# priority, so a burst of meal plans or step images can't starve interactive chat. Requests are
+# checked at the API boundary against a per-user token bucket and the predicted queue wait, and
+# rejected early with 429 + Retry-After instead of piling up behind a saturated upstream.
+
+# Lower value = served first
+PRIORITIES: Dict[str, int] = {"interactive": 0, "recipe": 1, "background": 2}
+DEFAULT_PRIORITY = "recipe"
+
+LLM_MODEL_CONCURRENCY = int(os.getenv("LLM_MODEL_CONCURRENCY", "8"))
+# Per-model overrides, e.g. "Kwai-Kolors/Kolors=4,THUDM/GLM-4.1V-9B-Thinking=4"
+LLM_MODEL_CONCURRENCY_OVERRIDES: Dict[str, int] = {
+    model.strip(): int(limit)
+    for model, _, limit in (
+        item.partition("=") for item in os.getenv("LLM_MODEL_CONCURRENCY_OVERRIDES", "").split(",") if "=" in item
+    )
+}
+# Longest predicted queue wait (seconds) a new request accepts before getting a 429; background work always queues
+LLM_QUEUE_BUDGETS: Dict[str, Optional[float]] = {
+    "interactive": float(os.getenv("LLM_QUEUE_BUDGET_INTERACTIVE", "5")),
+    "recipe": float(os.getenv("LLM_QUEUE_BUDGET_RECIPE", "20")),
+    "background": None,
+}
+# Per-user token bucket: sustained AI requests per minute and burst size
+USER_AI_RATE_PER_MINUTE = float(os.getenv("USER_AI_RATE_PER_MINUTE", "20"))
+USER_AI_BURST = float(os.getenv("USER_AI_BURST", "10"))
+MAX_TRACKED_USERS = 10000
+# Gate of ASR uploads: they are multipart, so request_model() keys them by endpoint
+ASR_GATE = "audio/transcriptions"
+
+_current_priority: ContextVar[str] = ContextVar("llm_priority", default=DEFAULT_PRIORITY)
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+def set_priority(priority: str):
+    """Set the priority of LLM calls made by the current request (and tasks it spawns)."""
+    _current_priority.set(priority if priority in PRIORITIES else DEFAULT_PRIORITY)
+
+
+@contextmanager
+def llm_priority(priority: str):
+    """Scoped priority for in-process workers (titles, summaries, jobs)."""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def current_priority() -> str:
+    return _current_priority.get()
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Take one token. Returns 0 on success, otherwise seconds until a token is available."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        if self.rate <= 0:
+            return 60
+        return (1 - self.tokens) / self.rate
+
+    def refund(self):
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+
+class ModelGate:
+    """Concurrency limit for one model; a freed slot goes straight to the highest-priority waiter."""
+
+    def __init__(self, model: str, limit: int):
+        self.model = model
+        self.limit = max(1, limit)
+        self.active = 0
+        self._waiters: List[list] = []  # heap of [priority, seq, future]
+        self._seq = itertools.count()
+        # Smoothed time a call holds its slot, used to predict queue wait
+        self.hold_seconds = 5.0
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    async def acquire(self, priority: int):
+        if self.active < self.limit and not self.queued:
+            self.active += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, [priority, next(self._seq), fut])
+        try:
+            # release() hands its slot over without decrementing `active`
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release()
+            raise
+
+    def release(self, held_seconds: float = None):
+        if held_seconds is not None:
+            self.hold_seconds = 0.8 * self.hold_seconds + 0.2 * held_seconds
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.active -= 1
+
+    def estimated_wait(self, priority: int) -> float:
+        ahead = sum(1 for p, _, fut in self._waiters if p <= priority and not fut.done())
+        free = self.limit - self.active
+        if free > ahead:
+            return 0.0
+        return (ahead - free + 1) / self.limit * self.hold_seconds
+
+
+class AdmissionController:
+    def __init__(self):
+        self._gates: Dict[str, ModelGate] = {}
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def gate(self, model: str) -> ModelGate:
+        gate = self._gates.get(model)
+        if gate is None:
+            gate = ModelGate(model, LLM_MODEL_CONCURRENCY_OVERRIDES.get(model, LLM_MODEL_CONCURRENCY))
+            self._gates[model] = gate
+        return gate
+
+    def _bucket(self, key: str) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(USER_AI_RATE_PER_MINUTE / 60, USER_AI_BURST)
+            self._buckets[key] = bucket
+            if len(self._buckets) > MAX_TRACKED_USERS:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def check(self, priority: str, key: str, models: Iterable[str] = ()):
+        """
+        Admit a new AI request for `key` (user id or client address) or raise AdmissionRejected.
+        `models` are the gates the endpoint will call; only their queues count towards the wait.
+        Called before any work is done, so rejected requests cost nothing upstream.
+        """
+        bucket = self._bucket(key)
+        retry_after = bucket.take()
+        if retry_after:
+            metrics.incr("llm_admission", priority=priority, result="rate_limited")
+            raise AdmissionRejected("Too many AI requests, please slow down", retry_after)
+
+        budget = LLM_QUEUE_BUDGETS.get(priority)
+        gates = [self._gates[model] for model in models if model in self._gates]
+        if budget is not None and gates:
+            wait = max(gate.estimated_wait(PRIORITIES[priority]) for gate in gates)
+            if wait > budget:
+                bucket.refund()
+                metrics.incr("llm_admission", priority=priority, result="overloaded")
+                raise AdmissionRejected("AI service is busy, please retry shortly", wait)
+
+        metrics.incr("llm_admission", priority=priority, result="admitted")
+
+    async def acquire(self, model: str) -> Callable[[], None]:
+        """Wait for a slot on `model` at the current priority. Returns the (idempotent) release callback."""
+        priority = current_priority()
+        gate = self.gate(model)
+        started = time.monotonic()
+        await gate.acquire(PRIORITIES[priority])
+        admitted = time.monotonic()
+        metrics.observe("llm_queue_wait_seconds", admitted - started, model=model, priority=priority)
+        self._report(gate)
+
+        released = False
+
+        def release():
+            nonlocal released
+            if released:
+                return
+            released = True
+            gate.release(time.monotonic() - admitted)
+            self._report(gate)
+
+        return release
+
+    def _report(self, gate: ModelGate):
+        metrics.set_gauge("llm_in_flight", gate.active, model=gate.model)
+        metrics.set_gauge("llm_queue_depth", gate.queued, model=gate.model)
+
+
+admission = AdmissionController()
+
+
+def request_model(request: httpx.Request) -> str:
+    """Model named in an OpenAI-style JSON body; other payloads (multipart ASR) are keyed by endpoint."""
+    if "json" in request.headers.get("content-type", ""):
+        try:
+            model = json.loads(request.content).get("model")
+            if model:
+                return model
+        except Exception:
+            pass
+    return request.url.path.rsplit("/v1/", 1)[-1]
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """Response body that gives the model slot back once fully read or closed (streamed completions hold it until then)."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self._stream:
+                yield chunk
+        finally:
+            # Also covers consumers that stop iterating without closing the response
+            self._release()
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+
+class AdmissionTransport(httpx.AsyncBaseTransport):
+    """httpx transport that puts every upstream request through the admission controller."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, controller: AdmissionController = admission):
+        self._transport = transport
+        self._controller = controller
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        release = await self._controller.acquire(request_model(request))
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            release()
+            raise
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_ReleasingStream(response.stream, release),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self):
+        await self._transport.aclose()
@@ -0,0 +1,51 @@
+import asyncio
+from typing import Awaitable, TypeVar
+
+from fastapi import Request
+
+from app.core import metrics
+
+# Request-scoped cancellation: long AI/MCP calls stop once the client has gone away,
+# instead of running to completion for nobody and holding upstream capacity.
+
+T = TypeVar("T")
+
+
+class ClientDisconnected(Exception):
+    """The client disconnected before the response was ready; nothing should be persisted for it."""
+
+
+async def _wait_for_disconnect(request: Request):
+    # The body has already been read by the endpoint, so the next ASGI message is the disconnect.
+    # (request.is_disconnected() polls with a cancelled scope, which loses the message under
+    # the HTTP middleware; waiting on receive() directly sees it as soon as it arrives.)
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def cancel_on_disconnect(request: Request, awaitable: Awaitable[T]) -> T:
+    """
+    Await `awaitable` while watching for the client's ASGI disconnect.
+    On disconnect the work is cancelled (LLM calls, MCP sessions and tool tasks unwind via
+    CancelledError) and ClientDisconnected is raised, so callers skip their trailing writes.
+    """
+    task = asyncio.ensure_future(awaitable)
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        if task.done():
+            return task.result()
+        if watcher.exception() is not None:
+            # Can't tell whether the client is still there; just finish the work
+            return await task
+        task.cancel()
+        # Let cleanup (closing MCP sessions, releasing admission slots) finish first
+        await asyncio.gather(task, return_exceptions=True)
+        metrics.incr("client_disconnects", path=request.url.path)
+        raise ClientDisconnected()
+    finally:
+        for pending in (task, watcher):
+            if not pending.done():
+                pending.cancel()
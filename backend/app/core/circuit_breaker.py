@@ -0,0 +1,251 @@
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import httpx
+
+from app.core import metrics
+
+# Circuit breakers for external upstreams (SiliconFlow, Amap REST, Amap MCP, McDonald's MCP, COS).
+# A breaker opens when the failure rate over a sliding window crosses the threshold; while open,
+# calls fail fast (or get a fallback) instead of waiting for the upstream's full timeout. After
+# `open_seconds` a few probe calls are let through (half-open); if they succeed the breaker closes.
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+CIRCUIT_FAILURE_RATE = float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5"))
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "10"))
+CIRCUIT_WINDOW_SECONDS = float(os.getenv("CIRCUIT_WINDOW_SECONDS", "30"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "15"))
+CIRCUIT_HALF_OPEN_PROBES = int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", "2"))
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is temporarily unavailable (circuit open)")
+        self.name = name
+        self.retry_after = retry_after
+
+
+try:
+    _ExceptionGroup = BaseExceptionGroup
+except NameError:  # Python < 3.11: backport installed with anyio
+    from exceptiongroup import BaseExceptionGroup as _ExceptionGroup
+
+
+def default_is_failure(error: BaseException) -> bool:
+    # Task groups (the MCP transports) wrap the real errors; any upstream failure inside counts
+    if isinstance(error, _ExceptionGroup):
+        return any(default_is_failure(e) for e in error.exceptions)
+    if isinstance(error, asyncio.CancelledError):
+        return False
+    # A 4xx (bad token, bad request) means the upstream is up and rejected this particular request
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500 or error.response.status_code == 429
+    return True
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        failure_rate: float = CIRCUIT_FAILURE_RATE,
+        min_calls: int = CIRCUIT_MIN_CALLS,
+        window_seconds: float = CIRCUIT_WINDOW_SECONDS,
+        open_seconds: float = CIRCUIT_OPEN_SECONDS,
+        half_open_probes: int = CIRCUIT_HALF_OPEN_PROBES,
+        is_failure: Callable[[Exception], bool] = default_is_failure,
+    ):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.is_failure = is_failure
+
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._outcomes: Deque[Tuple[float, bool]] = deque()  # (time, ok) in the window
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._report()
+
+    # --- State ---
+
+    def _transition(self, state: str):
+        if state == self.state:
+            return
+        print(f"Circuit '{self.name}': {self.state} -> {state}")
+        self.state = state
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+        if state in (OPEN, HALF_OPEN):
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+        if state == CLOSED:
+            self._outcomes.clear()
+        metrics.incr("circuit_breaker_transitions", upstream=self.name, state=state)
+        self._report()
+
+    def _report(self):
+        metrics.set_gauge("circuit_breaker_state", _STATE_VALUES[self.state], upstream=self.name)
+
+    def _prune(self, now: float):
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            self._outcomes.popleft()
+
+    @property
+    def retry_after(self) -> float:
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.open_seconds - (time.monotonic() - self.opened_at))
+
+    def allow(self) -> bool:
+        """Whether a call may go out now. In half-open state only a few probes are let through."""
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.open_seconds:
+                return False
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self._probes_in_flight >= self.half_open_probes:
+                return False
+            self._probes_in_flight += 1
+        return True
+
+    def record_success(self):
+        metrics.incr("circuit_breaker_calls", upstream=self.name, result="success")
+        if self.state == HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+            self._probe_successes += 1
+            if self._probe_successes >= self.half_open_probes:
+                self._transition(CLOSED)
+            return
+        now = time.monotonic()
+        self._outcomes.append((now, True))
+        self._prune(now)
+
+    def record_failure(self):
+        metrics.incr("circuit_breaker_calls", upstream=self.name, result="failure")
+        if self.state == HALF_OPEN:
+            self._transition(OPEN)
+            return
+        if self.state == OPEN:
+            return
+        now = time.monotonic()
+        self._outcomes.append((now, False))
+        self._prune(now)
+        failures = sum(1 for _, ok in self._outcomes if not ok)
+        if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+            self._transition(OPEN)
+
+    def record_abandoned(self):
+        """A call ended without a verdict (cancelled): free its probe slot."""
+        if self.state == HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def reject(self) -> CircuitOpenError:
+        metrics.incr("circuit_breaker_calls", upstream=self.name, result="rejected")
+        return CircuitOpenError(self.name, self.retry_after)
+
+    def check(self):
+        if not self.allow():
+            raise self.reject()
+
+    @asynccontextmanager
+    async def guard(self):
+        """Run the body under the breaker: raises CircuitOpenError when open, records the outcome otherwise."""
+        self.check()
+        try:
+            yield
+        except asyncio.CancelledError:
+            self.record_abandoned()
+            raise
+        except Exception as e:
+            if self.is_failure(e):
+                self.record_failure()
+            else:
+                self.record_success()
+            raise
+        self.record_success()
+
+    def snapshot(self) -> Dict[str, Any]:
+        self._prune(time.monotonic())
+        failures = sum(1 for _, ok in self._outcomes if not ok)
+        return {
+            "upstream": self.name,
+            "state": self.state,
+            "calls_in_window": len(self._outcomes),
+            "failures_in_window": failures,
+            "retry_after": round(self.retry_after, 1),
+        }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(name: str, **options) -> CircuitBreaker:
+    """Shared breaker per upstream name; `options` only apply when it is first created."""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers[name] = CircuitBreaker(name, **options)
+    return breaker
+
+
+def breaker_states() -> List[Dict[str, Any]]:
+    return [breaker.snapshot() for breaker in _breakers.values()]
+
+
+# --- httpx integration ---
+
+def _openai_unavailable(request: httpx.Request, breaker: CircuitBreaker) -> httpx.Response:
+    # OpenAI-style error the SDK raises immediately: x-should-retry stops its built-in retries
+    return httpx.Response(
+        503,
+        headers={"x-should-retry": "false", "retry-after": str(max(1, round(breaker.retry_after)))},
+        json={"error": {"message": f"{breaker.name} is temporarily unavailable", "type": "circuit_open"}},
+        request=request,
+    )
+
+
+# Fast-fail responses per upstream style; without one an open breaker raises CircuitOpenError
+OPEN_RESPONSES: Dict[str, Callable[[httpx.Request, CircuitBreaker], httpx.Response]] = {
+    "openai": _openai_unavailable,
+}
+
+
+class CircuitBreakerTransport(httpx.AsyncBaseTransport):
+    """httpx transport that records every response in a breaker and fails fast while it is open."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, breaker: CircuitBreaker, open_response: Optional[str] = None):
+        self._transport = transport
+        self._breaker = breaker
+        self._open_response = OPEN_RESPONSES.get(open_response) if open_response else None
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        breaker = self._breaker
+        if not breaker.allow():
+            error = breaker.reject()
+            if self._open_response:
+                return self._open_response(request, breaker)
+            raise error
+        try:
+            response = await self._transport.handle_async_request(request)
+        except asyncio.CancelledError:
+            breaker.record_abandoned()
+            raise
+        except Exception:
+            breaker.record_failure()
+            raise
+        if response.status_code >= 500 or response.status_code == 429:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return response
+
+    async def aclose(self):
+        await self._transport.aclose()
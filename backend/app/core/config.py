@@ -42,6 +42,8 @@ class Settings(BaseSettings):
                         "app.models.restaurants",
                         "app.models.inventory",
                         "app.models.ai_logs",
+                        "app.models.ai_cache",
+                        "app.models.ai_usage",
                         "app.models.notifications",
                         "app.models.search",
                         "app.models.chat",
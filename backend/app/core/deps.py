@@ -1,4 +1,6 @@
-from fastapi import Depends, HTTPException, status
+from typing import Optional, Tuple
+
+from fastapi import Depends, Header, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from app.core.config import settings
@@ -25,3 +27,51 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     if user is None:
         raise credentials_exception
     return user
+
+
+def _admit(priority: str, key: str, models: Tuple[str, ...], request: Request):
+    from app.core.admission import AdmissionRejected, admission, set_priority
+    from app.core.usage import feature_from_path, set_feature
+
+    try:
+        admission.check(priority, key, models)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=e.reason,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    set_priority(priority)
+    set_feature(feature_from_path(request.url.path))
+
+
+def llm_admission(priority: str, *models: str):
+    """
+    Dependency for endpoints that call the LLM: per-user rate limit, early 429 when the queue of
+    the `models` they call is too long, and the priority their upstream calls are queued with.
+    """
+    async def dependency(request: Request, current_user: User = Depends(get_current_user)):
+        _admit(priority, f"user:{current_user.id}", models, request)
+    return dependency
+
+
+def anonymous_llm_admission(priority: str, *models: str):
+    """Same as llm_admission for endpoints without login; rate-limited per client address."""
+    async def dependency(request: Request):
+        _admit(priority, f"ip:{request.client.host if request.client else 'unknown'}", models, request)
+    return dependency
+
+
+async def get_idempotency_key(key: Optional[str] = Header(None, alias="Idempotency-Key")) -> Optional[str]:
+    """Optional Idempotency-Key header of AI POST endpoints; see services/idempotency.py."""
+    from app.services.idempotency import MAX_KEY_LENGTH
+
+    if key is None:
+        return None
+    key = key.strip()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters",
+        )
+    return key
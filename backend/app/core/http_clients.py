@@ -0,0 +1,76 @@
+import os
+from typing import Any, Dict
+
+import httpx
+
+# HTTP/2 needs the optional `h2` package (pip install httpx[http2]); fall back to HTTP/1.1 keep-alive without it
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# One pooled client per upstream. Every call to the same host reuses warm TCP/TLS connections
+# instead of paying the handshake for each request.
+UPSTREAMS: Dict[str, Dict[str, Any]] = {
+    # SiliconFlow: LLM / vision / image generation / ASR; requests go through LLM admission control.
+    # While its circuit is open, calls get an immediate OpenAI-style 503. Usage (tokens, latency, cost) is recorded per call
+    "siliconflow": {
+        "timeout": float(os.getenv("AI_TIMEOUT_SECONDS", "60")),
+        "admission": True,
+        "circuit_breaker": True,
+        "open_response": "openai",
+        "usage": True,
+    },
+    # Amap REST API; an open circuit raises CircuitOpenError (maps_service serves cached results)
+    "amap": {"timeout": float(os.getenv("AMAP_TIMEOUT_SECONDS", "10")), "circuit_breaker": True},
+    # Arbitrary image downloads (COS, generated image CDN, ...)
+    "media": {"timeout": float(os.getenv("MEDIA_TIMEOUT_SECONDS", "30"))},
+}
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def _build_client(name: str) -> httpx.AsyncClient:
+    config = UPSTREAMS[name]
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20")),
+        keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", "30")),
+    )
+    transport: httpx.AsyncBaseTransport = httpx.AsyncHTTPTransport(http2=HTTP2_AVAILABLE, limits=limits)
+    if config.get("admission"):
+        from app.core.admission import AdmissionTransport
+        transport = AdmissionTransport(transport)
+    if config.get("circuit_breaker"):
+        # Outermost: a dead upstream fails fast instead of queueing for admission first
+        from app.core.circuit_breaker import CircuitBreakerTransport, get_breaker
+        transport = CircuitBreakerTransport(transport, get_breaker(name), config.get("open_response"))
+    if config.get("usage"):
+        # Around everything else: latency includes admission queueing, fast-failed calls are counted too
+        from app.core.usage import UsageTransport
+        transport = UsageTransport(transport)
+    return httpx.AsyncClient(
+        transport=transport,
+        timeout=httpx.Timeout(config["timeout"], connect=10.0),
+        follow_redirects=True,
+    )
+
+
+def get_http_client(name: str) -> httpx.AsyncClient:
+    """Return the shared pooled client for an upstream, creating it on first use."""
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = _build_client(name)
+        _clients[name] = client
+    return client
+
+
+async def close_http_clients():
+    """Close all pooled clients. Called on application shutdown."""
+    for name, client in list(_clients.items()):
+        try:
+            await client.aclose()
+        except Exception as e:
+            print(f"Failed to close http client '{name}': {e}")
+    _clients.clear()
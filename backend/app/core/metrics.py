@@ -0,0 +1,56 @@
+import time
+from collections import defaultdict
+from typing import Any, Dict, Tuple
+
+# Lightweight in-process metrics registry.
+# Counters and gauges are keyed by (name, sorted labels) and exposed through /admin/metrics.
+
+_LabelKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+_counters: Dict[_LabelKey, float] = defaultdict(float)
+_gauges: Dict[_LabelKey, float] = {}
+_timings: Dict[_LabelKey, Dict[str, float]] = {}
+
+_started_at = time.time()
+
+
+def _key(name: str, labels: Dict[str, Any]) -> _LabelKey:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def incr(name: str, value: float = 1, **labels):
+    _counters[_key(name, labels)] += value
+
+
+def set_gauge(name: str, value: float, **labels):
+    _gauges[_key(name, labels)] = value
+
+
+def observe(name: str, value: float, **labels):
+    """Record a sample (e.g. latency in ms) as count/sum/max."""
+    stats = _timings.setdefault(_key(name, labels), {"count": 0, "sum": 0.0, "max": 0.0})
+    stats["count"] += 1
+    stats["sum"] += value
+    if value > stats["max"]:
+        stats["max"] = value
+
+
+def get_counter(name: str, **labels) -> float:
+    return _counters.get(_key(name, labels), 0)
+
+
+def _format(key: _LabelKey) -> Dict[str, Any]:
+    name, labels = key
+    return {"name": name, "labels": dict(labels)}
+
+
+def snapshot() -> Dict[str, Any]:
+    return {
+        "uptime_seconds": int(time.time() - _started_at),
+        "counters": [{**_format(k), "value": v} for k, v in _counters.items()],
+        "gauges": [{**_format(k), "value": v} for k, v in _gauges.items()],
+        "timings": [
+            {**_format(k), **v, "avg": (v["sum"] / v["count"]) if v["count"] else 0}
+            for k, v in _timings.items()
+        ],
+    }
@@ -0,0 +1,286 @@
+import asyncio
+import json
+import os
+import re
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import httpx
+
+from app.core import metrics
+from app.core.admission import request_model
+
+# Usage telemetry for upstream AI calls (SiliconFlow LLM / vision / image generation / ASR).
+# Every request on the "siliconflow" client is recorded with its feature, model, outcome, latency,
+# token usage (the `usage` object of the response, also sent as the last chunk of streams) and an
+# estimated cost. Calls are aggregated in memory per minute; services/ai_usage.py writes the
+# aggregates to the minute/hour rollup tables that /admin/stats reads. Users of AI features are
+# recorded per hour the same way, for the active-user count.
+
+
+def _parse_prices(value: str) -> Dict[str, Tuple[float, float, float]]:
+    prices = {}
+    for item in value.split(","):
+        model, _, numbers = item.partition("=")
+        if not numbers:
+            continue
+        parts = [float(n) for n in numbers.split(":")] + [0.0, 0.0, 0.0]
+        prices[model.strip()] = (parts[0], parts[1], parts[2])
+    return prices
+
+
+# Estimated prices (CNY): (per 1M prompt tokens, per 1M completion tokens, per image / audio file).
+# Override with AI_MODEL_PRICES="model=prompt:completion:unit,..."; unknown models cost 0
+MODEL_PRICES: Dict[str, Tuple[float, float, float]] = {
+    "Qwen/Qwen3-8B": (0.5, 2.0, 0.0),
+    "Qwen/Qwen2.5-7B-Instruct": (0.35, 0.35, 0.0),
+    "THUDM/GLM-4.1V-9B-Thinking": (1.0, 4.0, 0.0),
+    "Kwai-Kolors/Kolors": (0.0, 0.0, 0.1),
+    **_parse_prices(os.getenv("AI_MODEL_PRICES", "")),
+}
+COST_CURRENCY_SYMBOL = os.getenv("AI_COST_CURRENCY_SYMBOL", "¥")
+
+# Only the end of a response body is kept to find its `usage` object
+_TAIL_BYTES = 16 * 1024
+_USAGE_RE = re.compile(r'"usage"\s*:\s*(\{(?:[^{}]|\{[^{}]*\})*\})')
+
+_current_feature: ContextVar[str] = ContextVar("ai_feature", default="unknown")
+
+
+def set_feature(feature: str):
+    """Attribute AI calls made by the current request (and tasks it spawns) to `feature`."""
+    _current_feature.set(feature)
+
+
+@contextmanager
+def ai_feature(feature: str):
+    token = _current_feature.set(feature)
+    try:
+        yield
+    finally:
+        _current_feature.reset(token)
+
+
+def current_feature() -> str:
+    return _current_feature.get()
+
+
+def feature_from_path(path: str) -> str:
+    """Default feature of an API request: /api/v1/ai/text-to-recipe/stream -> text-to-recipe."""
+    name = path.split("/api/v1/", 1)[-1].strip("/")
+    if name.endswith("/stream"):
+        name = name[: -len("/stream")]
+    if name.startswith("ai/"):
+        name = name[len("ai/"):]
+    return name or "unknown"
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, units: int) -> float:
+    prompt_price, completion_price, unit_price = MODEL_PRICES.get(model, (0.0, 0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000 + units * unit_price
+
+
+# (minute start epoch, feature, model, outcome)
+UsageKey = Tuple[int, str, str, str]
+
+
+class UsageRecorder:
+    """In-memory per-minute aggregates, drained periodically into the rollup tables."""
+
+    FIELDS = ("calls", "units", "prompt_tokens", "completion_tokens", "latency_ms_sum", "latency_ms_max", "cost")
+
+    def __init__(self):
+        self._pending: Dict[UsageKey, Dict[str, float]] = {}
+        self._active: Set[Tuple[int, int]] = set()  # (hour start epoch, user id)
+
+    def record(
+        self,
+        feature: str,
+        model: str,
+        outcome: str,
+        latency_seconds: float,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        units: int = 0,
+    ):
+        key = (int(time.time() // 60 * 60), feature, model, outcome)
+        row = self._pending.get(key)
+        if row is None:
+            row = self._pending[key] = dict.fromkeys(self.FIELDS, 0)
+        latency_ms = latency_seconds * 1000
+        cost = estimate_cost(model, prompt_tokens, completion_tokens, units)
+        row["calls"] += 1
+        row["units"] += units
+        row["prompt_tokens"] += prompt_tokens
+        row["completion_tokens"] += completion_tokens
+        row["latency_ms_sum"] += latency_ms
+        row["latency_ms_max"] = max(row["latency_ms_max"], latency_ms)
+        row["cost"] += cost
+
+        metrics.incr("ai_usage_calls", feature=feature, model=model, outcome=outcome)
+        metrics.incr("ai_usage_tokens", prompt_tokens + completion_tokens, feature=feature, model=model)
+        metrics.incr("ai_usage_cost", cost, feature=feature, model=model)
+        metrics.observe("ai_usage_latency_ms", latency_ms, feature=feature, model=model)
+
+    def record_active(self, user_id: int):
+        """Count `user_id` as an active user of AI features in the current hour."""
+        self._active.add((int(time.time() // 3600 * 3600), user_id))
+
+    def drain_active(self) -> Set[Tuple[int, int]]:
+        active, self._active = self._active, set()
+        return active
+
+    def restore_active(self, active: Set[Tuple[int, int]]):
+        self._active |= active
+
+    def drain(self) -> Dict[UsageKey, Dict[str, float]]:
+        pending, self._pending = self._pending, {}
+        return pending
+
+    def restore(self, pending: Dict[UsageKey, Dict[str, float]]):
+        """Put aggregates back after a failed write, merging with anything recorded since."""
+        for key, values in pending.items():
+            row = self._pending.get(key)
+            if row is None:
+                self._pending[key] = values
+                continue
+            for field in self.FIELDS:
+                if field == "latency_ms_max":
+                    row[field] = max(row[field], values[field])
+                else:
+                    row[field] += values[field]
+
+
+usage_recorder = UsageRecorder()
+
+
+def _call_kind(request: httpx.Request) -> str:
+    path = request.url.path
+    if path.endswith("/images/generations"):
+        return "image"
+    if path.endswith("/audio/transcriptions"):
+        return "asr"
+    return "chat"
+
+
+def _request_units(request: httpx.Request, kind: str) -> int:
+    if kind == "asr":
+        return 1
+    if kind == "image":
+        try:
+            return int(json.loads(request.content).get("batch_size") or 1)
+        except Exception:
+            return 1
+    return 0
+
+
+def parse_usage(tail: bytes) -> Tuple[int, int]:
+    """(prompt_tokens, completion_tokens) from the last `usage` object in a JSON body or SSE stream."""
+    matches = _USAGE_RE.findall(tail.decode("utf-8", errors="ignore"))
+    for raw in reversed(matches):
+        try:
+            usage = json.loads(raw)
+        except ValueError:
+            continue
+        if isinstance(usage, dict):
+            return int(usage.get("prompt_tokens") or 0), int(usage.get("completion_tokens") or 0)
+    return 0, 0
+
+
+class _UsageStream(httpx.AsyncByteStream):
+    """Response body that records the call once it has been fully read or closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, finish: Callable[[bytes, Optional[str]], None]):
+        self._stream = stream
+        self._finish = finish
+        self._tail = b""
+
+    async def __aiter__(self):
+        outcome = None
+        try:
+            async for chunk in self._stream:
+                self._tail = (self._tail + chunk)[-_TAIL_BYTES:]
+                yield chunk
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            self._finish(self._tail, outcome)
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._finish(self._tail, None)
+
+
+class UsageTransport(httpx.AsyncBaseTransport):
+    """httpx transport that records feature, model, latency, tokens and outcome of every upstream call."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, recorder: UsageRecorder = usage_recorder):
+        self._transport = transport
+        self._recorder = recorder
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        feature = current_feature()
+        kind = _call_kind(request)
+        model = request_model(request)
+        units = _request_units(request, kind)
+        started = time.monotonic()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except asyncio.CancelledError:
+            self._recorder.record(feature, model, "cancelled", time.monotonic() - started)
+            raise
+        except Exception:
+            self._recorder.record(feature, model, "error", time.monotonic() - started)
+            raise
+
+        status = response.status_code
+        recorded = False
+
+        def finish(tail: bytes, outcome: Optional[str]):
+            nonlocal recorded
+            if recorded:
+                return
+            recorded = True
+            ok = status < 400 and outcome is None
+            prompt_tokens, completion_tokens = parse_usage(tail) if ok else (0, 0)
+            self._recorder.record(
+                feature,
+                model,
+                outcome or ("success" if status < 400 else f"http_{status}"),
+                time.monotonic() - started,
+                prompt_tokens,
+                completion_tokens,
+                units if ok else 0,
+            )
+
+        return httpx.Response(
+            status_code=status,
+            headers=response.headers,
+            stream=_UsageStream(response.stream, finish),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+def rollup_rows(pending: Dict[UsageKey, Dict[str, float]], bucket_seconds: int) -> List[Tuple[UsageKey, Dict[str, float]]]:
+    """Re-aggregate minute aggregates into coarser buckets (e.g. 3600 for the hour table)."""
+    merged: Dict[UsageKey, Dict[str, float]] = defaultdict(lambda: dict.fromkeys(UsageRecorder.FIELDS, 0))
+    for (minute, feature, model, outcome), values in pending.items():
+        row = merged[(minute // bucket_seconds * bucket_seconds, feature, model, outcome)]
+        for field in UsageRecorder.FIELDS:
+            if field == "latency_ms_max":
+                row[field] = max(row[field], values[field])
+            else:
+                row[field] += values[field]
+    return list(merged.items())
@@ -8,6 +8,7 @@ from app.models.users import User
 from app.models.inventory import FridgeItem
 from app.models.recipes import Recipe
 from app.core.config import settings
+from app.services.agent_context import agent_context_cache
 import datetime
 import os
 
@@ -86,6 +87,7 @@ async def add_fridge_item(name: str, quantity: str = "1", category: str = "其
             expiry_date=expiry,
             icon="🥬" # 默认图标
         )
+        agent_context_cache.invalidate(user.id)
         return f"✅ 已成功将 {quantity} {name} 放入冰箱。"
     except Exception as e:
         return f"添加食材失败: {str(e)}"
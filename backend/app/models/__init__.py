@@ -2,8 +2,10 @@ from .users import User, UserProfile
 from .recipes import Recipe, Comment, Collection, Like, ViewHistory
 from .restaurants import Restaurant
 from .inventory import FridgeItem, ShoppingItem
-from .ai_logs import AILog
+from .ai_logs import AILog, AIJob, IdBlock
+from .ai_cache import AICacheEntry, VisionCacheEntry, IdempotencyRecord
+from .ai_usage import AIUsageMinute, AIUsageHour, AIActiveUserHour
 from .search import SearchHistory
 from .chat import ChatSession, ChatMessage, AgentPreset
-from .health import HealthProfile, DailyCheckIn
+from .health import HealthProfile, DailyCheckIn, CheckInRollup, CheckInStreak
 from .rbac import Role, Permission
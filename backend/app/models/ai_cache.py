@@ -0,0 +1,41 @@
+from tortoise import fields, models
+
+class AICacheEntry(models.Model):
+    id = fields.BigIntField(pk=True)
+    cache_key = fields.CharField(max_length=64, unique=True) # sha256 of feature + model + normalized params
+    feature = fields.CharField(max_length=50, index=True)
+    value = fields.JSONField()
+    expires_at = fields.DatetimeField(index=True)
+    created_at = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        table = "ai_cache_entries"
+
+class VisionCacheEntry(models.Model):
+    id = fields.BigIntField(pk=True)
+    feature = fields.CharField(max_length=50, index=True) # image-to-recipe, image-to-calorie, recognize-fridge
+    model = fields.CharField(max_length=100)
+    image_hash = fields.CharField(max_length=16) # 64-bit dHash as hex
+    value = fields.JSONField()
+    expires_at = fields.DatetimeField(index=True)
+    created_at = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        table = "vision_cache_entries"
+        # One row per image hash; also the index the per-(feature, model) loads use
+        unique_together = (("feature", "model", "image_hash"),)
+
+class IdempotencyRecord(models.Model):
+    id = fields.BigIntField(pk=True)
+    user_id = fields.IntField()
+    key = fields.CharField(max_length=255) # Client-supplied Idempotency-Key header
+    endpoint = fields.CharField(max_length=100)
+    request_hash = fields.CharField(max_length=64) # sha256 of endpoint + request body
+    status = fields.CharField(max_length=20, default="in_progress") # in_progress, completed
+    response = fields.JSONField(null=True)
+    expires_at = fields.DatetimeField(index=True) # Lock expiry while in progress, replay TTL once completed
+    created_at = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        table = "idempotency_records"
+        unique_together = (("user_id", "key"),)
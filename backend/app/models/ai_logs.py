@@ -1,12 +1,58 @@
+from typing import Optional
+
 from tortoise import fields, models
 
+from app.models.fields import CompressedJSONField
+
+# Keys of output_result copied into output_summary for history lists
+SUMMARY_KEYS = ("title", "image_url", "url")
+
+
+def summarize_output(output) -> Optional[dict]:
+    """Small projection of a result (title, images) that history lists show without loading the payload."""
+    if not isinstance(output, dict):
+        return None
+    return {key: output[key] for key in SUMMARY_KEYS if isinstance(output.get(key), str)} or None
+
+
 class AILog(models.Model):
     id = fields.BigIntField(pk=True)
     user = fields.ForeignKeyField("models.User", related_name="ai_logs")
     feature = fields.CharField(max_length=50)
     input_summary = fields.TextField(null=True)
-    output_result = fields.JSONField(null=True)
+    # Full result, compressed; stored in `output_payload` (update_db_schema.py migrates the old JSON column)
+    output_result = CompressedJSONField(source_field="output_payload", null=True)
+    output_summary = fields.JSONField(null=True) # summarize_output(output_result)
     created_at = fields.DatetimeField(auto_now_add=True)
 
     class Meta:
         table = "ai_logs"
+
+class AIJob(models.Model):
+    id = fields.BigIntField(pk=True)
+    user = fields.ForeignKeyField("models.User", related_name="ai_jobs")
+    kind = fields.CharField(max_length=50) # Handler name, see services/ai_jobs.py
+    feature = fields.CharField(max_length=50) # AILog.feature of the result
+    input_summary = fields.TextField(null=True)
+    params = fields.JSONField()
+    status = fields.CharField(max_length=20, default="queued", index=True) # queued, running, succeeded, failed
+    progress = fields.JSONField(null=True)
+    result = fields.JSONField(null=True)
+    error = fields.TextField(null=True)
+    attempts = fields.IntField(default=0)
+    max_attempts = fields.IntField(default=3)
+    log = fields.ForeignKeyField("models.AILog", related_name="jobs", null=True, on_delete=fields.SET_NULL)
+    created_at = fields.DatetimeField(auto_now_add=True)
+    started_at = fields.DatetimeField(null=True)
+    finished_at = fields.DatetimeField(null=True)
+
+    class Meta:
+        table = "ai_jobs"
+
+class IdBlock(models.Model):
+    # Hi/lo id allocation: each process reserves a block of ids and assigns them locally
+    name = fields.CharField(max_length=50, pk=True) # Table the ids are for, e.g. ai_logs
+    next_id = fields.BigIntField()
+
+    class Meta:
+        table = "id_blocks"
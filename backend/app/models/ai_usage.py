@@ -0,0 +1,50 @@
+from tortoise import fields, models
+
+# Per-bucket aggregates of upstream AI calls, written by services/ai_usage.py.
+# One row per (bucket, feature, model, outcome); the admin dashboard only ever reads these.
+
+class AIUsageMinute(models.Model):
+    id = fields.BigIntField(pk=True)
+    bucket = fields.DatetimeField(index=True) # Start of the minute (UTC)
+    feature = fields.CharField(max_length=50)
+    model = fields.CharField(max_length=100)
+    outcome = fields.CharField(max_length=20) # success, error, http_<status>, cancelled
+    calls = fields.IntField(default=0)
+    units = fields.IntField(default=0) # Images generated / audio files transcribed
+    prompt_tokens = fields.BigIntField(default=0)
+    completion_tokens = fields.BigIntField(default=0)
+    latency_ms_sum = fields.FloatField(default=0)
+    latency_ms_max = fields.FloatField(default=0)
+    cost = fields.FloatField(default=0) # Estimated, see MODEL_PRICES
+
+    class Meta:
+        table = "ai_usage_minute"
+        unique_together = (("bucket", "feature", "model", "outcome"),)
+
+class AIUsageHour(models.Model):
+    id = fields.BigIntField(pk=True)
+    bucket = fields.DatetimeField(index=True) # Start of the hour (UTC)
+    feature = fields.CharField(max_length=50)
+    model = fields.CharField(max_length=100)
+    outcome = fields.CharField(max_length=20)
+    calls = fields.IntField(default=0)
+    units = fields.IntField(default=0)
+    prompt_tokens = fields.BigIntField(default=0)
+    completion_tokens = fields.BigIntField(default=0)
+    latency_ms_sum = fields.FloatField(default=0)
+    latency_ms_max = fields.FloatField(default=0)
+    cost = fields.FloatField(default=0)
+
+    class Meta:
+        table = "ai_usage_hour"
+        unique_together = (("bucket", "feature", "model", "outcome"),)
+
+class AIActiveUserHour(models.Model):
+    # One row per user per hour with any AI feature use; the dashboard counts distinct users over a window
+    id = fields.BigIntField(pk=True)
+    bucket = fields.DatetimeField(index=True) # Start of the hour (UTC)
+    user_id = fields.IntField()
+
+    class Meta:
+        table = "ai_active_user_hour"
+        unique_together = (("bucket", "user_id"),)
@@ -1,10 +1,17 @@
 from tortoise import fields, models
 
+from app.models.fields import CompressedJSONField
+
 class ChatSession(models.Model):
     id = fields.BigIntField(pk=True)
     user = fields.ForeignKeyField("models.User", related_name="chat_sessions")
     title = fields.CharField(max_length=100, default="新对话")
+    # Set once the background title worker has named the session
+    title_generated = fields.BooleanField(default=False)
     agent_id = fields.CharField(max_length=50, default="kitchen_agent") # For different presets
+    # Rolling summary of messages up to summary_message_id (see services/chat_memory.py)
+    summary = fields.TextField(null=True)
+    summary_message_id = fields.BigIntField(null=True)
     created_at = fields.DatetimeField(auto_now_add=True)
     updated_at = fields.DatetimeField(auto_now=True)
 
@@ -16,7 +23,7 @@ class ChatMessage(models.Model):
     session = fields.ForeignKeyField("models.ChatSession", related_name="messages")
     role = fields.CharField(max_length=20) # user, assistant, system
     content = fields.TextField()
-    thoughts = fields.JSONField(null=True) # Store agent thoughts
+    thoughts = CompressedJSONField(source_field="thoughts_payload", null=True) # Agent thoughts / tool traces, compressed
     created_at = fields.DatetimeField(auto_now_add=True)
 
     class Meta:
@@ -0,0 +1,64 @@
+import gzip
+import json
+from typing import Any, Optional
+
+from tortoise import fields
+
+# zstd needs the optional `zstandard` package (pip install zstandard); gzip is used without it
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+    _zstd_compressor = zstandard.ZstdCompressor(level=3)
+    _zstd_decompressor = zstandard.ZstdDecompressor()
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# First byte of a stored payload says how the rest is encoded
+RAW, GZIP, ZSTD = b"J", b"G", b"Z"
+# Below this, compression costs more than it saves
+COMPRESS_MIN_BYTES = 256
+
+
+def encode_payload(value: Any) -> bytes:
+    raw = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if len(raw) < COMPRESS_MIN_BYTES:
+        return RAW + raw
+    if ZSTD_AVAILABLE:
+        return ZSTD + _zstd_compressor.compress(raw)
+    return GZIP + gzip.compress(raw, compresslevel=6)
+
+
+def decode_payload(data: bytes) -> Any:
+    marker, body = data[:1], data[1:]
+    if marker == RAW:
+        raw = body
+    elif marker == GZIP:
+        raw = gzip.decompress(body)
+    elif marker == ZSTD:
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError("Payload is zstd-compressed but the zstandard package is not installed")
+        raw = _zstd_decompressor.decompress(body)
+    else:
+        raise ValueError(f"Unknown payload format {marker!r}")
+    return json.loads(raw)
+
+
+class CompressedJSONField(fields.BinaryField):
+    """
+    JSON value stored as a compressed blob (format marker + zstd/gzip/raw JSON).
+    Reads and writes look like a JSONField; only the column type differs.
+    """
+
+    def to_db_value(self, value: Any, instance) -> Optional[bytes]:
+        if value is None:
+            return None
+        if isinstance(value, (bytes, bytearray)):
+            return bytes(value)
+        return encode_payload(value)
+
+    def to_python_value(self, value: Any) -> Any:
+        if isinstance(value, memoryview):
+            value = value.tobytes()
+        if isinstance(value, (bytes, bytearray)):
+            return decode_payload(bytes(value))
+        return value
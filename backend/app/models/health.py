@@ -5,9 +5,15 @@ class HealthProfile(models.Model):
     user = fields.OneToOneField("models.User", related_name="health_profile", on_delete=fields.CASCADE)
     height = fields.FloatField(description="Height in cm")
     weight = fields.FloatField(description="Weight in kg")
+    gender = fields.CharField(max_length=10, null=True) # male, female
+    age = fields.IntField(null=True)
+    activity_level = fields.CharField(max_length=20, null=True) # sedentary, light, moderate, active, very_active
+    goal = fields.CharField(max_length=20, null=True) # lose, maintain, gain
     daily_calorie_target = fields.IntField(null=True)
     dietary_advice = fields.TextField(null=True)
     exercise_advice = fields.TextField(null=True)
+    advice_key = fields.CharField(max_length=50, null=True) # (BMI bucket, goal) the advice was requested for
+    advice_status = fields.CharField(max_length=20, default="ready") # pending, ready, failed
     created_at = fields.DatetimeField(auto_now_add=True)
     updated_at = fields.DatetimeField(auto_now=True)
 
@@ -34,3 +40,33 @@ class DailyCheckIn(models.Model):
     class Meta:
         table = "daily_checkins"
         unique_together = ("user", "date")
+
+# Aggregates of DailyCheckIn maintained by services/checkin_stats.py on every check-in,
+# so weekly / monthly summaries never scan the raw rows.
+
+class CheckInRollup(models.Model):
+    id = fields.IntField(pk=True)
+    user = fields.ForeignKeyField("models.User", related_name="checkin_rollups", on_delete=fields.CASCADE)
+    period = fields.CharField(max_length=10) # week, month
+    period_start = fields.DateField() # Monday of the week / first day of the month
+    days = fields.IntField(default=0) # Days checked in
+    calories_in = fields.IntField(default=0)
+    calories_burned = fields.IntField(default=0)
+    white_days = fields.IntField(default=0)
+    orange_days = fields.IntField(default=0)
+    red_days = fields.IntField(default=0)
+
+    class Meta:
+        table = "checkin_rollups"
+        unique_together = (("user", "period", "period_start"),)
+
+class CheckInStreak(models.Model):
+    id = fields.IntField(pk=True)
+    user = fields.OneToOneField("models.User", related_name="checkin_streak", on_delete=fields.CASCADE)
+    last_date = fields.DateField(null=True) # Latest day checked in
+    current_streak = fields.IntField(default=0) # Consecutive days ending at last_date
+    longest_streak = fields.IntField(default=0)
+    total_days = fields.IntField(default=0)
+
+    class Meta:
+        table = "checkin_streaks"
@@ -1,39 +1,51 @@
+from datetime import timedelta
+
 from fastapi import APIRouter, HTTPException
+from tortoise import timezone
 from typing import List
 from app.models.rbac import Role, Permission
 from app.schemas.rbac import Role as RoleSchema, RoleCreate, RoleUpdate, Permission as PermissionSchema
 from app.models.users import User
+from app.models.recipes import Recipe
+from app.core import metrics
+from app.core.circuit_breaker import breaker_states
+from app.services.ai_usage import active_user_summary, usage_summary
 
 router = APIRouter()
 
 @router.get("/stats")
 async def get_stats():
-    # Mock data for dashboard matching the prototype
+    # AI numbers come from the usage rollup tables (see services/ai_usage.py)
+    now = timezone.now()
+    day_ago, two_days_ago = now - timedelta(days=1), now - timedelta(days=2)
+    usage = await usage_summary(hours=24)
+    # Users active in AI features: the closest thing to DAU we record
+    dau = await active_user_summary(hours=24)
+
+    recipes = await Recipe.filter(created_at__gte=day_ago).count()
+    recipes_before = await Recipe.filter(created_at__gte=two_days_ago, created_at__lt=day_ago).count()
+
+    def growth(current: int, previous: int) -> float:
+        return round((current - previous) / previous, 3) if previous else 0.0
+
     return {
-        "dau": {
-            "value": 124500,
-            "growth": 0.12,
-            "label": "124.5K"
-        },
-        "ai_calls": {
-            "value": 45231,
-            "growth": 0.085,
-            "label": "45,231",
-            "success_rate": 0.998
-        },
+        "dau": dau,
+        "ai_calls": usage["ai_calls"],
         "new_content": {
-            "value": 1893,
-            "growth": -0.021,
-            "label": "1,893",
-            "pending": 45
+            "value": recipes,
+            "growth": growth(recipes, recipes_before),
+            "label": f"{recipes:,}",
+            "pending": 0 # Recipes are published without review
         },
-        "token_cost": {
-            "value": 342.50,
-            "avg_cost": 0.007,
-            "label": "$342.50"
-        }
+        "token_cost": usage["token_cost"],
+        "by_feature": usage["by_feature"]
     }
 
+@router.get("/metrics")
+async def get_metrics():
+    # In-process counters: AI cache hit/miss, etc.
+    return {**metrics.snapshot(), "circuit_breakers": breaker_states()}
+
 # RBAC Endpoints
 
 @router.get("/roles", response_model=List[RoleSchema])
@@ -1,9 +1,20 @@
-from fastapi import APIRouter, UploadFile, File, Form, Depends, Body, HTTPException
+import asyncio
+from fastapi import APIRouter, UploadFile, File, Form, Depends, Body, HTTPException, Request, Response
 from app.services.ai_service import ai_service
 from app.models.users import User
-from app.core.deps import get_current_user
+from app.core.cancellation import cancel_on_disconnect
+from app.core.admission import ASR_GATE
+from app.core.deps import anonymous_llm_admission, get_current_user, get_idempotency_key, llm_admission
+from app.core.sse import format_sse, sse_response
+from app.services.chat_memory import chat_memory
+from app.services.agent_tools import agent_preset_cache, list_tools
+from app.services.title_worker import is_default_title, title_worker
+from app.services.ai_jobs import job_queue, job_to_dict
+from app.services.ai_log_writer import ai_log_writer
+from app.services.idempotency import IdempotencyError, idempotency_store
+from app.services.recipe_images import attach_to_source_log, generate_final_image, generate_step_images, iter_step_images
 from app.models.chat import ChatSession, ChatMessage, AgentPreset
-from app.models.ai_logs import AILog
+from app.models.ai_logs import AILog, AIJob
 from app.schemas.ai import (
     TextToRecipeRequest, 
     TextToImageRequest, 
@@ -23,10 +34,68 @@ from app.schemas.ai import (
     AgentPresetUpdate,
     AgentPresetOut
 )
-from typing import List
+from typing import Awaitable, Callable, List, Optional
 
 router = APIRouter()
 
+# Upstream models behind each endpoint, for admission control
+TEXT_MODEL = ai_service.llm_text.model_name
+VISION_MODEL = ai_service.llm_vision.model_name
+IMAGE_MODEL = ai_service.image_model
+
+# How often the job SSE stream re-reads the job row when no local events arrive
+JOB_EVENTS_POLL_SECONDS = 2.0
+
+async def _idempotent(
+    key: Optional[str],
+    current_user: User,
+    response: Response,
+    endpoint: str,
+    payload: dict,
+    producer: Callable[[], Awaitable[dict]],
+) -> dict:
+    """
+    Run `producer` (generation + its DB writes) once per Idempotency-Key.
+    Retries attach to the running call or get the stored response (marked with Idempotent-Replayed).
+    """
+    if key is None:
+        return await producer()
+    try:
+        result, replayed = await idempotency_store.run(current_user.id, key, endpoint, payload, producer)
+    except IdempotencyError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+def _stream_and_log(events, current_user: User, feature: str, input_summary: str):
+    """
+    Relay (event, data) tuples from an ai_service stream as SSE frames.
+    The AILog row is queued once the stream completes; the final `done` event carries result + log_id.
+    """
+    async def generator():
+        result = None
+        try:
+            async for event, data in events:
+                if event == "result":
+                    result = data
+                    continue
+                yield format_sse(event, data)
+        except Exception as e:
+            print(f"Stream error ({feature}): {e}")
+            yield format_sse("error", {"message": str(e)})
+            return
+
+        log_id = await ai_log_writer.create(
+            user_id=current_user.id,
+            feature=feature,
+            input_summary=input_summary,
+            output_result=result
+        )
+        yield format_sse("done", {"result": result, "log_id": log_id})
+
+    return sse_response(generator())
+
 # --- Agent Presets Endpoints ---
 
 @router.post("/presets", response_model=AgentPresetOut)
@@ -62,6 +131,7 @@ async def update_agent_preset(
         for key, value in update_data.items():
             setattr(preset, key, value)
         await preset.save()
+        agent_preset_cache.invalidate(preset_id)
         
     return preset
 
@@ -118,6 +188,7 @@ async def delete_agent_preset(
          if exists and await exists.user == None:
              raise HTTPException(status_code=403, detail="Cannot delete system preset")
          raise HTTPException(status_code=404, detail="Preset not found")
+    agent_preset_cache.invalidate(preset_id)
     return {"message": "Preset deleted"}
 
 @router.get("/agent/tools")
@@ -125,18 +196,11 @@ async def get_available_agent_tools(
     current_user: User = Depends(get_current_user)
 ):
     """Return list of available tools for agents"""
-    # This list should match the available_tools_map in ai_service.kitchen_agent_chat
-    # Ideally, we should export this from ai_service, but for now we define it here as metadata
-    return [
-        { "id": 'get_fridge_items', "name": '查看冰箱库存', "description": '获取冰箱内的食材列表' },
-        { "id": 'add_shopping_item', "name": '管理购物清单', "description": '添加物品到购物清单' },
-        { "id": 'get_shopping_list', "name": '查看购物清单', "description": '获取当前的购物清单' },
-        { "id": 'get_user_preferences', "name": '获取用户偏好', "description": '读取用户的口味和过敏源信息' },
-    ]
+    return list_tools()
 
 # --- Chat Session Endpoints ---
 
-@router.post("/audio/transcribe")
+@router.post("/audio/transcribe", dependencies=[Depends(anonymous_llm_admission("interactive", ASR_GATE))])
 async def transcribe_audio(
     file: UploadFile = File(...),
     # current_user: User = Depends(get_current_user) # Authentication optional for now, or use if needed
@@ -191,7 +255,7 @@ async def delete_chat_session(
 
 # --- Agent Chat Endpoint ---
 
-@router.post("/meal-plan")
+@router.post("/meal-plan", dependencies=[Depends(llm_admission("recipe", TEXT_MODEL))])
 async def generate_meal_plan(
     request: MealPlanRequest,
     current_user: User = Depends(get_current_user)
@@ -206,8 +270,8 @@ async def generate_meal_plan(
     )
     
     # Log to DB
-    await AILog.create(
-        user=current_user,
+    await ai_log_writer.create(
+        user_id=current_user.id,
         feature="meal-plan",
         input_summary=f"{request.duration_days} days plan for {request.headcount}",
         output_result=result
@@ -215,19 +279,26 @@ async def generate_meal_plan(
     
     return result
 
-@router.post("/agent/chat")
-async def kitchen_agent_chat(
-    request: KitchenAgentRequest,
+@router.post("/meal-plan/stream", dependencies=[Depends(llm_admission("recipe", TEXT_MODEL))])
+async def generate_meal_plan_stream(
+    request: MealPlanRequest,
     current_user: User = Depends(get_current_user)
 ):
-    # Handle session creation/retrieval
+    events = ai_service.stream_meal_plan(
+        request.dietary_restrictions,
+        request.preferences,
+        request.headcount,
+        request.duration_days,
+        request.goal,
+        request.notes
+    )
+    return _stream_and_log(events, current_user, "meal-plan", f"{request.duration_days} days plan for {request.headcount}")
+
+async def _prepare_agent_session(request: KitchenAgentRequest, current_user: User):
+    """Resolve (or create) the chat session, save the user message and load prior history + summary."""
     session = None
     if request.session_id:
         session = await ChatSession.get_or_none(id=request.session_id, user=current_user)
-        if not session:
-             # Fallback or create new? Let's fail if ID provided but not found
-             # Or auto create if not found?
-             pass 
     
     if not session:
         # Create new session if no ID or not found
@@ -240,110 +311,107 @@ async def kitchen_agent_chat(
         )
 
     # Save User Message
-    await ChatMessage.create(
+    user_message = await ChatMessage.create(
         session=session,
         role="user",
         content=request.message
     )
     
-    # Load history from DB instead of frontend request.history if session exists?
-    # For now, let's mix: use DB history for context
-    # Get last N messages
-    db_history = await ChatMessage.filter(session=session).order_by("created_at").limit(20)
-    
-    # Convert to format expected by AI Service
-    history_for_ai = [
-        {"role": msg.role, "content": msg.content} 
-        for msg in db_history 
-        # Exclude the message we just saved to avoid duplication in context if ai_service appends it
-        # Actually ai_service.kitchen_agent_chat expects previous history, and appends current message
-        # So we should exclude the very last one we just saved?
-        # ai_service code: messages = history + [current_message]
-        # So yes, exclude the one we just saved.
-        if msg.content != request.message or msg.role != "user" # Simplistic check
-    ]
-    # Better: just query all BEFORE the one we just created? 
-    # Or simply pass all previous messages.
-    
-    # Let's trust ai_service to handle the "current message" separation
-    # ai_service.kitchen_agent_chat(..., message, history)
-    # history should NOT include the current message.
-    
-    # Re-fetch history excluding the latest one
-    # history_objs = await ChatMessage.filter(session=session).order_by("created_at")
-    # history_for_ai = [{"role": m.role, "content": m.content} for m in history_objs[:-1]]
-    
-    # Actually, let's just use what we have. 
-    # If we use DB history, we ignore request.history from frontend (which is good for consistency)
-    
-    # Get previous messages (excluding the one we just added)
-    previous_msgs = await ChatMessage.filter(session=session).order_by("-created_at").offset(1).limit(10)
-    # Reverse to chronological
-    history_for_ai = [{"role": m.role, "content": m.content} for m in reversed(previous_msgs)]
-
-    response = await ai_service.kitchen_agent_chat(
-        user_id=current_user.id, 
-        message=request.message, 
-        history=history_for_ai,
-        agent_id=session.agent_id,
-        session_id=session.id
-    )
-    
-    # Save Assistant Message
-    await ChatMessage.create(
-        session=session,
-        role="assistant",
-        content=response["answer"],
-        thoughts=response.get("thoughts")
-    )
-    
-    # Refresh session from DB to get any updates (like title) made by ai_service
-    await session.refresh_from_db()
-    
-    # --- Auto-Title Generation Logic (Moved to Router) ---
-    try:
-        # Check if title is generic or default
-        # Also check if it's the first few turns (e.g. less than 5 messages) to update title
-        # Or if title matches the user's first message (which is the default behavior for new sessions)
-        is_default_title = (
-            session.title in ["新对话", "New Chat"] or 
-            session.title.startswith("新对话") or 
-            session.title.startswith("New Chat") or
-            len(session.title) < 5 or
-            session.title == request.message[:20] + "..." or
-            session.title == request.message # If title was set to user message
+    # Use DB history for context (ignores request.history from frontend, which is good for consistency).
+    # Recent messages within the token budget are verbatim; older ones come back as the rolling summary.
+    summary, history_for_ai = await chat_memory.load_session_history(session, user_message.id, ai_service.llm_text)
+    return session, history_for_ai, summary
+
+async def _finish_agent_session(session: ChatSession, message: str, answer: str):
+    """Bump updated_at (session list ordering) and queue auto-titling; the title is generated in the background."""
+    await session.save(update_fields=["updated_at"])
+    if not session.title_generated and is_default_title(session.title, message):
+        title_worker.enqueue(session.id, message, answer)
+
+@router.post("/agent/chat", dependencies=[Depends(llm_admission("interactive", TEXT_MODEL))])
+async def kitchen_agent_chat(
+    request: KitchenAgentRequest,
+    http_request: Request,
+    http_response: Response,
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Depends(get_idempotency_key)
+):
+    async def run():
+        session, history_for_ai, summary = await _prepare_agent_session(request, current_user)
+
+        turn = ai_service.kitchen_agent_chat(
+            user_id=current_user.id, 
+            message=request.message, 
+            history=history_for_ai,
+            agent_id=session.agent_id,
+            session_id=session.id,
+            prefetch_context=request.prefetch_context,
+            summary=summary
         )
+        # Abandoned chats stop their LLM turns and tool calls; no assistant message is stored.
+        # With an Idempotency-Key the turn runs to completion instead, so the client's retry can collect it.
+        response = await (turn if idempotency_key else cancel_on_disconnect(http_request, turn))
         
-        if is_default_title:
-            from langchain_core.messages import HumanMessage
-            
-            # Generate summary title
-            title_prompt = f"""请根据以下对话内容，生成一个简短的标题（不超过10个字），概括用户的意图。
-            
-            用户: {request.message}
-            AI: {response['answer'][:100]}...
-            
-            只返回标题文字，不要包含引号或其他内容。"""
-            
-            # Use ai_service's llm directly
-            title_response = await ai_service.llm_text.ainvoke([HumanMessage(content=title_prompt)])
-            new_title = title_response.content.strip().strip('"').strip("《").strip("》")
-            if len(new_title) > 20:
-                new_title = new_title[:20]
-            
-            print(f"DEBUG: Auto-updating title from '{session.title}' to '{new_title}'")
-            session.title = new_title
-            # We will save this change along with updated_at below
-    except Exception as e:
-        print(f"Failed to generate title in router: {e}")
+        # Save Assistant Message
+        await ChatMessage.create(
+            session=session,
+            role="assistant",
+            content=response["answer"],
+            thoughts=response.get("thoughts")
+        )
+        
+        await _finish_agent_session(session, request.message, response["answer"])
+        
+        return {
+            "response": response,
+            "session_id": session.id
+        }
 
-    # Update session updated_at and potentially title
-    await session.save()
-    
-    return {
-        "response": response,
-        "session_id": session.id
-    }
+    return await _idempotent(idempotency_key, current_user, http_response, "agent/chat", request.dict(), run)
+
+@router.post("/agent/chat/stream", dependencies=[Depends(llm_admission("interactive", TEXT_MODEL))])
+async def kitchen_agent_chat_stream(
+    request: KitchenAgentRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    SSE variant of /agent/chat.
+    Events: `thought` (tool start/end), `token` (answer text), `done` ({response, session_id}).
+    """
+    session, history_for_ai, summary = await _prepare_agent_session(request, current_user)
+
+    async def generator():
+        response = None
+        try:
+            async for event, data in ai_service.stream_kitchen_agent_chat(
+                user_id=current_user.id,
+                message=request.message,
+                history=history_for_ai,
+                agent_id=session.agent_id,
+                session_id=session.id,
+                prefetch_context=request.prefetch_context,
+                summary=summary
+            ):
+                if event == "result":
+                    response = data
+                    continue
+                yield format_sse(event, data)
+        except Exception as e:
+            print(f"Agent stream error: {e}")
+            yield format_sse("error", {"message": str(e)})
+            return
+
+        await ChatMessage.create(
+            session=session,
+            role="assistant",
+            content=response["answer"],
+            thoughts=response.get("thoughts")
+        )
+        yield format_sse("done", {"response": response, "session_id": session.id})
+        # Title generation happens after `done`, so it never delays the answer
+        await _finish_agent_session(session, request.message, response["answer"])
+
+    return sse_response(generator())
 
 @router.get("/history")
 async def get_history(
@@ -352,22 +420,42 @@ async def get_history(
     offset: int = 0,
     feature: str = None
 ):
+    # Summary projection: the (compressed) output payload is only loaded by /history/{log_id}
     query = AILog.filter(user=current_user)
     if feature:
         query = query.filter(feature=feature)
-    logs = await query.order_by("-created_at").offset(offset).limit(limit)
+    logs = await query.order_by("-created_at").offset(offset).limit(limit).values(
+        "id", "feature", "input_summary", "output_summary", "created_at"
+    )
     return {"history": logs}
 
-@router.post("/recognize-fridge")
+@router.get("/history/{log_id}")
+async def get_history_detail(
+    log_id: int,
+    current_user: User = Depends(get_current_user)
+):
+    log = await AILog.get_or_none(id=log_id, user=current_user)
+    if not log:
+        raise HTTPException(status_code=404, detail="History item not found")
+    return {
+        "id": log.id,
+        "feature": log.feature,
+        "input_summary": log.input_summary,
+        "output_result": log.output_result,
+        "output_summary": log.output_summary,
+        "created_at": log.created_at,
+    }
+
+@router.post("/recognize-fridge", dependencies=[Depends(llm_admission("recipe", VISION_MODEL))])
 async def recognize_fridge(
     request: RecognizeFridgeRequest,
     current_user: User = Depends(get_current_user)
 ):
-    items = await ai_service.recognize_fridge_items(request.image_url)
+    items = await ai_service.recognize_fridge_items(request.image_url, use_cache=not request.no_cache)
     
     # Log to DB
-    await AILog.create(
-        user=current_user,
+    await ai_log_writer.create(
+        user_id=current_user.id,
         feature="recognize-fridge",
         input_summary="Fridge Recognition",
         output_result={"items": items}
@@ -375,161 +463,206 @@ async def recognize_fridge(
     
     return {"items": items}
 
-@router.post("/generate-recipe-image")
+@router.post("/generate-recipe-image", dependencies=[Depends(llm_admission("background", IMAGE_MODEL))])
 async def generate_recipe_image(
     request: GenerateRecipeImageRequest,
     current_user: User = Depends(get_current_user)
 ):
-    import httpx
-    import uuid
-    from app.services.oss_service import oss_service
-    
-    # Define a helper to download and upload
-    async def process_and_upload(image_url: str, prefix: str = "ai_gen") -> str:
-        try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                resp = await client.get(image_url)
-                resp.raise_for_status()
-                image_bytes = resp.content
-                
-            filename = f"{prefix}_{uuid.uuid4().hex}.jpg"
-            if oss_service.is_configured():
-                key = f"uploads/{filename}"
-                return await oss_service.upload_bytes(image_bytes, key)
-            return image_url
-        except Exception as e:
-            return image_url
-
     recipe = request.recipe_data
+    title = recipe.get('title', '')
     
     if request.image_type == 'final':
         # Generate Final Dish Image
-        title = recipe.get('title', '')
-        description = recipe.get('description', '')
-        
-        prompt = f"Professional food photography of {title}. {description}. High resolution, 4k, delicious, restaurant quality."
-        original_url = await ai_service.generate_image(prompt)
-        final_url = await process_and_upload(original_url, "final")
-        
-        result_data = {"image_url": final_url}
+        result_data = await generate_final_image(recipe)
         
         # Log to DB
-        await AILog.create(
-            user=current_user,
+        await ai_log_writer.create(
+            user_id=current_user.id,
             feature="generate-recipe-image-final",
             input_summary=f"Final Image for {title}",
             output_result=result_data
         )
 
         # Update source log if exists
-        if request.source_log_id:
-            try:
-                source_log = await AILog.get_or_none(id=request.source_log_id, user=current_user)
-                if source_log and source_log.output_result:
-                    # Update the image_url in the original recipe result
-                    # Ensure output_result is a dict
-                    updated_result = source_log.output_result
-                    if isinstance(updated_result, str):
-                        import json
-                        updated_result = json.loads(updated_result)
-                    
-                    if isinstance(updated_result, dict):
-                        updated_result["image_url"] = final_url
-                        source_log.output_result = updated_result
-                        await source_log.save(update_fields=['output_result'])
-                    else:
-                        pass
-            except Exception as e:
-                import traceback
-                traceback.print_exc()
-
+        await attach_to_source_log(current_user.id, request.source_log_id, "image_url", result_data["image_url"])
         return result_data
         
     elif request.image_type == 'steps':
         # Generate Step Images
-        steps_images = []
-        title = recipe.get('title', '')
-        steps = recipe.get('steps', [])
-        
-        for index, step_text in enumerate(steps):
-            # To save time/cost, maybe limit to first 5 steps or similar? 
-            # For now, generate all.
-            step_prompt = f"Cooking step {index+1} for {title}: {step_text}. Close up shot, professional food photography, bright lighting."
-            try:
-                original_url = await ai_service.generate_image(step_prompt)
-                step_url = await process_and_upload(original_url, f"step_{index+1}")
-                steps_images.append({
-                    "step_index": index,
-                    "image_url": step_url,
-                    "text": step_text
-                })
-            except Exception as e:
-                # Continue even if one fails
-                continue
-                
-        result_data = {"images": steps_images}
+        result_data = await generate_step_images(recipe)
         
         # Log to DB
-        await AILog.create(
-            user=current_user,
+        await ai_log_writer.create(
+            user_id=current_user.id,
             feature="generate-recipe-image-steps",
             input_summary=f"Step Images for {title}",
             output_result=result_data
         )
 
-        # Update source log if exists
-        if request.source_log_id:
-            try:
-                source_log = await AILog.get_or_none(id=request.source_log_id, user=current_user)
-                if source_log and source_log.output_result:
-                    # Update step images in the original recipe result
-                    updated_result = source_log.output_result
-                    if isinstance(updated_result, str):
-                        import json
-                        updated_result = json.loads(updated_result)
-                        
-                    if isinstance(updated_result, dict):
-                        # Maybe store as 'step_images' field
-                        updated_result["step_images"] = steps_images
-                        source_log.output_result = updated_result
-                        await source_log.save(update_fields=['output_result'])
-                    else:
-                        pass
-            except Exception as e:
-                import traceback
-                traceback.print_exc()
-
+        # Update source log if exists (stored as 'step_images')
+        await attach_to_source_log(current_user.id, request.source_log_id, "step_images", result_data["images"])
         return result_data
     
     return {"error": "Invalid image type"}
 
-@router.post("/text-to-recipe")
+@router.post("/generate-recipe-image/stream", dependencies=[Depends(llm_admission("background", IMAGE_MODEL))])
+async def generate_recipe_image_stream(
+    request: GenerateRecipeImageRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    SSE variant for image_type='steps': a `step` (or `step_error`) event per image as it completes,
+    then `done` with all images ordered by step_index.
+    """
+    if request.image_type != "steps":
+        raise HTTPException(status_code=400, detail="Only step images can be streamed")
+    recipe = request.recipe_data
+
+    async def events():
+        steps_images = []
+        async for item in iter_step_images(recipe):
+            if "error" in item:
+                yield "step_error", item
+                continue
+            steps_images.append(item)
+            yield "step", item
+        steps_images.sort(key=lambda item: item["step_index"])
+        await attach_to_source_log(current_user.id, request.source_log_id, "step_images", steps_images)
+        yield "result", {"images": steps_images}
+
+    return _stream_and_log(events(), current_user, "generate-recipe-image-steps", f"Step Images for {recipe.get('title', '')}")
+
+# --- Background Jobs ---
+# Long-running generations: POST returns a job_id, poll GET /jobs/{id} or follow GET /jobs/{id}/events (SSE)
+
+@router.post("/jobs/meal-plan", dependencies=[Depends(llm_admission("background", TEXT_MODEL))])
+async def submit_meal_plan_job(
+    request: MealPlanRequest,
+    current_user: User = Depends(get_current_user)
+):
+    job = await job_queue.submit(
+        current_user.id,
+        "meal-plan",
+        request.dict(),
+        feature="meal-plan",
+        input_summary=f"{request.duration_days} days plan for {request.headcount}"
+    )
+    return {"job_id": job.id, "status": job.status}
+
+@router.post("/jobs/generate-recipe-image", dependencies=[Depends(llm_admission("background", IMAGE_MODEL))])
+async def submit_recipe_image_job(
+    request: GenerateRecipeImageRequest,
+    current_user: User = Depends(get_current_user)
+):
+    if request.image_type not in ("final", "steps"):
+        raise HTTPException(status_code=400, detail="Invalid image type")
+    title = request.recipe_data.get('title', '')
+    label = "Final Image" if request.image_type == "final" else "Step Images"
+    job = await job_queue.submit(
+        current_user.id,
+        "generate-recipe-image",
+        request.dict(),
+        feature=f"generate-recipe-image-{request.image_type}",
+        input_summary=f"{label} for {title}"
+    )
+    return {"job_id": job.id, "status": job.status}
+
+async def _get_user_job(job_id: int, current_user: User) -> AIJob:
+    job = await AIJob.get_or_none(id=job_id, user=current_user)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/jobs/{job_id}")
+async def get_job(
+    job_id: int,
+    current_user: User = Depends(get_current_user)
+):
+    return job_to_dict(await _get_user_job(job_id, current_user))
+
+@router.get("/jobs/{job_id}/events")
+async def get_job_events(
+    job_id: int,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    SSE progress of a job: `status` / `progress` while it runs, then `done` ({result, log_id}) or `error`.
+    Events come from the worker in this process; the row is re-read periodically in case another process runs it.
+    """
+    job = await _get_user_job(job_id, current_user)
+
+    async def generator():
+        queue = job_queue.subscribe(job_id)
+        try:
+            current = job
+            last_state = None
+            while True:
+                if current.status == "succeeded":
+                    yield format_sse("done", {"result": current.result, "log_id": current.log_id})
+                    return
+                if current.status == "failed":
+                    yield format_sse("error", {"message": current.error})
+                    return
+                # Progress has its own events; `status` only on state changes (running, retry queued)
+                state = (current.status, current.attempts)
+                if state != last_state:
+                    yield format_sse("status", {"status": current.status, "progress": current.progress, "attempts": current.attempts})
+                    last_state = state
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), timeout=JOB_EVENTS_POLL_SECONDS)
+                    if event == "progress":
+                        yield format_sse("progress", data)
+                    elif event in ("done", "error"):
+                        yield format_sse(event, data)
+                        return
+                except asyncio.TimeoutError:
+                    pass
+                current = await AIJob.get(id=job_id)
+        finally:
+            job_queue.unsubscribe(job_id, queue)
+
+    return sse_response(generator())
+
+@router.post("/text-to-recipe", dependencies=[Depends(llm_admission("recipe", TEXT_MODEL))])
 async def text_to_recipe(
+    request: TextToRecipeRequest,
+    http_response: Response,
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Depends(get_idempotency_key)
+):
+    async def run():
+        result = await ai_service.generate_recipe_from_text(request.description, request.preferences, use_cache=not request.no_cache)
+        
+        # Log to DB
+        log_id = await ai_log_writer.create(
+            user_id=current_user.id,
+            feature="text-to-recipe",
+            input_summary=request.description[:100],
+            output_result=result
+        )
+        
+        return {"result": result, "log_id": log_id}
+
+    return await _idempotent(idempotency_key, current_user, http_response, "text-to-recipe", request.dict(), run)
+
+@router.post("/text-to-recipe/stream", dependencies=[Depends(llm_admission("recipe", TEXT_MODEL))])
+async def text_to_recipe_stream(
     request: TextToRecipeRequest,
     current_user: User = Depends(get_current_user)
 ):
-    result = await ai_service.generate_recipe_from_text(request.description, request.preferences)
-    
-    # Log to DB
-    log = await AILog.create(
-        user=current_user,
-        feature="text-to-recipe",
-        input_summary=request.description[:100],
-        output_result=result
-    )
-    
-    return {"result": result, "log_id": log.id}
+    events = ai_service.stream_recipe_from_text(request.description, request.preferences, use_cache=not request.no_cache)
+    return _stream_and_log(events, current_user, "text-to-recipe", request.description[:100])
 
-@router.post("/generate-what-to-eat")
+@router.post("/generate-what-to-eat", dependencies=[Depends(llm_admission("recipe", TEXT_MODEL))])
 async def generate_what_to_eat(
     request: GenerateWhatToEatRequest,
     current_user: User = Depends(get_current_user)
 ):
-    options = await ai_service.generate_what_to_eat_options(request.categories, request.quantity)
+    options = await ai_service.generate_what_to_eat_options(request.categories, request.quantity, use_cache=not request.no_cache)
     
     # Log to DB
-    await AILog.create(
-        user=current_user,
+    await ai_log_writer.create(
+        user_id=current_user.id,
         feature="what-to-eat",
         input_summary=f"Categories: {request.categories}, Qty: {request.quantity}",
         output_result={"options": options}
@@ -537,55 +670,73 @@ async def generate_what_to_eat(
     
     return {"options": options}
 
-@router.post("/text-to-image")
+@router.post("/text-to-image", dependencies=[Depends(llm_admission("recipe", IMAGE_MODEL))])
 async def text_to_image(
     request: TextToImageRequest,
-    current_user: User = Depends(get_current_user)
+    http_response: Response,
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Depends(get_idempotency_key)
 ):
-    url = await ai_service.generate_image(request.prompt)
-    
-    # Log to DB
-    await AILog.create(
-        user=current_user,
-        feature="text-to-image",
-        input_summary=request.prompt,
-        output_result={"url": url}
-    )
-    
-    return {"url": url}
+    async def run():
+        url = await ai_service.generate_image(request.prompt, use_cache=not request.no_cache)
+        
+        # Log to DB
+        await ai_log_writer.create(
+            user_id=current_user.id,
+            feature="text-to-image",
+            input_summary=request.prompt,
+            output_result={"url": url}
+        )
+        
+        return {"url": url}
+
+    return await _idempotent(idempotency_key, current_user, http_response, "text-to-image", request.dict(), run)
 
-@router.post("/image-to-recipe")
+@router.post("/image-to-recipe", dependencies=[Depends(llm_admission("recipe", VISION_MODEL))])
 async def image_to_recipe(
     request: ImageToRecipeRequest,
+    http_request: Request,
     current_user: User = Depends(get_current_user)
 ):
     # In a real app, user uploads file, backend uploads to storage (S3), gets URL, then calls AI
     # Here we assume frontend sends URL (e.g. from previously uploaded image)
-    result = await ai_service.generate_recipe_from_image(request.image_url)
+    # If the client leaves, the vision call is cancelled and no AILog is written
+    result = await cancel_on_disconnect(
+        http_request,
+        ai_service.generate_recipe_from_image(request.image_url, use_cache=not request.no_cache),
+    )
     
     # Log to DB
-    log = await AILog.create(
-        user=current_user,
+    log_id = await ai_log_writer.create(
+        user_id=current_user.id,
         feature="image-to-recipe",
         input_summary="Image Analysis",
         output_result=result
     )
     
-    return {"result": result, "log_id": log.id}
+    return {"result": result, "log_id": log_id}
+
+@router.post("/image-to-recipe/stream", dependencies=[Depends(llm_admission("recipe", VISION_MODEL))])
+async def image_to_recipe_stream(
+    request: ImageToRecipeRequest,
+    current_user: User = Depends(get_current_user)
+):
+    events = ai_service.stream_recipe_from_image(request.image_url, use_cache=not request.no_cache)
+    return _stream_and_log(events, current_user, "image-to-recipe", "Image Analysis")
 
-@router.post("/image-to-calorie")
+@router.post("/image-to-calorie", dependencies=[Depends(llm_admission("recipe", VISION_MODEL))])
 async def image_to_calorie(
     request: ImageToCalorieRequest,
     current_user: User = Depends(get_current_user)
 ):
     try:
         print(f"DEBUG: Processing image-to-calorie request for URL: {request.image_url}")
-        result = await ai_service.estimate_calories(request.image_url)
+        result = await ai_service.estimate_calories(request.image_url, use_cache=not request.no_cache)
         print("DEBUG: AI Service result received")
         
         # Log to DB
-        await AILog.create(
-            user=current_user,
+        await ai_log_writer.create(
+            user_id=current_user.id,
             feature="image-to-calorie",
             input_summary="Calorie Estimation",
             output_result=result
@@ -599,19 +750,32 @@ async def image_to_calorie(
         from fastapi import HTTPException
         raise HTTPException(status_code=500, detail=f"Internal Error: {str(e)}")
 
-@router.post("/fridge-to-recipe")
+@router.post("/fridge-to-recipe", dependencies=[Depends(llm_admission("recipe", TEXT_MODEL))])
 async def fridge_to_recipe(
+    request: FridgeToRecipeRequest,
+    http_response: Response,
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Depends(get_idempotency_key)
+):
+    async def run():
+        result = await ai_service.fridge_to_recipe(request.items, use_cache=not request.no_cache)
+        
+        # Log to DB
+        log_id = await ai_log_writer.create(
+            user_id=current_user.id,
+            feature="fridge-to-recipe",
+            input_summary=", ".join(request.items)[:100],
+            output_result=result
+        )
+        
+        return {"result": result, "log_id": log_id}
+
+    return await _idempotent(idempotency_key, current_user, http_response, "fridge-to-recipe", request.dict(), run)
+
+@router.post("/fridge-to-recipe/stream", dependencies=[Depends(llm_admission("recipe", TEXT_MODEL))])
+async def fridge_to_recipe_stream(
     request: FridgeToRecipeRequest,
     current_user: User = Depends(get_current_user)
 ):
-    result = await ai_service.fridge_to_recipe(request.items)
-    
-    # Log to DB
-    log = await AILog.create(
-        user=current_user,
-        feature="fridge-to-recipe",
-        input_summary=", ".join(request.items)[:100],
-        output_result=result
-    )
-    
-    return {"result": result, "log_id": log.id}
+    events = ai_service.stream_fridge_to_recipe(request.items, use_cache=not request.no_cache)
+    return _stream_and_log(events, current_user, "fridge-to-recipe", ", ".join(request.items)[:100])
@@ -1,16 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import List, Optional
 from datetime import date
 
-from app.core.deps import get_current_user
+from app.core.deps import get_current_user, llm_admission
 from app.models.users import User
 from app.models.health import HealthProfile, DailyCheckIn
 from app.schemas.health import (
     HealthProfileCreate, HealthProfileResponse,
     CheckInCreate, CheckInResponse,
-    AICalorieCalculationRequest, AICalorieCalculationResponse
+    AICalorieCalculationRequest, AICalorieCalculationResponse,
+    CheckInStatsResponse, CheckInHeatmapResponse
 )
-from app.services.health_ai_service import health_ai_service
+from app.services.ai_jobs import job_queue
+from app.services.checkin_stats import checkin_heatmap, checkin_stats, record_checkin
+from app.services.health_ai_service import advice_key, bmi, bmi_bucket, calorie_target, default_goal, health_ai_service
 
 router = APIRouter()
 
@@ -28,25 +31,43 @@ async def create_or_update_health_profile(
     data: HealthProfileCreate,
     current_user: User = Depends(get_current_user)
 ):
-    # Call AI to calculate target and advice
-    ai_result = await health_ai_service.calculate_health_profile(data.height, data.weight)
-    
+    # Calorie target is computed locally; advice comes from the cache or a background job
+    bucket = bmi_bucket(bmi(data.height, data.weight))
+    goal = data.goal or default_goal(bucket)
+    key = advice_key(bucket, goal)
+
     profile = await HealthProfile.get_or_none(user=current_user)
-    if profile:
-        profile.height = data.height
-        profile.weight = data.weight
-        profile.daily_calorie_target = ai_result.get("daily_calorie_target", 2000)
-        profile.dietary_advice = ai_result.get("dietary_advice", "")
-        profile.exercise_advice = ai_result.get("exercise_advice", "")
-        await profile.save()
-    else:
-        profile = await HealthProfile.create(
-            user=current_user,
-            height=data.height,
-            weight=data.weight,
-            daily_calorie_target=ai_result.get("daily_calorie_target", 2000),
-            dietary_advice=ai_result.get("dietary_advice", ""),
-            exercise_advice=ai_result.get("exercise_advice", "")
+    if not profile:
+        profile = HealthProfile(user=current_user)
+    profile.height = data.height
+    profile.weight = data.weight
+    profile.gender = data.gender
+    profile.age = data.age
+    profile.activity_level = data.activity_level
+    profile.goal = data.goal
+    profile.daily_calorie_target = calorie_target(data.height, data.weight, data.gender, data.age, data.activity_level, goal)
+
+    needs_advice = data.no_cache or profile.advice_key != key or profile.advice_status == "failed"
+    if needs_advice:
+        profile.advice_key = key
+        cached = None if data.no_cache else await health_ai_service.cached_advice(bucket, goal)
+        if cached:
+            profile.dietary_advice = cached.get("dietary_advice", "")
+            profile.exercise_advice = cached.get("exercise_advice", "")
+            profile.advice_status = "ready"
+            needs_advice = False
+        else:
+            # The previous advice stays visible until the new one is ready
+            profile.advice_status = "pending"
+    await profile.save()
+
+    if needs_advice:
+        await job_queue.submit(
+            user_id=current_user.id,
+            kind="health-advice",
+            params={"bmi_bucket": bucket, "goal": goal, "advice_key": key, "no_cache": data.no_cache},
+            feature="health-advice",
+            input_summary=f"Health advice for {key}",
         )
     return profile
 
@@ -63,6 +84,24 @@ async def get_checkins(
         query = query.filter(date__lte=end_date)
     return await query.all()
 
+@router.get("/checkins/stats", response_model=CheckInStatsResponse)
+async def get_checkin_stats(
+    period: str = Query("week", pattern="^(week|month)$"),
+    limit: int = Query(12, ge=1, le=60),
+    current_user: User = Depends(get_current_user)
+):
+    """Weekly / monthly calories in and out, status distribution and streaks (from the rollups)."""
+    return await checkin_stats(current_user.id, period, limit)
+
+@router.get("/checkins/heatmap", response_model=CheckInHeatmapResponse)
+async def get_checkin_heatmap(
+    year: Optional[int] = Query(None, ge=2000, le=2100),
+    current_user: User = Depends(get_current_user)
+):
+    """Calendar for a whole year: one status code per day."""
+    year = year or date.today().year
+    return {"year": year, "days": await checkin_heatmap(current_user.id, year)}
+
 @router.post("/checkins", response_model=CheckInResponse)
 async def create_checkin(
     data: CheckInCreate,
@@ -85,6 +124,7 @@ async def create_checkin(
             
     # Check if checkin exists for date
     checkin = await DailyCheckIn.get_or_none(user=current_user, date=data.date)
+    is_new = checkin is None
     if checkin:
         checkin.breakfast_content = data.breakfast_content
         checkin.lunch_content = data.lunch_content
@@ -106,9 +146,10 @@ async def create_checkin(
             total_calories_burned=data.total_calories_burned or 0,
             status=status
         )
+    await record_checkin(current_user.id, data.date, is_new)
     return checkin
 
-@router.post("/calculate", response_model=AICalorieCalculationResponse)
+@router.post("/calculate", response_model=AICalorieCalculationResponse, dependencies=[Depends(llm_admission("recipe", health_ai_service.llm.model_name))])
 async def calculate_calories(
     data: AICalorieCalculationRequest,
     current_user: User = Depends(get_current_user)
@@ -117,6 +158,7 @@ async def calculate_calories(
         data.breakfast_content,
         data.lunch_content,
         data.dinner_content,
-        data.exercise_content
+        data.exercise_content,
+        use_cache=not data.no_cache
     )
     return AICalorieCalculationResponse(**result)
@@ -4,6 +4,7 @@ from app.schemas.inventory import FridgeItemCreate, FridgeItemOut, ShoppingItemC
 from app.models.inventory import FridgeItem, ShoppingItem
 from app.models.users import User
 from app.core.deps import get_current_user
+from app.services.agent_context import agent_context_cache
 
 router = APIRouter()
 
@@ -17,7 +18,9 @@ async def create_fridge_item(
     item_in: FridgeItemCreate,
     current_user: User = Depends(get_current_user)
 ):
-    return await FridgeItem.create(user=current_user, **item_in.dict())
+    item = await FridgeItem.create(user=current_user, **item_in.dict())
+    agent_context_cache.invalidate(current_user.id)
+    return item
 
 @router.put("/fridge/{item_id}", response_model=FridgeItemOut)
 async def update_fridge_item(
@@ -31,6 +34,7 @@ async def update_fridge_item(
     
     item.update_from_dict(item_in.dict())
     await item.save()
+    agent_context_cache.invalidate(current_user.id)
     return item
 
 @router.delete("/fridge/{item_id}")
@@ -41,6 +45,7 @@ async def delete_fridge_item(
     deleted_count = await FridgeItem.filter(id=item_id, user=current_user).delete()
     if not deleted_count:
         raise HTTPException(status_code=404, detail="Item not found")
+    agent_context_cache.invalidate(current_user.id)
     return {"message": "Item deleted"}
 
 # Shopping List Endpoints
@@ -53,7 +58,9 @@ async def create_shopping_item(
     item_in: ShoppingItemCreate,
     current_user: User = Depends(get_current_user)
 ):
-    return await ShoppingItem.create(user=current_user, **item_in.dict())
+    item = await ShoppingItem.create(user=current_user, **item_in.dict())
+    agent_context_cache.invalidate(current_user.id)
+    return item
 
 @router.post("/shopping-list/batch", response_model=List[ShoppingItemOut])
 async def create_shopping_items_batch(
@@ -64,6 +71,7 @@ async def create_shopping_items_batch(
     for item_in in items_in:
         item = await ShoppingItem.create(user=current_user, **item_in.dict())
         created_items.append(item)
+    agent_context_cache.invalidate(current_user.id)
     return created_items
 
 @router.put("/shopping-list/{item_id}", response_model=ShoppingItemOut)
@@ -78,6 +86,7 @@ async def update_shopping_item(
     
     item.update_from_dict(item_in.dict())
     await item.save()
+    agent_context_cache.invalidate(current_user.id)
     return item
 
 @router.delete("/shopping-list/{item_id}")
@@ -88,4 +97,5 @@ async def delete_shopping_item(
     deleted_count = await ShoppingItem.filter(id=item_id, user=current_user).delete()
     if not deleted_count:
         raise HTTPException(status_code=404, detail="Item not found")
+    agent_context_cache.invalidate(current_user.id)
     return {"message": "Item deleted"}
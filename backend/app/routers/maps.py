@@ -1,7 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from typing import List, Optional, Dict, Any
-import httpx
 from app.core.config import settings
+from app.core.cancellation import cancel_on_disconnect
+from app.core.deps import anonymous_llm_admission
+from app.services.amap_mcp_service import amap_service
+from app.services.maps_service import amap_get
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -11,12 +14,10 @@ class ChatRequest(BaseModel):
     history: List[Dict[str, str]] = []
     session_id: Optional[int] = None
 
-@router.post("/chat")
-async def chat_with_map(request: ChatRequest):
-    from app.services.amap_mcp_service import amap_service
-    return await amap_service.chat(request.message, request.history, request.session_id)
-
-AMAP_BASE_URL = "https://restapi.amap.com/v3"
+@router.post("/chat", dependencies=[Depends(anonymous_llm_admission("interactive", amap_service.llm.model_name))])
+async def chat_with_map(request: ChatRequest, http_request: Request):
+    # Closes the MCP SSE session and stops the LLM loop when the client disconnects
+    return await cancel_on_disconnect(http_request, amap_service.chat(request.message, request.history, request.session_id))
 
 @router.get("/search")
 async def search_location(
@@ -39,37 +40,35 @@ async def search_location(
     if city:
         params["city"] = city
 
-    async with httpx.AsyncClient() as client:
-        response = await client.get(f"{AMAP_BASE_URL}/place/text", params=params)
-        data = response.json()
-        
-        if data.get("status") != "1":
-            print(f"Amap Error: {data}")
-            return {"status": "0", "info": data.get("info"), "pois": []}
-        
-        pois = []
-        for poi in data.get("pois", []) or []:
-            location = poi.get("location") or ""
-            lng, lat = None, None
-            if "," in location:
-                lng_str, lat_str = location.split(",", 1)
-                try:
-                    lng = float(lng_str)
-                    lat = float(lat_str)
-                except Exception:
-                    lng, lat = None, None
-            pois.append({
-                "id": poi.get("id"),
-                "name": poi.get("name"),
-                "address": poi.get("address") or poi.get("province") or "",
-                "location": location,
-                "latitude": lat,
-                "longitude": lng,
-                "distance": poi.get("distance"),
-                "tel": poi.get("tel"),
-            })
-        return {"status": "1", "pois": pois}
-             
+    data = await amap_get("/place/text", params)
+    
+    if data.get("status") != "1":
+        print(f"Amap Error: {data}")
+        return {"status": "0", "info": data.get("info"), "pois": []}
+    
+    pois = []
+    for poi in data.get("pois", []) or []:
+        location = poi.get("location") or ""
+        lng, lat = None, None
+        if "," in location:
+            lng_str, lat_str = location.split(",", 1)
+            try:
+                lng = float(lng_str)
+                lat = float(lat_str)
+            except Exception:
+                lng, lat = None, None
+        pois.append({
+            "id": poi.get("id"),
+            "name": poi.get("name"),
+            "address": poi.get("address") or poi.get("province") or "",
+            "location": location,
+            "latitude": lat,
+            "longitude": lng,
+            "distance": poi.get("distance"),
+            "tel": poi.get("tel"),
+        })
+    return {"status": "1", "pois": pois}
+         
 @router.get("/route")
 async def route_planning(
     type: str,
@@ -112,17 +111,15 @@ async def route_planning(
         params["city"] = city or "深圳市"
         params["cityd"] = cityd or params["city"]
 
-    async with httpx.AsyncClient() as client:
-        response = await client.get(f"{AMAP_BASE_URL}{endpoint_map[type]}", params=params)
-        data = response.json()
-        
-        if data.get("status") != "1":
-             print(f"Amap Route Error: {data}")
-             return {"status": "0", "info": data.get("info"), "result": None}
-        
-        # Parse result to standardized format
-        result = parse_route_result(type, data)
-        return {"status": "1", "result": result}
+    data = await amap_get(endpoint_map[type], params)
+    
+    if data.get("status") != "1":
+         print(f"Amap Route Error: {data}")
+         return {"status": "0", "info": data.get("info"), "result": None}
+    
+    # Parse result to standardized format
+    result = parse_route_result(type, data)
+    return {"status": "1", "result": result}
 
 @router.get("/around")
 async def around_search(
@@ -150,36 +147,34 @@ async def around_search(
     if types:
         params["types"] = types
 
-    async with httpx.AsyncClient() as client:
-        response = await client.get(f"{AMAP_BASE_URL}/place/around", params=params)
-        data = response.json()
+    data = await amap_get("/place/around", params)
 
-        if data.get("status") != "1":
-            print(f"Amap Around Error: {data}")
-            return {"status": "0", "info": data.get("info"), "pois": []}
+    if data.get("status") != "1":
+        print(f"Amap Around Error: {data}")
+        return {"status": "0", "info": data.get("info"), "pois": []}
 
-        pois = []
-        for poi in data.get("pois", []) or []:
-            loc = poi.get("location") or ""
-            lng, lat = None, None
-            if "," in loc:
-                lng_str, lat_str = loc.split(",", 1)
-                try:
-                    lng = float(lng_str)
-                    lat = float(lat_str)
-                except Exception:
-                    lng, lat = None, None
-            pois.append({
-                "id": poi.get("id"),
-                "name": poi.get("name"),
-                "address": poi.get("address") or poi.get("province") or "",
-                "location": loc,
-                "latitude": lat,
-                "longitude": lng,
-                "distance": poi.get("distance"),
-                "tel": poi.get("tel"),
-            })
-        return {"status": "1", "pois": pois}
+    pois = []
+    for poi in data.get("pois", []) or []:
+        loc = poi.get("location") or ""
+        lng, lat = None, None
+        if "," in loc:
+            lng_str, lat_str = loc.split(",", 1)
+            try:
+                lng = float(lng_str)
+                lat = float(lat_str)
+            except Exception:
+                lng, lat = None, None
+        pois.append({
+            "id": poi.get("id"),
+            "name": poi.get("name"),
+            "address": poi.get("address") or poi.get("province") or "",
+            "location": loc,
+            "latitude": lat,
+            "longitude": lng,
+            "distance": poi.get("distance"),
+            "tel": poi.get("tel"),
+        })
+    return {"status": "1", "pois": pois}
 
 def parse_route_result(type: str, data: Dict[str, Any]):
     route = data.get("route", {})
@@ -299,12 +294,10 @@ async def regeocode_location(location: str):
         "roadlevel": 0
     }
         
-    async with httpx.AsyncClient() as client:
-        response = await client.get(f"{AMAP_BASE_URL}/geocode/regeo", params=params)
-        data = response.json()
-        
-        if data.get("status") != "1":
-             print(f"Amap Error: {data}")
-             return {"status": "0", "info": data.get("info"), "regeocode": {}}
-             
-        return data
+    data = await amap_get("/geocode/regeo", params)
+    
+    if data.get("status") != "1":
+         print(f"Amap Error: {data}")
+         return {"status": "0", "info": data.get("info"), "regeocode": {}}
+         
+    return data
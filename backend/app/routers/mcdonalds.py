@@ -1,6 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from app.models.users import User
-from app.core.deps import get_current_user
+from app.core.cancellation import cancel_on_disconnect
+from app.core.deps import get_current_user, llm_admission
 from app.services.mcdonalds_service import mcdonalds_service
 from app.schemas.mcdonalds import TokenRequest, ToolCallRequest, ChatRequest
 from app.services.ai_service import ai_service
@@ -8,10 +9,20 @@ from langchain_core.messages import HumanMessage, SystemMessage, ToolMessage
 from langchain_core.tools import StructuredTool
 from langchain_openai import ChatOpenAI
 from app.core.config import settings
+from app.core.http_clients import get_http_client
 import json
 
 router = APIRouter()
 
+# Shared across requests so tool-calling turns reuse the pooled SiliconFlow connections
+llm = ChatOpenAI(
+    api_key=settings.SILICONFLOW_API_KEY,
+    base_url=settings.SILICONFLOW_BASE_URL,
+    model="Qwen/Qwen2.5-7B-Instruct",
+    temperature=0.1,
+    http_async_client=get_http_client("siliconflow"),
+)
+
 @router.post("/token")
 async def save_token(
     request: TokenRequest,
@@ -53,9 +64,10 @@ async def call_tool(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/chat")
+@router.post("/chat", dependencies=[Depends(llm_admission("interactive", llm.model_name))])
 async def chat_with_mcp(
     request: ChatRequest,
+    http_request: Request,
     current_user: User = Depends(get_current_user)
 ):
     # 1. Check token
@@ -63,6 +75,10 @@ async def chat_with_mcp(
     if not token:
         raise HTTPException(status_code=400, detail="Please set your McDonald's token first.")
 
+    # LLM turns and MCP tool calls stop as soon as the client goes away
+    return await cancel_on_disconnect(http_request, _run_mcp_chat(request, current_user))
+
+async def _run_mcp_chat(request: ChatRequest, current_user: User):
     # 2. Get available tools from MCP
     try:
         mcp_tools = await mcdonalds_service.list_tools(current_user)
@@ -82,15 +98,7 @@ async def chat_with_mcp(
             }
         })
 
-    # 4. Initialize LLM
-    llm = ChatOpenAI(
-        api_key=settings.SILICONFLOW_API_KEY,
-        base_url=settings.SILICONFLOW_BASE_URL,
-        model="Qwen/Qwen2.5-7B-Instruct",
-        temperature=0.1
-    )
-    
-    # Bind tools directly using the OpenAI format
+    # 4. Bind tools directly using the OpenAI format
     # Note: bind_tools accepts a list of tool definitions
     llm_with_tools = llm.bind_tools(openai_tools)
 
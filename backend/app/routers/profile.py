@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from app.schemas.profile import ProfileUpdate, ProfileOut
 from app.models.users import User, UserProfile
 from app.core.deps import get_current_user
+from app.services.agent_context import agent_context_cache
 
 router = APIRouter()
 
@@ -26,4 +27,5 @@ async def update_profile(
     profile.health_goals = profile_in.health_goals
     profile.settings = profile_in.settings
     await profile.save()
+    agent_context_cache.invalidate(current_user.id)
     return profile
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from app.models.users import User, ShoppingItem
 from app.core.deps import get_current_user
+from app.services.agent_context import agent_context_cache
 from pydantic import BaseModel
 from typing import List, Optional
 
@@ -51,6 +52,8 @@ async def add_to_shopping_list(
                 amount=item.amount
             )
             new_items.append(new_item)
+    if new_items:
+        agent_context_cache.invalidate(current_user.id)
     
     # Return current full list
     all_items = await ShoppingItem.filter(user=current_user).order_by("-created_at").all()
@@ -75,6 +78,7 @@ async def toggle_item(
     
     item.is_checked = not item.is_checked
     await item.save()
+    agent_context_cache.invalidate(current_user.id)
     
     return ShoppingItemOut(
         id=item.id, 
@@ -92,4 +96,5 @@ async def delete_item(
     deleted_count = await ShoppingItem.filter(id=item_id, user=current_user).delete()
     if not deleted_count:
         raise HTTPException(status_code=404, detail="Item not found")
+    agent_context_cache.invalidate(current_user.id)
     return {"message": "Deleted successfully"}
@@ -5,21 +5,27 @@ from datetime import datetime
 class TextToRecipeRequest(BaseModel):
     description: str
     preferences: Optional[str] = ""
+    no_cache: bool = False # 跳过缓存，强制重新生成
 
 class TextToImageRequest(BaseModel):
     prompt: str
+    no_cache: bool = False
 
 class ImageToRecipeRequest(BaseModel):
     image_url: str
+    no_cache: bool = False
 
 class ImageToCalorieRequest(BaseModel):
     image_url: str
+    no_cache: bool = False
 
 class FridgeToRecipeRequest(BaseModel):
     items: List[str]
+    no_cache: bool = False
 
 class RecognizeFridgeRequest(BaseModel):
     image_url: str
+    no_cache: bool = False
 
 class GenerateRecipeImageRequest(BaseModel):
     recipe_data: dict
@@ -29,6 +35,7 @@ class GenerateRecipeImageRequest(BaseModel):
 class GenerateWhatToEatRequest(BaseModel):
     categories: List[str]
     quantity: int
+    no_cache: bool = False
 
 class MealPlanRequest(BaseModel):
     dietary_restrictions: Optional[str] = None # 忌口
@@ -43,6 +50,8 @@ class KitchenAgentRequest(BaseModel):
     history: List[dict] = []
     session_id: Optional[int] = None
     agent_id: Optional[str] = "kitchen_agent"
+    # None -> server default (AGENT_CONTEXT_PREFETCH)
+    prefetch_context: Optional[bool] = None
 
 class ChatSessionCreate(BaseModel):
     title: Optional[str] = "新对话"
@@ -1,15 +1,23 @@
 from pydantic import BaseModel
 from datetime import date
-from typing import Optional
+from typing import Dict, List, Literal, Optional
 
-class HealthProfileCreate(BaseModel):
+class HealthProfileBase(BaseModel):
     height: float
     weight: float
+    gender: Optional[Literal["male", "female"]] = None
+    age: Optional[int] = None
+    activity_level: Optional[Literal["sedentary", "light", "moderate", "active", "very_active"]] = None
+    goal: Optional[Literal["lose", "maintain", "gain"]] = None
 
-class HealthProfileResponse(HealthProfileCreate):
+class HealthProfileCreate(HealthProfileBase):
+    no_cache: bool = False
+
+class HealthProfileResponse(HealthProfileBase):
     daily_calorie_target: Optional[int] = None
     dietary_advice: Optional[str] = None
     exercise_advice: Optional[str] = None
+    advice_status: str = "ready"
     
     class Config:
         from_attributes = True
@@ -35,8 +43,31 @@ class AICalorieCalculationRequest(BaseModel):
     lunch_content: Optional[str] = None
     dinner_content: Optional[str] = None
     exercise_content: Optional[str] = None
+    no_cache: bool = False
 
 class AICalorieCalculationResponse(BaseModel):
     total_calories_in: int
     total_calories_burned: int
     breakdown: Optional[str] = None
+
+class CheckInPeriodStats(BaseModel):
+    period_start: date
+    days: int
+    calories_in: int
+    calories_burned: int
+    avg_calories_in: int
+    avg_calories_burned: int
+    status_counts: Dict[str, int]
+
+class CheckInStatsResponse(BaseModel):
+    period: str
+    periods: List[CheckInPeriodStats]
+    current_streak: int
+    longest_streak: int
+    total_days: int
+    last_date: Optional[date] = None
+
+class CheckInHeatmapResponse(BaseModel):
+    year: int
+    # One character per day from Jan 1: 0 = no check-in, 1 = white, 2 = orange, 3 = red
+    days: str
@@ -0,0 +1,97 @@
+import json
+import os
+import time
+from typing import Any, Dict, Optional
+
+from app.core import metrics
+
+# Tools whose results make up the prefetched kitchen context
+CONTEXT_TOOLS = ("get_fridge_items", "get_shopping_list", "get_user_preferences")
+
+# Default for requests that don't set prefetch_context explicitly
+AGENT_CONTEXT_PREFETCH = os.getenv("AGENT_CONTEXT_PREFETCH", "0") == "1"
+
+# How many fridge items / list entries to spell out in the system prompt
+MAX_CONTEXT_ITEMS = int(os.getenv("AGENT_CONTEXT_MAX_ITEMS", "30"))
+
+
+def _loads(raw: str) -> Optional[Any]:
+    try:
+        return json.loads(raw)
+    except (TypeError, ValueError):
+        # Tools return plain text when empty ("冰箱是空的。")
+        return None
+
+
+def _join(values, limit: int = MAX_CONTEXT_ITEMS) -> str:
+    values = [str(v) for v in values or [] if v]
+    if not values:
+        return "无"
+    text = "、".join(values[:limit])
+    if len(values) > limit:
+        text += f" 等{len(values)}项"
+    return text
+
+
+def build_context_summary(results: Dict[str, str]) -> str:
+    """Compact, prompt-friendly rendering of the context tool outputs."""
+    lines = []
+
+    fridge = _loads(results.get("get_fridge_items"))
+    if isinstance(fridge, list):
+        # Soonest expiry first so the model sees what to use up
+        fridge.sort(key=lambda i: str(i.get("expiry") or "9999"))
+        items = []
+        for item in fridge:
+            label = item.get("name", "")
+            details = [str(item["quantity"])] if item.get("quantity") else []
+            if item.get("expiry") and item["expiry"] != "None":
+                details.append(f"{item['expiry']}到期")
+            items.append(f"{label}({', '.join(details)})" if details else label)
+        lines.append(f"冰箱库存: {_join(items)}")
+    else:
+        lines.append("冰箱库存: 冰箱是空的")
+
+    shopping = _loads(results.get("get_shopping_list"))
+    names = [i.get("name") for i in shopping] if isinstance(shopping, list) else []
+    lines.append(f"购物清单: {_join(names)}")
+
+    prefs = _loads(results.get("get_user_preferences")) or {}
+    lines.append(f"过敏源: {_join(prefs.get('allergies'))}")
+    lines.append(f"健康目标: {_join(prefs.get('health_goals'))}")
+    lines.append(f"口味偏好: {_join(prefs.get('taste_preferences'))}")
+    lines.append(f"最近喜欢: {_join(prefs.get('recently_liked'))}")
+    lines.append(f"最近收藏: {_join(prefs.get('recently_collected'))}")
+    return "\n".join(lines)
+
+
+class AgentContextCache:
+    """
+    Per-user cache of the context tool outputs used by prefetch mode.
+    Entries are dropped explicitly when fridge / shopping list / profile change;
+    the TTL only bounds staleness for changes we don't hook (likes, collections).
+    """
+
+    def __init__(self):
+        self.ttl = int(os.getenv("AGENT_CONTEXT_TTL", "300"))
+        self._entries: Dict[int, tuple] = {}
+
+    def get(self, user_id: int) -> Optional[Dict[str, str]]:
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] < time.time():
+            self._entries.pop(user_id, None)
+            metrics.incr("agent_context_cache_requests", result="miss")
+            return None
+        metrics.incr("agent_context_cache_requests", result="hit")
+        return dict(entry[1])
+
+    def set(self, user_id: int, results: Dict[str, str]):
+        if self.ttl <= 0:
+            return
+        self._entries[user_id] = (time.time() + self.ttl, dict(results))
+
+    def invalidate(self, user_id: int):
+        self._entries.pop(user_id, None)
+
+
+agent_context_cache = AgentContextCache()
@@ -0,0 +1,163 @@
+import json
+import os
+import time
+from typing import Annotated, Any, Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.tools import InjectedToolArg, StructuredTool
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from app.core import metrics
+from app.models.chat import AgentPreset
+from app.models.inventory import FridgeItem, ShoppingItem
+from app.models.recipes import Recipe, Collection, Like
+from app.models.users import UserProfile
+from app.services.agent_context import agent_context_cache
+
+# Kitchen agent tools.
+# Each takes the acting user as an injected argument: it is left out of the schema the model sees
+# and always supplied by the server (see call_tool), so the model can't act on another user's data.
+
+
+async def get_fridge_items(user_id: Annotated[int, InjectedToolArg]) -> str:
+    """查看冰箱里现有的食材列表"""
+    items = await FridgeItem.filter(user_id=user_id).all()
+    if not items:
+        return "冰箱是空的。"
+    return json.dumps([{"name": i.name, "quantity": i.quantity, "expiry": str(i.expiry_date)} for i in items], ensure_ascii=False)
+
+
+async def add_shopping_item(item_name: str, user_id: Annotated[int, InjectedToolArg]) -> str:
+    """添加物品到购物清单"""
+    await ShoppingItem.create(user_id=user_id, name=item_name, is_bought=False)
+    agent_context_cache.invalidate(user_id)
+    return f"已将 '{item_name}' 添加到购物清单。"
+
+
+async def get_shopping_list(user_id: Annotated[int, InjectedToolArg]) -> str:
+    """查看当前的购物清单"""
+    items = await ShoppingItem.filter(user_id=user_id, is_bought=False).all()
+    if not items:
+        return "购物清单是空的。"
+    return json.dumps([{"name": i.name} for i in items], ensure_ascii=False)
+
+
+async def get_user_preferences(user_id: Annotated[int, InjectedToolArg]) -> str:
+    """获取用户的饮食偏好，包括口味、过敏源、喜欢的食谱等"""
+    profile = await UserProfile.get_or_none(user_id=user_id)
+
+    # Get liked recipes (Generic relation manual query)
+    liked_ids = await Like.filter(user_id=user_id, target_type='recipe').values_list('target_id', flat=True)
+    liked_recipes = await Recipe.filter(id__in=liked_ids).limit(5).values_list('title', flat=True)
+
+    # Get collected recipes
+    collected_ids = await Collection.filter(user_id=user_id, target_type='recipe').values_list('target_id', flat=True)
+    collected_recipes = await Recipe.filter(id__in=collected_ids).limit(5).values_list('title', flat=True)
+
+    prefs = {
+        "allergies": profile.allergies if profile else [],
+        "health_goals": profile.health_goals if profile else [],
+        "taste_preferences": profile.preferences if profile else [],
+        "recently_liked": list(liked_recipes),
+        "recently_collected": list(collected_recipes)
+    }
+    return json.dumps(prefs, ensure_ascii=False)
+
+
+class AgentTool:
+    """A registered tool: implementation, precompiled schema and UI metadata."""
+
+    def __init__(self, func, label: str, summary: str, progress: str, read_only: bool):
+        self.func = func
+        self.name = func.__name__
+        self.label = label
+        self.summary = summary
+        # Progress text shown while the tool runs; may reference {item_name}
+        self.progress = progress
+        # No side effects: safe to run concurrently and memoize within a request
+        self.read_only = read_only
+        # Built once at import; bind_tools takes the OpenAI dict as-is
+        self.schema = convert_to_openai_tool(StructuredTool.from_function(coroutine=func))
+
+
+TOOL_REGISTRY: Dict[str, AgentTool] = {
+    tool.name: tool
+    for tool in (
+        AgentTool(get_fridge_items, "查看冰箱库存", "获取冰箱内的食材列表", "正在查看冰箱库存...", read_only=True),
+        AgentTool(add_shopping_item, "管理购物清单", "添加物品到购物清单", "正在将 {item_name} 加入清单...", read_only=False),
+        AgentTool(get_shopping_list, "查看购物清单", "获取当前的购物清单", "正在查看购物清单...", read_only=True),
+        AgentTool(get_user_preferences, "获取用户偏好", "读取用户的口味和过敏源信息", "正在获取您的饮食偏好...", read_only=True),
+    )
+}
+
+# Tool set of the built-in kitchen_agent, in registry order
+DEFAULT_AGENT_TOOLS: Tuple[str, ...] = tuple(TOOL_REGISTRY)
+
+
+def list_tools() -> List[Dict[str, str]]:
+    """Metadata for /ai/agent/tools."""
+    return [{"id": t.name, "name": t.label, "description": t.summary} for t in TOOL_REGISTRY.values()]
+
+
+def describe_tool_call(fn_name: str, args: Dict[str, Any]) -> str:
+    tool = TOOL_REGISTRY.get(fn_name)
+    if not tool:
+        return f"正在调用 {fn_name}..."
+    return tool.progress.format(item_name=(args or {}).get("item_name", "物品"))
+
+
+def is_read_only(fn_name: str) -> bool:
+    tool = TOOL_REGISTRY.get(fn_name)
+    return bool(tool and tool.read_only)
+
+
+async def call_tool(fn_name: str, user_id: int, args: Dict[str, Any]) -> str:
+    # user_id always comes from the request, never from model-supplied args
+    return await TOOL_REGISTRY[fn_name].func(**{**(args or {}), "user_id": user_id})
+
+
+def resolve_tool_names(names: Optional[Iterable[str]]) -> Tuple[str, ...]:
+    """Known tool names from a preset's allowed_tools, de-duplicated, in the preset's order."""
+    return tuple(dict.fromkeys(n for n in names or [] if n in TOOL_REGISTRY))
+
+
+# Bound LLMs per (model, tool set): bind_tools runs once per allowed_tools combination
+_bound_llms: Dict[Tuple[str, Tuple[str, ...]], Any] = {}
+
+
+def bind_agent_tools(llm, tool_names: Tuple[str, ...]):
+    if not tool_names:
+        return llm
+    key = (llm.model_name, tool_names)
+    bound = _bound_llms.get(key)
+    if bound is None:
+        bound = llm.bind_tools([TOOL_REGISTRY[name].schema for name in tool_names])
+        _bound_llms[key] = bound
+    return bound
+
+
+class AgentPresetCache:
+    """
+    In-process cache of AgentPreset rows by id.
+    Update/delete endpoints call invalidate(); the TTL covers edits made by other workers.
+    """
+
+    def __init__(self):
+        self.ttl = int(os.getenv("AGENT_PRESET_CACHE_TTL", "300"))
+        self._entries: Dict[int, Tuple[float, AgentPreset]] = {}
+
+    async def get(self, preset_id: int) -> Optional[AgentPreset]:
+        entry = self._entries.get(preset_id)
+        if entry is not None and entry[0] > time.time():
+            metrics.incr("agent_preset_cache_requests", result="hit")
+            return entry[1]
+        metrics.incr("agent_preset_cache_requests", result="miss")
+        preset = await AgentPreset.get_or_none(id=preset_id)
+        if preset is not None and self.ttl > 0:
+            self._entries[preset_id] = (time.time() + self.ttl, preset)
+        return preset
+
+    def invalidate(self, preset_id: int):
+        self._entries.pop(preset_id, None)
+
+
+agent_preset_cache = AgentPresetCache()
@@ -0,0 +1,199 @@
+import copy
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from tortoise import timezone
+
+from app.core import metrics
+from app.models.ai_cache import AICacheEntry
+from app.services.model_router import served
+from app.services.single_flight import single_flight
+
+# Default TTL (seconds) per cached feature.
+# Override with AI_CACHE_TTL_<FEATURE>, e.g. AI_CACHE_TTL_TEXT_TO_RECIPE=3600. A TTL of 0 disables caching.
+DEFAULT_TTLS: Dict[str, int] = {
+    "text-to-recipe": 7 * 24 * 3600,
+    "fridge-to-recipe": 24 * 3600,
+    "what-to-eat": 10 * 60,
+    # SiliconFlow image links expire after an hour
+    "text-to-image": 50 * 60,
+    "health-advice": 30 * 24 * 3600,
+    # LLM estimates for foods / activities missing from the local nutrition tables
+    "food-estimate": 30 * 24 * 3600,
+}
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """Collapse whitespace and case so trivially different prompts share a cache entry."""
+    if not text:
+        return ""
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def normalize_list(items) -> list:
+    """Order-insensitive, de-duplicated list of normalized strings (e.g. fridge items)."""
+    return sorted({normalize_text(i) for i in items or [] if normalize_text(i)})
+
+
+# Tortoise treats a str assigned to a JSONField as JSON text, so plain-string results
+# (image URLs, calorie estimates) are boxed before they are stored
+_STR_BOX = "__str__"
+
+
+def to_json_field(value: Any) -> Any:
+    return {_STR_BOX: value} if isinstance(value, str) else value
+
+
+def from_json_field(value: Any) -> Any:
+    if isinstance(value, dict) and len(value) == 1 and _STR_BOX in value:
+        return value[_STR_BOX]
+    return value
+
+
+class AICache:
+    """
+    Two-tier response cache for deterministic AI generations.
+    Tier 1: in-process LRU with per-entry expiry.
+    Tier 2: `ai_cache_entries` table, shared across workers and restarts.
+    """
+
+    def __init__(self, max_entries: int = None):
+        self.max_entries = max_entries or int(os.getenv("AI_CACHE_MAX_ENTRIES", "2000"))
+        self.enabled = os.getenv("AI_CACHE_ENABLED", "1") != "0"
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def ttl_for(self, feature: str) -> int:
+        env_name = "AI_CACHE_TTL_" + feature.upper().replace("-", "_")
+        return int(os.getenv(env_name, DEFAULT_TTLS.get(feature, 3600)))
+
+    def make_key(self, feature: str, model: str, params: Dict[str, Any]) -> str:
+        raw = json.dumps({"feature": feature, "model": model, "params": params}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # --- Memory tier ---
+
+    def _memory_get(self, key: str) -> Optional[Any]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.time():
+            self._memory.pop(key, None)
+            return None
+        self._memory.move_to_end(key)
+        return value
+
+    def _memory_set(self, key: str, value: Any, ttl: int):
+        self._memory[key] = (time.time() + ttl, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+        metrics.set_gauge("ai_cache_memory_entries", len(self._memory))
+
+    # --- DB tier ---
+
+    async def _db_get(self, key: str) -> Optional[tuple]:
+        try:
+            entry = await AICacheEntry.filter(cache_key=key, expires_at__gt=timezone.now()).first()
+        except Exception as e:
+            print(f"AI cache read error: {e}")
+            return None
+        if not entry:
+            return None
+        remaining = (entry.expires_at - timezone.now()).total_seconds()
+        return from_json_field(entry.value), max(int(remaining), 1)
+
+    async def _db_set(self, key: str, feature: str, value: Any, ttl: int):
+        try:
+            await AICacheEntry.update_or_create(
+                cache_key=key,
+                defaults={
+                    "feature": feature,
+                    "value": to_json_field(value),
+                    "expires_at": timezone.now() + timedelta(seconds=ttl),
+                },
+            )
+        except Exception as e:
+            print(f"AI cache write error: {e}")
+
+    # --- Public API ---
+
+    async def get(self, feature: str, key: str) -> Optional[Any]:
+        value = self._memory_get(key)
+        if value is not None:
+            metrics.incr("ai_cache_requests", feature=feature, result="hit_memory")
+            return copy.deepcopy(value)
+
+        found = await self._db_get(key)
+        if found is not None:
+            value, remaining = found
+            self._memory_set(key, value, remaining)
+            metrics.incr("ai_cache_requests", feature=feature, result="hit_db")
+            return copy.deepcopy(value)
+
+        metrics.incr("ai_cache_requests", feature=feature, result="miss")
+        return None
+
+    async def set(self, feature: str, key: str, value: Any):
+        ttl = self.ttl_for(feature)
+        if ttl <= 0:
+            return
+        self._memory_set(key, copy.deepcopy(value), ttl)
+        await self._db_set(key, feature, value, ttl)
+
+    async def get_or_generate(
+        self,
+        feature: str,
+        model: str,
+        params: Dict[str, Any],
+        producer: Callable[[], Awaitable[Any]],
+        use_cache: bool = True,
+        cacheable: Callable[[Any], bool] = None,
+    ) -> Any:
+        """
+        Return a cached result for (feature, model, params) or call `producer` and store its result.
+        `use_cache=False` bypasses the lookup but still refreshes the entry.
+        `cacheable` can reject results that should not be stored (fallbacks, empty answers).
+        Answers from a fallback model are never stored, since the key names the primary model.
+        Concurrent identical calls are coalesced into one `producer` call, even with the cache disabled.
+        """
+        key = self.make_key(feature, model, params)
+        if not self.enabled or self.ttl_for(feature) <= 0:
+            return await single_flight.do(key, producer, feature=feature)
+
+        if use_cache:
+            cached = await self.get(feature, key)
+            if cached is not None:
+                return cached
+        else:
+            metrics.incr("ai_cache_requests", feature=feature, result="bypass")
+
+        async def produce_and_store():
+            with served() as route:
+                result = await producer()
+            if route.fallback:
+                metrics.incr("ai_cache_requests", feature=feature, result="skip_fallback")
+                return result
+            if result and (cacheable is None or cacheable(result)):
+                await self.set(feature, key, result)
+            return result
+
+        # Identical misses arriving together share one upstream call; a forced refresh
+        # only coalesces with other refreshes, never with a plain lookup that started earlier
+        flight_key = key if use_cache else f"{key}:refresh"
+        return await single_flight.do(flight_key, produce_and_store, feature=feature)
+
+    async def purge_expired(self) -> int:
+        now = time.time()
+        for key in [k for k, (exp, _) in self._memory.items() if exp < now]:
+            self._memory.pop(key, None)
+        return await AICacheEntry.filter(expires_at__lte=timezone.now()).delete()
+
+
+ai_cache = AICache()
@@ -0,0 +1,265 @@
+import asyncio
+import os
+import random
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from tortoise import timezone
+
+from app.core import metrics
+from app.core.admission import llm_priority
+from app.core.usage import ai_feature
+from app.models.ai_logs import AIJob
+from app.services.ai_log_writer import ai_log_writer
+
+# Background jobs for long-running AI generations (meal plans, step images, health advice).
+# Jobs are rows in `ai_jobs`; an in-process worker pool claims and runs them, so a request only
+# has to create the row and return its id. Progress is pushed to SSE subscribers and stored on the row.
+
+AI_JOB_CONCURRENCY = int(os.getenv("AI_JOB_CONCURRENCY", "2"))
+AI_JOB_MAX_ATTEMPTS = int(os.getenv("AI_JOB_MAX_ATTEMPTS", "3"))
+AI_JOB_RETRY_BASE_SECONDS = float(os.getenv("AI_JOB_RETRY_BASE_SECONDS", "2"))
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+# handler(job, report_progress) -> result stored on the job and in AILog.output_result
+JobHandler = Callable[[AIJob, Callable[[Dict[str, Any]], Awaitable[None]]], Awaitable[Any]]
+
+_handlers: Dict[str, JobHandler] = {}
+
+
+def register_job_handler(kind: str):
+    def decorator(func: JobHandler) -> JobHandler:
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+def job_to_dict(job: AIJob) -> Dict[str, Any]:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "progress": job.progress,
+        "result": job.result,
+        "error": job.error,
+        "attempts": job.attempts,
+        "log_id": job.log_id,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+class JobQueue:
+    """
+    Worker pool over `ai_jobs`.
+    Failed attempts are retried with exponential backoff (plus jitter) up to max_attempts.
+    On startup, jobs left queued/running by a previous process are picked up again.
+    """
+
+    def __init__(self, concurrency: int = None):
+        self.concurrency = concurrency or AI_JOB_CONCURRENCY
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._retry_timers: Set[asyncio.Task] = set()
+        # job id -> subscriber queues (SSE connections in this process)
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = {}
+
+    async def start(self):
+        if self._workers:
+            return
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._run()) for _ in range(self.concurrency)]
+        try:
+            # Crash recovery: anything not finished is runnable again
+            await AIJob.filter(status="running").update(status="queued")
+            for job_id in await AIJob.filter(status="queued").order_by("id").values_list("id", flat=True):
+                self._queue.put_nowait(job_id)
+        except Exception as e:
+            print(f"Failed to recover AI jobs: {e}")
+
+    async def stop(self):
+        for task in list(self._retry_timers) + self._workers:
+            task.cancel()
+        await asyncio.gather(*self._retry_timers, *self._workers, return_exceptions=True)
+        self._retry_timers.clear()
+        self._workers = []
+        self._queue = None
+
+    async def submit(self, user_id: int, kind: str, params: Dict[str, Any], feature: str, input_summary: str = None) -> AIJob:
+        if kind not in _handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job = await AIJob.create(
+            user_id=user_id,
+            kind=kind,
+            feature=feature,
+            input_summary=input_summary,
+            params=params,
+            max_attempts=AI_JOB_MAX_ATTEMPTS,
+        )
+        await self.start()
+        self._queue.put_nowait(job.id)
+        metrics.incr("ai_jobs", kind=kind, result="submitted")
+        metrics.set_gauge("ai_job_queue_depth", self._queue.qsize())
+        return job
+
+    # --- Progress pub/sub ---
+
+    def subscribe(self, job_id: int) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, job_id: int, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(job_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                self._subscribers.pop(job_id, None)
+
+    def _publish(self, job_id: int, event: str, data: Any):
+        for queue in self._subscribers.get(job_id, ()):
+            queue.put_nowait((event, data))
+
+    # --- Execution ---
+
+    async def _run(self):
+        with llm_priority("background"):
+            while True:
+                job_id = await self._queue.get()
+                try:
+                    await self._execute(job_id)
+                except Exception as e:
+                    # Could not even record the failure; at least let waiting clients go
+                    print(f"AI job {job_id} crashed: {e}")
+                    self._publish(job_id, "error", {"message": str(e) or e.__class__.__name__})
+                finally:
+                    self._queue.task_done()
+
+    async def _execute(self, job_id: int):
+        # Claim the row; another process (or a stale duplicate in the queue) may have taken it
+        claimed = await AIJob.filter(id=job_id, status="queued").update(status="running", started_at=timezone.now())
+        if not claimed:
+            return
+        job = await AIJob.get(id=job_id)
+        job.attempts += 1
+        await job.save(update_fields=["attempts"])
+        self._publish(job_id, "status", {"status": "running", "attempts": job.attempts})
+
+        async def report_progress(progress: Dict[str, Any]):
+            await AIJob.filter(id=job_id).update(progress=progress)
+            self._publish(job_id, "progress", progress)
+
+        started = asyncio.get_running_loop().time()
+        try:
+            with ai_feature(job.feature):
+                result = await _handlers[job.kind](job, report_progress)
+            log_id = await ai_log_writer.create(
+                user_id=job.user_id,
+                feature=job.feature,
+                input_summary=job.input_summary,
+                output_result=result,
+            )
+            # ai_jobs.log_id is a foreign key, so the log row has to exist first
+            await ai_log_writer.flush()
+            await AIJob.filter(id=job_id).update(
+                status="succeeded", result=result, log_id=log_id, error=None, finished_at=timezone.now()
+            )
+        except Exception as e:
+            await self._handle_failure(job, e)
+            return
+
+        metrics.incr("ai_jobs", kind=job.kind, result="succeeded")
+        metrics.observe("ai_job_duration_seconds", asyncio.get_running_loop().time() - started, kind=job.kind)
+        self._publish(job_id, "done", {"result": result, "log_id": log_id})
+
+    async def _handle_failure(self, job: AIJob, error: Exception):
+        message = str(error) or error.__class__.__name__
+        print(f"AI job {job.id} ({job.kind}) attempt {job.attempts} failed: {message}")
+        if job.attempts < job.max_attempts:
+            delay = AI_JOB_RETRY_BASE_SECONDS * (2 ** (job.attempts - 1)) * random.uniform(0.8, 1.2)
+            await AIJob.filter(id=job.id).update(status="queued", error=message)
+            metrics.incr("ai_jobs", kind=job.kind, result="retried")
+            self._publish(job.id, "status", {"status": "queued", "attempts": job.attempts, "retry_in": round(delay, 1)})
+            timer = asyncio.create_task(self._requeue_later(job.id, delay))
+            self._retry_timers.add(timer)
+            timer.add_done_callback(self._retry_timers.discard)
+            return
+
+        await AIJob.filter(id=job.id).update(status="failed", error=message, finished_at=timezone.now())
+        metrics.incr("ai_jobs", kind=job.kind, result="failed")
+        self._publish(job.id, "error", {"message": message})
+
+    async def _requeue_later(self, job_id: int, delay: float):
+        await asyncio.sleep(delay)
+        if self._queue is not None:
+            self._queue.put_nowait(job_id)
+
+
+job_queue = JobQueue()
+
+
+# --- Handlers ---
+
+@register_job_handler("meal-plan")
+async def run_meal_plan_job(job: AIJob, report_progress) -> Dict[str, Any]:
+    from app.services.ai_service import ai_service
+
+    p = job.params
+    await report_progress({"stage": "generating"})
+    result = await ai_service.generate_meal_plan(
+        p.get("dietary_restrictions"),
+        p.get("preferences"),
+        p.get("headcount", 1),
+        p.get("duration_days", 7),
+        p.get("goal"),
+        p.get("notes"),
+    )
+    if not result.get("daily_plans"):
+        # Unparseable model output: worth another attempt
+        raise ValueError(result.get("overview") or "Empty meal plan")
+    return result
+
+
+@register_job_handler("generate-recipe-image")
+async def run_recipe_image_job(job: AIJob, report_progress) -> Dict[str, Any]:
+    from app.services.recipe_images import attach_to_source_log, generate_final_image, generate_step_images
+
+    p = job.params
+    recipe = p.get("recipe_data") or {}
+    if p.get("image_type") == "steps":
+        result = await generate_step_images(recipe, on_progress=report_progress)
+        if recipe.get("steps") and not result["images"]:
+            # Every step failed: let the job retry instead of succeeding with no images
+            raise RuntimeError("No step images could be generated")
+        await attach_to_source_log(job.user_id, p.get("source_log_id"), "step_images", result["images"])
+    else:
+        result = await generate_final_image(recipe)
+        await attach_to_source_log(job.user_id, p.get("source_log_id"), "image_url", result["image_url"])
+    return result
+
+
+@register_job_handler("health-advice")
+async def run_health_advice_job(job: AIJob, report_progress) -> Dict[str, Any]:
+    from app.models.health import HealthProfile
+    from app.services.health_ai_service import DEFAULT_DIETARY_ADVICE, DEFAULT_EXERCISE_ADVICE, health_ai_service
+
+    p = job.params
+    # Only the profile still asking for this (BMI bucket, goal) is updated; a newer save wins
+    profile = HealthProfile.filter(user_id=job.user_id, advice_key=p["advice_key"])
+    try:
+        advice = await health_ai_service.generate_advice(p["bmi_bucket"], p["goal"], use_cache=not p.get("no_cache"))
+        if not advice:
+            raise ValueError("Empty health advice")
+        await profile.update(
+            dietary_advice=advice["dietary_advice"], exercise_advice=advice["exercise_advice"], advice_status="ready"
+        )
+    except Exception:
+        if job.attempts >= job.max_attempts:
+            # Out of attempts (empty answer, upstream or DB error): show generic advice and
+            # leave the profile "failed", so the next save asks again instead of staying pending
+            await profile.update(
+                dietary_advice=DEFAULT_DIETARY_ADVICE, exercise_advice=DEFAULT_EXERCISE_ADVICE, advice_status="failed"
+            )
+        raise
+    return advice
@@ -0,0 +1,275 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set
+
+from tortoise import timezone
+from tortoise.exceptions import IntegrityError
+from tortoise.transactions import in_transaction
+
+from app.core import metrics
+from app.core.usage import usage_recorder
+from app.models.ai_logs import AILog, IdBlock, summarize_output
+
+# Write-behind pipeline for AILog rows.
+# Endpoints hand their log to an in-memory buffer and respond right away; a background task
+# bulk-inserts the buffer every AI_LOG_FLUSH_SECONDS (or as soon as a batch is full) and on
+# shutdown. Ids are reserved up front in blocks (id_blocks table), so `log_id` can still be
+# returned to the client before the row exists. All AILog inserts must go through this writer,
+# otherwise auto-increment ids could collide with reserved ones.
+
+AI_LOG_BATCH_SIZE = int(os.getenv("AI_LOG_BATCH_SIZE", "100"))
+AI_LOG_FLUSH_SECONDS = float(os.getenv("AI_LOG_FLUSH_SECONDS", "0.5"))
+# Logs + pending updates held in memory; when full, writers wait for the next flush (backpressure)
+AI_LOG_QUEUE_SIZE = int(os.getenv("AI_LOG_QUEUE_SIZE", "2000"))
+AI_LOG_ID_BLOCK_SIZE = int(os.getenv("AI_LOG_ID_BLOCK_SIZE", "1000"))
+# Failed writes of a row (or of an update) before it is dropped
+AI_LOG_MAX_ATTEMPTS = 3
+# How long an update waits for its log to be inserted by another worker
+AI_LOG_PATCH_WAIT_SECONDS = float(os.getenv("AI_LOG_PATCH_WAIT_SECONDS", "60"))
+
+_ID_BLOCK_NAME = "ai_logs"
+
+
+class AILogWriter:
+    def __init__(self):
+        self._rows: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()  # log_id -> row waiting for insert
+        self._patches: Dict[int, Dict[str, Any]] = {}  # log_id -> {"user_id", "fields", "attempts", "queued_at"}
+        self._inserting: Set[int] = set()  # ids of the batch being written right now
+        self._slots = asyncio.Semaphore(AI_LOG_QUEUE_SIZE)
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._id_lock = asyncio.Lock()
+        self._next_id = 0
+        self._block_end = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    # --- Public API ---
+
+    async def create(self, user_id: int, feature: str, input_summary: Optional[str], output_result: Any) -> int:
+        """Queue an AILog row and return its id."""
+        await self._acquire_slot()
+        log_id = await self._allocate_id()
+        self._rows[log_id] = {
+            "user_id": user_id,
+            "feature": feature,
+            "input_summary": input_summary,
+            "output_result": output_result,
+            "created_at": timezone.now(),
+            "attempts": 0,
+        }
+        usage_recorder.record_active(user_id)
+        self._queued()
+        return log_id
+
+    async def attach(self, user_id: int, log_id: int, key: str, value: Any):
+        """Set `key` in the output_result of a log (e.g. image_url, step_images); updates to one log are merged."""
+        row = self._rows.get(log_id)
+        if row is not None and log_id not in self._inserting:
+            # Not inserted yet: fold the update into the pending row
+            if row["user_id"] == user_id and isinstance(row["output_result"], dict):
+                row["output_result"][key] = value
+            return
+        patch = self._patches.get(log_id)
+        if patch is None:
+            await self._acquire_slot()
+            patch = self._patches[log_id] = {"user_id": user_id, "fields": {}, "attempts": 0, "queued_at": time.monotonic()}
+        if patch["user_id"] == user_id:
+            patch["fields"][key] = value
+        self._queued()
+
+    async def flush(self):
+        """Write everything queued so far (used on shutdown and before rows are referenced by foreign keys)."""
+        while self._rows or self._patches:
+            if not await self._flush_once():
+                break
+
+    # --- Internals ---
+
+    async def _acquire_slot(self):
+        if self._slots.locked():
+            metrics.incr("ai_log_writer", result="backpressure")
+            self._wakeup.set()
+        await self._slots.acquire()
+
+    def _queued(self):
+        self.start()
+        metrics.set_gauge("ai_log_writer_queue_depth", len(self._rows) + len(self._patches))
+        if len(self._rows) + len(self._patches) >= AI_LOG_BATCH_SIZE:
+            self._wakeup.set()
+
+    async def _allocate_id(self) -> int:
+        async with self._id_lock:
+            if self._next_id >= self._block_end:
+                self._next_id, self._block_end = await self._reserve_block()
+            log_id = self._next_id
+            self._next_id += 1
+            return log_id
+
+    async def _reserve_block(self):
+        for _ in range(3):
+            try:
+                async with in_transaction() as conn:
+                    block = await IdBlock.filter(name=_ID_BLOCK_NAME).using_db(conn).select_for_update().first()
+                    if block is None:
+                        # First use: continue after the rows inserted with auto-increment ids
+                        last_id = await AILog.all().using_db(conn).order_by("-id").first().values_list("id", flat=True)
+                        start = (last_id or 0) + 1
+                        await IdBlock.create(name=_ID_BLOCK_NAME, next_id=start + AI_LOG_ID_BLOCK_SIZE, using_db=conn)
+                    else:
+                        start = block.next_id
+                        block.next_id = start + AI_LOG_ID_BLOCK_SIZE
+                        await block.save(using_db=conn, update_fields=["next_id"])
+                return start, start + AI_LOG_ID_BLOCK_SIZE
+            except IntegrityError:
+                # Another worker created the block row at the same time
+                continue
+        raise RuntimeError("Could not reserve AILog ids")
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=AI_LOG_FLUSH_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                while (self._rows or self._patches) and await self._flush_once():
+                    if len(self._rows) + len(self._patches) < AI_LOG_BATCH_SIZE:
+                        break
+            except Exception as e:
+                print(f"AI log writer error: {e}")
+
+    async def _flush_once(self) -> bool:
+        """Insert one batch of rows and apply pending updates. Returns False if nothing could be written."""
+        async with self._flush_lock:
+            batch = list(self._rows.items())[:AI_LOG_BATCH_SIZE]
+            patches = list(self._patches.items())
+            written = 0
+            if batch:
+                written += await self._insert(batch)
+            if patches:
+                written += await self._apply(patches)
+            metrics.set_gauge("ai_log_writer_queue_depth", len(self._rows) + len(self._patches))
+            return written > 0
+
+    async def _insert(self, batch) -> int:
+        objects = [
+            AILog(
+                id=log_id,
+                user_id=row["user_id"],
+                feature=row["feature"],
+                input_summary=row["input_summary"],
+                output_result=row["output_result"],
+                output_summary=summarize_output(row["output_result"]),
+                created_at=row["created_at"],
+            )
+            for log_id, row in batch
+        ]
+        self._inserting = {log_id for log_id, _ in batch}
+        try:
+            try:
+                await AILog.bulk_create(objects)
+                inserted = [log_id for log_id, _ in batch]
+            except Exception as e:
+                print(f"AI log insert error ({len(batch)} rows): {e}")
+                if all(row["attempts"] == 0 for _, row in batch):
+                    # First failure: retry the batch as a whole next flush
+                    for _, row in batch:
+                        row["attempts"] += 1
+                    return 0
+                # Failed again: insert row by row so one bad row does not take the batch with it
+                inserted = await self._insert_each(objects, batch)
+        finally:
+            self._inserting = set()
+        for log_id in inserted:
+            self._rows.pop(log_id, None)
+            self._slots.release()
+        metrics.incr("ai_log_writer", len(inserted), result="inserted")
+        metrics.incr("ai_log_writer_batches")
+        return len(inserted)
+
+    async def _insert_each(self, objects, batch):
+        inserted = []
+        for obj, (log_id, row) in zip(objects, batch):
+            try:
+                await obj.save(force_create=True)
+            except Exception as e:
+                try:
+                    # The failed bulk insert may have gone through after all
+                    exists = await AILog.filter(id=log_id).exists()
+                except Exception:
+                    exists = False
+                if not exists:
+                    print(f"AI log insert error (log {log_id}): {e}")
+                    row["attempts"] += 1
+                    if row["attempts"] >= AI_LOG_MAX_ATTEMPTS:
+                        self._drop(self._rows, log_id)
+                    continue
+            inserted.append(log_id)
+        return inserted
+
+    async def _apply(self, patches) -> int:
+        try:
+            logs = {log.id: log for log in await AILog.filter(id__in=[log_id for log_id, _ in patches])}
+        except Exception as e:
+            print(f"AI log update error: {e}")
+            for log_id, patch in patches:
+                self._patch_failed(log_id, patch)
+            return 0
+        now = time.monotonic()
+        done = updated = 0
+        for log_id, patch in patches:
+            log = logs.get(log_id)
+            if log is None:
+                # Row not written yet (queued on another worker): keep the update until that worker
+                # has had time to insert it
+                if now - patch["queued_at"] >= AI_LOG_PATCH_WAIT_SECONDS:
+                    print(f"AI log update dropped: log {log_id} never appeared")
+                    self._drop(self._patches, log_id)
+                continue
+            applied = dict(patch["fields"])
+            result = log.output_result
+            if log.user_id == patch["user_id"] and isinstance(result, dict):
+                result.update(applied)
+                try:
+                    await AILog.filter(id=log_id).update(output_result=result, output_summary=summarize_output(result))
+                except Exception as e:
+                    print(f"AI log update error (log {log_id}): {e}")
+                    self._patch_failed(log_id, patch)
+                    continue
+                updated += 1
+            done += 1
+            # Updates that arrived during the write stay queued for the next flush
+            for key, value in applied.items():
+                if patch["fields"].get(key) is value:
+                    del patch["fields"][key]
+            if not patch["fields"] and self._patches.pop(log_id, None) is not None:
+                self._slots.release()
+        metrics.incr("ai_log_writer", updated, result="updated")
+        return done
+
+    def _patch_failed(self, log_id: int, patch: Dict[str, Any]):
+        patch["attempts"] += 1
+        if patch["attempts"] >= AI_LOG_MAX_ATTEMPTS:
+            self._drop(self._patches, log_id)
+
+    def _drop(self, queue: Dict[int, Any], log_id: int):
+        if queue.pop(log_id, None) is not None:
+            self._slots.release()
+            metrics.incr("ai_log_writer", result="dropped")
+
+
+ai_log_writer = AILogWriter()
@@ -1,20 +1,51 @@
-import httpx
 from app.core.config import settings
-from typing import List, Dict, Any, Optional
+from app.core.http_clients import get_http_client
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
 import json
-import base64
+import hashlib
 import os
 from pathlib import Path
 import asyncio
-from app.models.inventory import FridgeItem, ShoppingItem
-from app.models.recipes import Recipe, Collection, Like
-from app.models.users import UserProfile
+import time
+from app.core import metrics
+from app.services.ai_cache import ai_cache, normalize_text, normalize_list
+from app.services.vision_cache import vision_cache
+from app.services.single_flight import single_flight
+from app.services.model_router import Served, model_router, served
+from app.services.nutrition import NUTRIENTS, food_table
+from app.services.health_ai_service import health_ai_service
+from app.services.image_preprocess import PreparedImage, image_payload_cache, prepare_image
+from app.services.stream_json import JSONFieldStreamer
+from app.services.chat_memory import format_summary_prompt
+from app.services.agent_context import AGENT_CONTEXT_PREFETCH, CONTEXT_TOOLS, agent_context_cache, build_context_summary
+from app.services.agent_tools import (
+    DEFAULT_AGENT_TOOLS, agent_preset_cache, bind_agent_tools, call_tool, describe_tool_call,
+    is_read_only, resolve_tool_names,
+)
 
 # ai框架
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage, ToolMessage, AIMessage
 from langchain_core.prompts import PromptTemplate
 
+# System prompt of the built-in kitchen_agent
+DEFAULT_AGENT_PROMPT = """你是智能厨房管家。你可以查看用户的冰箱库存、购物清单以及饮食偏好。
+            
+            当用户询问'吃什么'、'推荐菜谱'或'制定计划'时，你需要获取足够的信息来给出个性化建议。
+            请积极使用工具来获取信息：
+            - 使用 `get_user_preferences` 获取用户的口味、过敏源和最近喜欢的菜品。
+            - 使用 `get_fridge_items` 查看冰箱里有什么食材。
+            
+            你可以同时调用多个工具，或者根据需要分步调用。
+            获取信息后，请结合用户的偏好和现有食材进行推荐。
+            - 如果用户最近喜欢'香辣'，且冰箱有'鸡肉'，优先推荐'辣子鸡'。
+            - 避开用户的过敏源。
+            - 优先消耗快过期的食材。
+            
+            如果推荐的菜谱缺少关键食材，可以询问用户是否需要加入购物清单（调用 `add_shopping_item`）。
+            
+            回复风格要亲切、自然，体现出你记得用户的喜好。"""
+
 class AIService:
     def __init__(self):
         self.base_url = settings.SILICONFLOW_BASE_URL
@@ -28,6 +59,9 @@ class AIService:
             model="Qwen/Qwen3-8B",
             temperature=0.7,
             max_tokens=2048,
+            # Streams end with a usage chunk, so streamed calls are metered too (core/usage.py)
+            stream_usage=True,
+            http_async_client=get_http_client("siliconflow"),
         )
 
         # Initialize ChatOpenAI for Vision (GLM-4V)
@@ -39,8 +73,12 @@ class AIService:
             model="THUDM/GLM-4.1V-9B-Thinking",
             temperature=0.1,
             max_tokens=2048,
+            stream_usage=True,
+            http_async_client=get_http_client("siliconflow"),
         )
 
+        self.image_model = "Kwai-Kolors/Kolors"
+
     async def _with_timeout(self, coro):
         return await asyncio.wait_for(coro, timeout=self.timeout_seconds)
 
@@ -50,50 +88,24 @@ class AIService:
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await self._with_timeout(client.post(
-                f"{self.base_url}{endpoint}",
-                headers=headers,
-                json=json_data
-            ))
-            response.raise_for_status()
-            return response.json()
-
-    async def _process_image_url(self, image_url: str) -> str:
-        """
-        If the image URL is local (starts with /static or http://localhost),
-        read the file and convert to base64 data URI.
-        If it's a remote URL (like COS), download it and convert to base64.
-        """
-        # Case 1: Remote URL (COS, etc.) - Download and convert to Base64
+        client = get_http_client("siliconflow")
+        response = await self._with_timeout(client.post(
+            f"{self.base_url}{endpoint}",
+            headers=headers,
+            json=json_data
+        ))
+        response.raise_for_status()
+        return response.json()
+
+    def _is_remote_image(self, image_url: str) -> bool:
         # 只要是 http 开头，且不是 localhost/127.0.0.1，就认为是远程图片
         # 这样可以兼容 COS 以及其他任何远程图片链接
-        is_remote = image_url.startswith("http") and \
-                   "localhost" not in image_url and \
-                   "127.0.0.1" not in image_url and \
-                   "8.148.212.184" not in image_url # 排除自己的服务器IP，走本地文件读取更高效
-        
-        if is_remote:
-            try:
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    response = await self._with_timeout(client.get(image_url))
-                    response.raise_for_status()
-                    image_data = response.content
-                    
-                    encoded_string = base64.b64encode(image_data).decode('utf-8')
-                    # Simple mime type guessing
-                    mime_type = "image/jpeg"
-                    if image_url.lower().endswith(".png"):
-                        mime_type = "image/png"
-                    elif image_url.lower().endswith(".webp"):
-                        mime_type = "image/webp"
-                        
-                    return f"data:{mime_type};base64,{encoded_string}"
-            except Exception as e:
-                # 如果下载失败，尝试返回原 URL 给 AI 服务，死马当活马医
-                return image_url
+        return image_url.startswith("http") and \
+               "localhost" not in image_url and \
+               "127.0.0.1" not in image_url and \
+               "8.148.212.184" not in image_url # 排除自己的服务器IP，走本地文件读取更高效
 
-        # Case 2: Local File Path
+    def _resolve_local_path(self, image_url: str) -> Optional[str]:
         local_path = None
         if image_url.startswith("/static/"):
             base_dir = Path(__file__).resolve().parents[2]
@@ -104,29 +116,111 @@ class AIService:
                 static_part = image_url.split("/static/")[1]
                 base_dir = Path(__file__).resolve().parents[2]
                 local_path = str(base_dir / "static" / static_part)
-        
         if local_path and os.path.exists(local_path):
+            return local_path
+        return None
+
+    async def _load_image(self, image_url: str) -> Optional[Tuple[bytes, str]]:
+        """
+        Load raw image bytes and mime type.
+        If the image URL is local (starts with /static or http://localhost), read the file.
+        If it's a remote URL (like COS), download it.
+        Returns None if the image cannot be loaded.
+        """
+        # Case 1: Remote URL (COS, etc.) - Download
+        if self._is_remote_image(image_url):
             try:
-                with open(local_path, "rb") as image_file:
-                    encoded_string = base64.b64encode(image_file.read()).decode('utf-8')
-                    # Guess mime type based on extension
-                    ext = os.path.splitext(local_path)[1].lower()
-                    mime_type = "image/jpeg" # default
-                    if ext == ".png":
-                        mime_type = "image/png"
-                    elif ext == ".gif":
-                        mime_type = "image/gif"
-                    elif ext == ".webp":
-                        mime_type = "image/webp"
-                    
-                    return f"data:{mime_type};base64,{encoded_string}"
+                client = get_http_client("media")
+                response = await self._with_timeout(client.get(image_url))
+                response.raise_for_status()
+                # Simple mime type guessing
+                mime_type = "image/jpeg"
+                if image_url.lower().endswith(".png"):
+                    mime_type = "image/png"
+                elif image_url.lower().endswith(".webp"):
+                    mime_type = "image/webp"
+                return response.content, mime_type
+            except Exception as e:
+                print(f"Image download failed: {e}")
+                return None
+
+        # Case 2: Local File Path
+        local_path = self._resolve_local_path(image_url)
+        if local_path:
+            try:
+                image_data = await asyncio.to_thread(Path(local_path).read_bytes)
+                # Guess mime type based on extension
+                ext = os.path.splitext(local_path)[1].lower()
+                mime_type = "image/jpeg" # default
+                if ext == ".png":
+                    mime_type = "image/png"
+                elif ext == ".gif":
+                    mime_type = "image/gif"
+                elif ext == ".webp":
+                    mime_type = "image/webp"
+                return image_data, mime_type
             except Exception as e:
-                # Fallback to original URL if reading fails
-                return image_url
+                print(f"Image read failed: {e}")
+                return None
         
-        return image_url
+        return None
 
-    async def generate_image(self, prompt: str, size: str = "1024x1024") -> str:
+    def _payload_cache_key(self, image_url: str) -> Optional[str]:
+        # Local files are keyed by path + mtime so an overwritten upload is re-processed
+        local_path = self._resolve_local_path(image_url)
+        if local_path:
+            try:
+                return f"{local_path}:{os.path.getmtime(local_path)}"
+            except OSError:
+                return None
+        if self._is_remote_image(image_url):
+            # Uploaded object keys are unique, so the URL identifies the content
+            return image_url
+        return None
+
+    async def _prepare_image(self, image_url: str) -> Optional[PreparedImage]:
+        """Load, downscale and base64-encode an image once per URL/mtime."""
+        cache_key = self._payload_cache_key(image_url)
+        if cache_key:
+            prepared = image_payload_cache.get(cache_key)
+            if prepared is not None:
+                return prepared
+
+        loaded = await self._load_image(image_url)
+        if not loaded:
+            return None
+        prepared = await prepare_image(*loaded)
+        if cache_key:
+            image_payload_cache.set(cache_key, prepared)
+        return prepared
+
+    async def _prepare_vision_input(self, image_url: str, feature: str, use_cache: bool = True) -> Tuple[Any, str, Optional[int]]:
+        """
+        Prepare the image, then look up near-duplicate results by its perceptual hash.
+        Returns (cached_result, processed_url, image_hash).
+        """
+        prepared = await self._prepare_image(image_url)
+        if not prepared:
+            # 如果读取失败，尝试返回原 URL 给 AI 服务，死马当活马医
+            return None, image_url, None
+
+        if use_cache:
+            cached = await vision_cache.lookup(feature, self.llm_vision.model_name, prepared.image_hash)
+            if cached is not None:
+                return cached, prepared.data_uri, prepared.image_hash
+
+        return None, prepared.data_uri, prepared.image_hash
+
+    def _vision_flight_key(self, feature: str, processed_url: str, image_hash: Optional[int], use_cache: bool = True) -> str:
+        """Single-flight key for a vision call: same (near-duplicate) image, same feature and model."""
+        if image_hash is not None:
+            image_key = f"phash:{image_hash:016x}"
+        else:
+            image_key = "sha256:" + hashlib.sha256(processed_url.encode("utf-8")).hexdigest()
+        key = f"{feature}:{self.llm_vision.model_name}:{image_key}"
+        return key if use_cache else f"{key}:refresh"
+
+    async def generate_image(self, prompt: str, size: str = "1024x1024", use_cache: bool = True) -> str:
         """
         Generate image using Kolors model.
         LangChain doesn't have a generic 'ImageGeneration' chat model, 
@@ -134,13 +228,23 @@ class AIService:
         Here we use raw API for better control over Kolors specific params.
         """
         payload = {
-            "model": "Kwai-Kolors/Kolors",
+            "model": self.image_model,
             "prompt": prompt,
             "image_size": size,
             "num_inference_steps": 20
         }
-        response = await self._post("/images/generations", payload)
-        return response["images"][0]["url"] 
+
+        async def generate():
+            response = await self._post("/images/generations", payload)
+            return response["images"][0]["url"]
+
+        return await ai_cache.get_or_generate(
+            "text-to-image",
+            payload["model"],
+            {"prompt": normalize_text(prompt), "size": size, "steps": payload["num_inference_steps"]},
+            generate,
+            use_cache=use_cache,
+        )
 
     def _extract_json(self, content: str) -> Any:
         try:
@@ -192,8 +296,12 @@ class AIService:
         
         return data
 
-    async def generate_recipe_from_text(self, description: str, preferences: str = "") -> Dict[str, Any]:
-        """Use LangChain to generate recipe from text"""
+    def _is_cacheable_recipe(self, recipe: Dict[str, Any]) -> bool:
+        # Never cache the parse-failure fallback produced by _clean_recipe_response
+        return isinstance(recipe, dict) and recipe.get("title") != "Generated Recipe"
+
+    def _text_recipe_request(self, description: str, preferences: str):
+        """Prompt, inputs and cache params shared by the blocking and streaming text-to-recipe paths"""
         template = """你是一个专业的厨师。请根据用户的描述生成一个JSON格式的菜谱，包含title, description, ingredients(list), steps(list), nutrition(dict with calories, protein, fat, carbs), cooking_time, difficulty。
         
         描述: {description}
@@ -207,42 +315,66 @@ class AIService:
         只返回JSON，不要其他文字。"""
         
         prompt = PromptTemplate.from_template(template)
-        chain = prompt | self.llm_text
-        
-        response = await self._with_timeout(chain.ainvoke({"description": description, "preferences": preferences}))
-        return self._clean_recipe_response(response.content)
+        inputs = {"description": description, "preferences": preferences}
+        cache_params = {"description": normalize_text(description), "preferences": normalize_text(preferences)}
+        return prompt, inputs, cache_params
 
-    async def generate_recipe_from_image(self, image_url: str) -> Dict[str, Any]:
-        """Use LangChain (Vision) to generate recipe from image"""
-        processed_url = await self._process_image_url(image_url)
+    async def generate_recipe_from_text(self, description: str, preferences: str = "", use_cache: bool = True) -> Dict[str, Any]:
+        """Use LangChain to generate recipe from text"""
+        prompt, inputs, cache_params = self._text_recipe_request(description, preferences)
         
-        # 调试：打印处理后的 URL 长度（如果是 base64 会很长）
-        print(f"DEBUG: Processed URL length: {len(processed_url)}")
-        if processed_url.startswith("data:"):
-            print("DEBUG: Image converted to Base64 successfully")
-        else:
-            print(f"DEBUG: Using raw URL: {processed_url}")
+        async def generate():
+            response = await model_router.invoke("text-to-recipe", self.llm_text, lambda llm: (prompt | llm).ainvoke(inputs))
+            return self._clean_recipe_response(response.content)
 
-        message = HumanMessage(
+        return await ai_cache.get_or_generate(
+            "text-to-recipe",
+            self.llm_text.model_name,
+            cache_params,
+            generate,
+            use_cache=use_cache,
+            cacheable=self._is_cacheable_recipe,
+        )
+
+    def _image_recipe_message(self, processed_url: str) -> HumanMessage:
+        return HumanMessage(
             content=[
                 {"type": "text", "text": "请识别图中的菜品，并生成一个JSON格式的菜谱，包含title, description, ingredients(list), steps(list), nutrition(dict with calories, protein, fat, carbs), cooking_time, difficulty。\n\n注意：\n1. steps 必须是一个字符串列表，每个字符串代表一个独立的步骤。\n2. 步骤描述要清晰具体，不要把所有步骤合并成一段话。\n3. 示例格式: [\"洗净切块\", \"大火爆炒\", \"加水炖煮\"]\n\n只返回JSON。"},
                 {"type": "image_url", "image_url": {"url": processed_url}},
             ]
         )
+
+    async def generate_recipe_from_image(self, image_url: str, use_cache: bool = True) -> Dict[str, Any]:
+        """Use LangChain (Vision) to generate recipe from image"""
+        cached, processed_url, image_hash = await self._prepare_vision_input(image_url, "image-to-recipe", use_cache)
+        if cached is not None:
+            return cached
         
-        try:
-            response = await self._with_timeout(self.llm_vision.ainvoke([message]))
-            return self._clean_recipe_response(response.content)
-        except Exception as e:
-            print(f"AI Service Error (Vision): {e}")
-            raise e
+        if not processed_url.startswith("data:"):
+            print(f"DEBUG: Using raw URL: {processed_url}")
+
+        message = self._image_recipe_message(processed_url)
         
-    async def estimate_calories(self, image_url: str) -> str:
-        """Use LangChain (Vision) to estimate calories"""
-        processed_url = await self._process_image_url(image_url)
+        async def generate():
+            try:
+                with served() as route:
+                    response = await model_router.invoke("image-to-recipe", self.llm_vision, lambda llm: llm.ainvoke([message]))
+                result = self._clean_recipe_response(response.content)
+                if self._is_cacheable_recipe(result) and not route.fallback:
+                    await vision_cache.store("image-to-recipe", self.llm_vision.model_name, image_hash, result)
+                return result
+            except Exception as e:
+                print(f"AI Service Error (Vision): {e}")
+                raise e
+
+        key = self._vision_flight_key("image-to-recipe", processed_url, image_hash, use_cache)
+        return await single_flight.do(key, generate, feature="image-to-recipe")
         
-        # 调试日志
-        print(f"DEBUG: Processed URL length: {len(processed_url)}")
+    async def estimate_calories(self, image_url: str, use_cache: bool = True) -> str:
+        """Use LangChain (Vision) to estimate calories"""
+        cached, processed_url, image_hash = await self._prepare_vision_input(image_url, "image-to-calorie", use_cache)
+        if cached is not None:
+            return cached
         
         message = HumanMessage(
             content=[
@@ -251,15 +383,21 @@ class AIService:
             ]
         )
         
-        try:
-            response = await self._with_timeout(self.llm_vision.ainvoke([message]))
-            return response.content
-        except Exception as e:
-            print(f"AI Service Error (Calories): {e}")
-            raise e
+        async def generate():
+            try:
+                with served() as route:
+                    response = await model_router.invoke("image-to-calorie", self.llm_vision, lambda llm: llm.ainvoke([message]))
+                if not route.fallback:
+                    await vision_cache.store("image-to-calorie", self.llm_vision.model_name, image_hash, response.content)
+                return response.content
+            except Exception as e:
+                print(f"AI Service Error (Calories): {e}")
+                raise e
 
-    async def fridge_to_recipe(self, items: List[str]) -> Dict[str, Any]:
-        """Use LangChain to recommend recipe from fridge items"""
+        key = self._vision_flight_key("image-to-calorie", processed_url, image_hash, use_cache)
+        return await single_flight.do(key, generate, feature="image-to-calorie")
+
+    def _fridge_recipe_request(self, items: List[str]):
         template = """我有以下食材: {items_str}。请推荐一道可以用这些食材制作的菜谱。请返回JSON格式，包含title, description, ingredients(list), steps(list), nutrition(dict), cooking_time, difficulty。
         
         注意：
@@ -270,14 +408,30 @@ class AIService:
         只返回JSON。"""
         
         prompt = PromptTemplate.from_template(template)
-        chain = prompt | self.llm_text
+        return prompt, {"items_str": ", ".join(items)}, {"items": normalize_list(items)}
+
+    async def fridge_to_recipe(self, items: List[str], use_cache: bool = True) -> Dict[str, Any]:
+        """Use LangChain to recommend recipe from fridge items"""
+        prompt, inputs, cache_params = self._fridge_recipe_request(items)
         
-        response = await self._with_timeout(chain.ainvoke({"items_str": ", ".join(items)}))
-        return self._clean_recipe_response(response.content)
+        async def generate():
+            response = await model_router.invoke("fridge-to-recipe", self.llm_text, lambda llm: (prompt | llm).ainvoke(inputs))
+            return self._clean_recipe_response(response.content)
+
+        return await ai_cache.get_or_generate(
+            "fridge-to-recipe",
+            self.llm_text.model_name,
+            cache_params,
+            generate,
+            use_cache=use_cache,
+            cacheable=self._is_cacheable_recipe,
+        )
 
-    async def recognize_fridge_items(self, image_url: str) -> List[Dict[str, Any]]:
+    async def recognize_fridge_items(self, image_url: str, use_cache: bool = True) -> List[Dict[str, Any]]:
         """Use LangChain (Vision) to recognize fridge items"""
-        processed_url = await self._process_image_url(image_url)
+        cached, processed_url, image_hash = await self._prepare_vision_input(image_url, "recognize-fridge", use_cache)
+        if cached is not None:
+            return cached
         
         message = HumanMessage(
             content=[
@@ -286,23 +440,31 @@ class AIService:
             ]
         )
         
-        try:
-            response = await self._with_timeout(self.llm_vision.ainvoke([message]))
-            content = response.content
-            
-            # Clean content similar to recipe response
-            content = content.strip()
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0]
-            elif "```" in content:
-                content = content.replace("```", "")
-            content = content.strip("` \n")
-            
-            return json.loads(content)
-        except Exception as e:
-            print(f"AI Service Error (Fridge): {e}")
-            # Fallback mock for demo if AI fails or returns bad format
-            return []
+        async def generate():
+            try:
+                with served() as route:
+                    response = await model_router.invoke("recognize-fridge", self.llm_vision, lambda llm: llm.ainvoke([message]))
+                content = response.content
+                
+                # Clean content similar to recipe response
+                content = content.strip()
+                if "```json" in content:
+                    content = content.split("```json")[1].split("```")[0]
+                elif "```" in content:
+                    content = content.replace("```", "")
+                content = content.strip("` \n")
+                
+                items = json.loads(content)
+                if not route.fallback:
+                    await vision_cache.store("recognize-fridge", self.llm_vision.model_name, image_hash, items)
+                return items
+            except Exception as e:
+                print(f"AI Service Error (Fridge): {e}")
+                # Fallback mock for demo if AI fails or returns bad format
+                return []
+
+        key = self._vision_flight_key("recognize-fridge", processed_url, image_hash, use_cache)
+        return await single_flight.do(key, generate, feature="recognize-fridge")
 
     async def transcribe_audio(self, audio_data: bytes, format: str = "pcm", rate: int = 16000, channel: int = 1) -> str:
         """
@@ -347,15 +509,15 @@ class AIService:
                 "Authorization": f"Bearer {self.api_key}"
             }
             
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await self._with_timeout(client.post(
-                    f"{self.base_url}/audio/transcriptions",
-                    headers=headers,
-                    files=files
-                ))
-                response.raise_for_status()
-                result = response.json()
-                return result.get("text", "")
+            client = get_http_client("siliconflow")
+            response = await self._with_timeout(client.post(
+                f"{self.base_url}/audio/transcriptions",
+                headers=headers,
+                files=files
+            ))
+            response.raise_for_status()
+            result = response.json()
+            return result.get("text", "")
                 
         except Exception as e:
             print(f"ASR Error: {e}")
@@ -372,10 +534,10 @@ class AIService:
                 lc_messages.append(HumanMessage(content=msg["content"]))
             # Add AI/Assistant message support if needed
         
-        response = await self._with_timeout(self.llm_text.ainvoke(lc_messages))
+        response = await model_router.invoke("chat", self.llm_text, lambda llm: llm.ainvoke(lc_messages))
         return response.content
 
-    async def generate_what_to_eat_options(self, categories: List[str], quantity: int) -> List[str]:
+    async def generate_what_to_eat_options(self, categories: List[str], quantity: int, use_cache: bool = True) -> List[str]:
         """Generate food options based on categories and quantity"""
         template = """请根据以下食物种类，生成总共 {quantity} 个具体的食物名称。
         
@@ -391,27 +553,35 @@ class AIService:
         只返回JSON列表。"""
         
         prompt = PromptTemplate.from_template(template)
-        chain = prompt | self.llm_text
-        
-        response = await self._with_timeout(chain.ainvoke({
+        inputs = {
             "categories_str": ", ".join(categories),
             "quantity": quantity
-        }))
+        }
         
-        content = response.content.strip()
-        try:
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0]
-            elif "```" in content:
-                content = content.replace("```", "")
-            content = content.strip("` \n")
-            return json.loads(content)
-        except Exception as e:
-            print(f"Error parsing AI response: {e}")
-            return []
+        async def generate():
+            response = await model_router.invoke("what-to-eat", self.llm_text, lambda llm: (prompt | llm).ainvoke(inputs))
+            
+            content = response.content.strip()
+            try:
+                if "```json" in content:
+                    content = content.split("```json")[1].split("```")[0]
+                elif "```" in content:
+                    content = content.replace("```", "")
+                content = content.strip("` \n")
+                return json.loads(content)
+            except Exception as e:
+                print(f"Error parsing AI response: {e}")
+                return []
+
+        return await ai_cache.get_or_generate(
+            "what-to-eat",
+            self.llm_text.model_name,
+            {"categories": normalize_list(categories), "quantity": quantity},
+            generate,
+            use_cache=use_cache,
+        )
 
-    async def generate_meal_plan(self, restrictions: str, preferences: str, headcount: int, days: int, goal: str, notes: str = None) -> Dict[str, Any]:
-        """Generate a meal plan"""
+    def _meal_plan_request(self, restrictions: str, preferences: str, headcount: int, days: int, goal: str, notes: str = None):
         template = """你是一个专业的营养师。请根据以下要求，为用户制定一个{days}天的膳食计划。
         
         基本要求：
@@ -460,21 +630,21 @@ class AIService:
         safe_notes = raw_notes.replace("{", "(").replace("}", ")").replace('"', "'")
         
         prompt = PromptTemplate.from_template(template)
-        chain = prompt | self.llm_text
-        
-        response = await chain.ainvoke({
+        inputs = {
             "days": days,
             "headcount": headcount,
             "restrictions": restrictions or "无",
             "preferences": preferences or "无",
             "goal": goal or "健康饮食",
             "notes": safe_notes
-        })
-        
-        data = self._extract_json(response.content)
+        }
+        return prompt, inputs
+
+    def _clean_meal_plan_response(self, content: str) -> Dict[str, Any]:
+        data = self._extract_json(content)
         if not data or not isinstance(data, dict):
             # Return a valid structure with error message
-            print(f"Failed to parse meal plan JSON. Response content: {response.content[:200]}...")
+            print(f"Failed to parse meal plan JSON. Response content: {content[:200]}...")
             return {
                 "title": "膳食计划生成失败",
                 "overview": "无法解析AI返回的数据，请重试。",
@@ -483,116 +653,147 @@ class AIService:
             
         return data
 
-    async def kitchen_agent_chat(self, user_id: int, message: str, history: List[Dict[str, Any]], agent_id: str = "kitchen_agent", session_id: int = None) -> Dict[str, Any]:
+    async def generate_meal_plan(self, restrictions: str, preferences: str, headcount: int, days: int, goal: str, notes: str = None) -> Dict[str, Any]:
+        """Generate a meal plan"""
+        prompt, inputs = self._meal_plan_request(restrictions, preferences, headcount, days, goal, notes)
+        response = await model_router.invoke("meal-plan", self.llm_text, lambda llm: (prompt | llm).ainvoke(inputs))
+        return self._clean_meal_plan_response(response.content)
+
+    # --- Streaming variants (SSE) ---
+    # Each yields (event, data) tuples as JSON fields complete; the last tuple is ("result", final_object).
+
+    async def _stream_json_fields(self, feature: str, llm, call, streamer: JSONFieldStreamer, finalize, route: Served = None) -> AsyncIterator[Tuple[str, Any]]:
+        async for chunk in model_router.stream(feature, llm, call, route):
+            text = chunk.content if isinstance(chunk.content, str) else ""
+            if text:
+                for event in streamer.feed(text):
+                    yield event
+        result = finalize(streamer.text)
+        # Fields only recoverable after cleanup (fallbacks, steps split from one string)
+        for event in streamer.replay(result):
+            yield event
+        yield "result", result
+
+    async def _stream_cached_recipe(self, feature: str, prompt, inputs, cache_params, use_cache: bool) -> AsyncIterator[Tuple[str, Any]]:
+        streamer = JSONFieldStreamer({"steps": "step"})
+        key = ai_cache.make_key(feature, self.llm_text.model_name, cache_params)
+        if use_cache and ai_cache.enabled:
+            cached = await ai_cache.get(feature, key)
+            if cached is not None:
+                for event in streamer.replay(cached):
+                    yield event
+                yield "result", cached
+                return
+
+        route = Served()
+        stream = lambda llm: (prompt | llm).astream(inputs)
+        async for event, data in self._stream_json_fields(feature, self.llm_text, stream, streamer, self._clean_recipe_response, route):
+            # Fallback answers are not cached under the primary model's key
+            if event == "result" and not route.fallback and self._is_cacheable_recipe(data):
+                await ai_cache.set(feature, key, data)
+            yield event, data
+
+    async def stream_recipe_from_text(self, description: str, preferences: str = "", use_cache: bool = True) -> AsyncIterator[Tuple[str, Any]]:
+        prompt, inputs, cache_params = self._text_recipe_request(description, preferences)
+        async for event in self._stream_cached_recipe("text-to-recipe", prompt, inputs, cache_params, use_cache):
+            yield event
+
+    async def stream_fridge_to_recipe(self, items: List[str], use_cache: bool = True) -> AsyncIterator[Tuple[str, Any]]:
+        prompt, inputs, cache_params = self._fridge_recipe_request(items)
+        async for event in self._stream_cached_recipe("fridge-to-recipe", prompt, inputs, cache_params, use_cache):
+            yield event
+
+    async def stream_recipe_from_image(self, image_url: str, use_cache: bool = True) -> AsyncIterator[Tuple[str, Any]]:
+        streamer = JSONFieldStreamer({"steps": "step"})
+        cached, processed_url, image_hash = await self._prepare_vision_input(image_url, "image-to-recipe", use_cache)
+        if cached is not None:
+            for event in streamer.replay(cached):
+                yield event
+            yield "result", cached
+            return
+
+        message = self._image_recipe_message(processed_url)
+        route = Served()
+        stream = lambda llm: llm.astream([message])
+        async for event, data in self._stream_json_fields("image-to-recipe", self.llm_vision, stream, streamer, self._clean_recipe_response, route):
+            if event == "result" and not route.fallback and self._is_cacheable_recipe(data):
+                await vision_cache.store("image-to-recipe", self.llm_vision.model_name, image_hash, data)
+            yield event, data
+
+    async def stream_meal_plan(self, restrictions: str, preferences: str, headcount: int, days: int, goal: str, notes: str = None) -> AsyncIterator[Tuple[str, Any]]:
+        prompt, inputs = self._meal_plan_request(restrictions, preferences, headcount, days, goal, notes)
+        streamer = JSONFieldStreamer({"daily_plans": "day"})
+        stream = lambda llm: (prompt | llm).astream(inputs)
+        async for event in self._stream_json_fields("meal-plan", self.llm_text, stream, streamer, self._clean_meal_plan_response):
+            yield event
+
+    async def kitchen_agent_chat(self, user_id: int, message: str, history: List[Dict[str, Any]], agent_id: str = "kitchen_agent", session_id: int = None, prefetch_context: Optional[bool] = None, summary: Optional[str] = None) -> Dict[str, Any]:
         """
         Agent with tool use for kitchen management.
         Returns dict with answer and thoughts.
         """
-        from app.models.chat import AgentPreset, ChatSession
-        
-        # ... (Tools definition same as before) ...
-        async def get_fridge_items() -> str:
-            """查看冰箱里现有的食材列表"""
-            items = await FridgeItem.filter(user_id=user_id).all()
-            if not items:
-                return "冰箱是空的。"
-            return json.dumps([{"name": i.name, "quantity": i.quantity, "expiry": str(i.expiry_date)} for i in items], ensure_ascii=False)
-
-        async def add_shopping_item(item_name: str) -> str:
-            """添加物品到购物清单"""
-            await ShoppingItem.create(user_id=user_id, name=item_name, is_bought=False)
-            return f"已将 '{item_name}' 添加到购物清单。"
-
-        async def get_shopping_list() -> str:
-            """查看当前的购物清单"""
-            items = await ShoppingItem.filter(user_id=user_id, is_bought=False).all()
-            if not items:
-                return "购物清单是空的。"
-            return json.dumps([{"name": i.name} for i in items], ensure_ascii=False)
-
-        async def get_user_preferences() -> str:
-            """获取用户的饮食偏好，包括口味、过敏源、喜欢的食谱等"""
-            profile = await UserProfile.get_or_none(user_id=user_id)
-            
-            # Get liked recipes (Generic relation manual query)
-            liked_ids = await Like.filter(user_id=user_id, target_type='recipe').values_list('target_id', flat=True)
-            liked_recipes = await Recipe.filter(id__in=liked_ids).limit(5).values_list('title', flat=True)
-            
-            # Get collected recipes
-            collected_ids = await Collection.filter(user_id=user_id, target_type='recipe').values_list('target_id', flat=True)
-            collected_recipes = await Recipe.filter(id__in=collected_ids).limit(5).values_list('title', flat=True)
-            
-            prefs = {
-                "allergies": profile.allergies if profile else [],
-                "health_goals": profile.health_goals if profile else [],
-                "taste_preferences": profile.preferences if profile else [],
-                "recently_liked": list(liked_recipes),
-                "recently_collected": list(collected_recipes)
-            }
-            return json.dumps(prefs, ensure_ascii=False)
-
-        # Available tool map
-        available_tools_map = {
-            "get_fridge_items": get_fridge_items,
-            "add_shopping_item": add_shopping_item,
-            "get_shopping_list": get_shopping_list,
-            "get_user_preferences": get_user_preferences
-        }
+        result = None
+        async for event, data in self.stream_kitchen_agent_chat(user_id, message, history, agent_id, session_id, prefetch_context, summary):
+            if event == "result":
+                result = data
+        return result
 
+    async def stream_kitchen_agent_chat(self, user_id: int, message: str, history: List[Dict[str, Any]], agent_id: str = "kitchen_agent", session_id: int = None, prefetch_context: Optional[bool] = None, summary: Optional[str] = None) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Streaming form of kitchen_agent_chat.
+        Yields ("thought", {...,"status": "start"|"end"}) around each tool call, ("token", text) for answer tokens,
+        and finally ("result", {"answer", "thoughts"}).
+        prefetch_context (default: AGENT_CONTEXT_PREFETCH) loads fridge, shopping list and preferences up front
+        for the default agent and puts a summary in the system prompt, saving the model a tool round trip.
+        summary is the session's rolling summary of turns older than `history` (see chat_memory).
+        """
         # 2. Load Agent Preset Configuration
-        system_prompt = ""
-        tools_to_bind = []
-        
-        # Default system prompt
-        default_prompt = """你是智能厨房管家。你可以查看用户的冰箱库存、购物清单以及饮食偏好。
-            
-            当用户询问'吃什么'、'推荐菜谱'或'制定计划'时，你需要获取足够的信息来给出个性化建议。
-            请积极使用工具来获取信息：
-            - 使用 `get_user_preferences` 获取用户的口味、过敏源和最近喜欢的菜品。
-            - 使用 `get_fridge_items` 查看冰箱里有什么食材。
-            
-            你可以同时调用多个工具，或者根据需要分步调用。
-            获取信息后，请结合用户的偏好和现有食材进行推荐。
-            - 如果用户最近喜欢'香辣'，且冰箱有'鸡肉'，优先推荐'辣子鸡'。
-            - 避开用户的过敏源。
-            - 优先消耗快过期的食材。
-            
-            如果推荐的菜谱缺少关键食材，可以询问用户是否需要加入购物清单（调用 `add_shopping_item`）。
-            
-            回复风格要亲切、自然，体现出你记得用户的喜好。"""
-
-        # Try to find custom preset
+        # Try to find custom preset (numeric agent_id); cached, invalidated on update/delete
         preset = None
-        if agent_id and agent_id != "kitchen_agent":
-            # Assuming agent_id is numeric string for custom presets
-            if agent_id.isdigit():
-                preset = await AgentPreset.get_or_none(id=int(agent_id))
+        if agent_id and agent_id != "kitchen_agent" and agent_id.isdigit():
+            preset = await agent_preset_cache.get(int(agent_id))
         
         if preset:
             system_prompt = preset.system_prompt
             # Filter tools based on preset.allowed_tools
-            allowed_tool_names = []
-            if preset.allowed_tools:
-                for tool_name in preset.allowed_tools:
-                    if tool_name in available_tools_map:
-                        tools_to_bind.append(available_tools_map[tool_name])
-                        allowed_tool_names.append(tool_name)
+            tool_names = resolve_tool_names(preset.allowed_tools)
             
             # Inject allowed tools into system prompt to avoid hallucinations
-            if allowed_tool_names:
-                system_prompt += f"\n\nSystem Note: You have access to the following tools: {', '.join(allowed_tool_names)}. Do not claim to have capabilities outside of these tools."
+            if tool_names:
+                system_prompt += f"\n\nSystem Note: You have access to the following tools: {', '.join(tool_names)}. Do not claim to have capabilities outside of these tools."
             else:
                 system_prompt += "\n\nSystem Note: You do not have access to any external tools (like fridge or shopping list). Just chat with the user."
         else:
             # Default "kitchen_agent" behavior
-            system_prompt = default_prompt
-            tools_to_bind = [get_fridge_items, add_shopping_item, get_shopping_list, get_user_preferences]
-
-        # 3. Bind tools to LLM
-        if tools_to_bind:
-            llm_with_tools = self.llm_text.bind_tools(tools_to_bind)
-        else:
-            llm_with_tools = self.llm_text # No tools
+            system_prompt = DEFAULT_AGENT_PROMPT
+            tool_names = DEFAULT_AGENT_TOOLS
+
+        # 3. Bind tools to LLM (schemas are precompiled, bound sets cached per tool combination)
+        llm_with_tools = bind_agent_tools(self.llm_text, tool_names)
+
+        # Read-only tool results are memoized for the lifetime of this request;
+        # write tools run one at a time and drop the memo, since they may change what reads return
+        tool_memo: Dict[str, Any] = {}
+        write_lock = asyncio.Lock()
+
+        # Context prefetch (default agent only): one concurrent load instead of tool-calling turns
+        if prefetch_context is None:
+            prefetch_context = AGENT_CONTEXT_PREFETCH
+        if prefetch_context and not preset:
+            context = agent_context_cache.get(user_id)
+            if context is None:
+                loaded = await asyncio.gather(*(call_tool(name, user_id, {}) for name in CONTEXT_TOOLS))
+                context = dict(zip(CONTEXT_TOOLS, loaded))
+                agent_context_cache.set(user_id, context)
+            # If the model still calls one of these tools, answer from the prefetched result
+            for name, result in context.items():
+                tool_memo[name + ":{}"] = result
+            system_prompt += (
+                "\n\n以下是已为你预先获取的用户当前信息，无需再调用 get_fridge_items、get_shopping_list 或 get_user_preferences：\n"
+                + build_context_summary(context)
+            )
+
+        system_prompt += format_summary_prompt(summary)
 
         # 4. Construct Messages
         messages = [
@@ -608,6 +809,30 @@ class AIService:
         
         messages.append(HumanMessage(content=message))
 
+        async def run_tool(index: int, fn_name: str, args: Dict[str, Any]):
+            started = time.perf_counter()
+            cached = False
+            result = "Tool Error"
+            try:
+                if fn_name not in tool_names:
+                    result = f"Tool {fn_name} is not available or not allowed."
+                elif is_read_only(fn_name):
+                    memo_key = fn_name + ":" + json.dumps(args, sort_keys=True, ensure_ascii=False)
+                    if memo_key in tool_memo:
+                        result, cached = tool_memo[memo_key], True
+                    else:
+                        result = await call_tool(fn_name, user_id, args)
+                        tool_memo[memo_key] = result
+                else:
+                    async with write_lock:
+                        result = await call_tool(fn_name, user_id, args)
+                        tool_memo.clear()
+            except Exception as e:
+                result = f"Error executing tool {fn_name}: {str(e)}"
+            latency_ms = round((time.perf_counter() - started) * 1000, 1)
+            metrics.observe("agent_tool_latency_ms", latency_ms, tool=fn_name)
+            return index, result, latency_ms, cached
+
         thoughts = []
         MAX_TURNS = 5
         turn_count = 0
@@ -617,7 +842,12 @@ class AIService:
         try:
             while turn_count < MAX_TURNS:
                 turn_count += 1
-                response = await llm_with_tools.ainvoke(messages)
+                response = None
+                async for chunk in llm_with_tools.astream(messages):
+                    response = chunk if response is None else response + chunk
+                    # Answer tokens go out as soon as they arrive; tool-call turns normally carry no content
+                    if isinstance(chunk.content, str) and chunk.content:
+                        yield "token", chunk.content
                 messages.append(response)
 
                 if not response.tool_calls:
@@ -625,48 +855,54 @@ class AIService:
                     final_answer = response.content
                     break
                 
-                # Execute tools
+                # Execute tools concurrently; "end" thoughts are emitted in completion order
+                turn_thoughts = []
                 for tool_call in response.tool_calls:
                     fn_name = tool_call["name"]
                     args = tool_call["args"]
                     
                     # Record thought
-                    thoughts.append({
+                    thought = {
                         "tool": fn_name,
                         "args": args,
-                        "description": f"正在调用 {fn_name}..."
-                    })
-
-                    # Execute tool
-                    result = "Tool Error"
-                    try:
-                        if fn_name in available_tools_map:
-                            if fn_name == "get_fridge_items":
-                                thoughts[-1]["description"] = "正在查看冰箱库存..."
-                                result = await get_fridge_items(**args)
-                            elif fn_name == "add_shopping_item":
-                                thoughts[-1]["description"] = f"正在将 {args.get('item_name', '物品')} 加入清单..."
-                                result = await add_shopping_item(**args)
-                            elif fn_name == "get_shopping_list":
-                                thoughts[-1]["description"] = "正在查看购物清单..."
-                                result = await get_shopping_list(**args)
-                            elif fn_name == "get_user_preferences":
-                                thoughts[-1]["description"] = "正在获取您的饮食偏好..."
-                                result = await get_user_preferences(**args)
-                        else:
-                             result = f"Tool {fn_name} is not available or not allowed."
-                    except Exception as e:
-                        result = f"Error executing tool {fn_name}: {str(e)}"
-                    
+                        "description": describe_tool_call(fn_name, args)
+                    }
+                    thoughts.append(thought)
+                    turn_thoughts.append(thought)
+                    yield "thought", {**thought, "status": "start"}
+
+                results = [None] * len(response.tool_calls)
+                pending = [
+                    asyncio.create_task(run_tool(index, tool_call["name"], tool_call["args"]))
+                    for index, tool_call in enumerate(response.tool_calls)
+                ]
+                try:
+                    for finished in asyncio.as_completed(pending):
+                        index, result, latency_ms, cached = await finished
+                        results[index] = result
+                        thought = turn_thoughts[index]
+                        thought["latency_ms"] = latency_ms
+                        if cached:
+                            thought["cached"] = True
+                        yield "thought", {"tool": thought["tool"], "status": "end", "latency_ms": latency_ms, "cached": cached}
+                finally:
+                    # Cancelled (client gone) or closed early: don't leave tool calls running
+                    for task in pending:
+                        task.cancel()
+
+                # Tool messages keep the order of the tool calls
+                for tool_call, result in zip(response.tool_calls, results):
                     messages.append(ToolMessage(tool_call_id=tool_call["id"], content=str(result)))
             
             if not final_answer:
                 # If max turns reached, force a summary
                 messages.append(SystemMessage(content="Please stop calling tools and summarize the results to the user now."))
-                final_response = await self.llm_text.ainvoke(messages)
-                final_answer = final_response.content
+                async for chunk in self.llm_text.astream(messages):
+                    if isinstance(chunk.content, str) and chunk.content:
+                        final_answer += chunk.content
+                        yield "token", chunk.content
 
-            return {
+            yield "result", {
                 "answer": final_answer,
                 "thoughts": thoughts
             }
@@ -675,7 +911,7 @@ class AIService:
             print(f"Agent Error: {e}")
             import traceback
             traceback.print_exc()
-            return {
+            yield "result", {
                 "answer": "抱歉，我遇到了一些问题，无法处理您的请求。",
                 "thoughts": []
             }
@@ -683,33 +919,29 @@ class AIService:
 ai_service = AIService()
 
 
-import random
-from typing import List, Dict
 
 async def analyze_nutrition(ingredients: List[Dict[str, str]], steps: List[Dict[str, str]]) -> Dict[str, str]:
     """
-    Mock AI service to analyze nutrition based on ingredients and steps.
-    In a real app, this would call an LLM API.
+    Nutrition totals of a recipe from its ingredient list ({name, amount} entries), computed
+    from the local food table; only ingredients it doesn't know are estimated by the LLM.
     """
-    # Simulate processing time or logic
-    
-    # Simple heuristic for demo purposes
-    base_cal = 200
-    base_protein = 10
-    base_fat = 5
-    base_carbs = 20
-    
-    # Add based on number of ingredients
-    factor = len(ingredients)
-    
-    calories = base_cal + (factor * 50) + random.randint(0, 50)
-    protein = base_protein + (factor * 2) + random.randint(0, 5)
-    fat = base_fat + (factor * 1.5) + random.randint(0, 5)
-    carbs = base_carbs + (factor * 4) + random.randint(0, 10)
-    
+    entries = [(item.get("name") or "", item.get("amount")) for item in ingredients if isinstance(item, dict)]
+    result = food_table.analyze(entries)
+    totals = result["totals"]
+    if result["unmatched"]:
+        metrics.incr("nutrition_llm_fallback_items", len(result["unmatched"]), source="recipe")
+        estimates = await health_ai_service.estimate_unmatched(result["unmatched"], [])
+        for text in result["unmatched"]:
+            estimate = estimates["foods"].get(normalize_text(text)) or {}
+            for nutrient in NUTRIENTS:
+                try:
+                    totals[nutrient] += max(float(estimate.get(nutrient) or 0), 0.0)
+                except (TypeError, ValueError):
+                    pass
+
     return {
-        "calories": str(int(calories)),
-        "protein": f"{int(protein)}g",
-        "fat": f"{int(fat)}g",
-        "carbs": f"{int(carbs)}g"
+        "calories": str(round(totals["calories"])),
+        "protein": f"{round(totals['protein'])}g",
+        "fat": f"{round(totals['fat'])}g",
+        "carbs": f"{round(totals['carbs'])}g"
     }
@@ -0,0 +1,199 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Any, Dict, List, Optional, Type
+
+from tortoise import timezone
+from tortoise.exceptions import IntegrityError
+from tortoise.expressions import F
+from tortoise.functions import Count
+
+from app.core.usage import COST_CURRENCY_SYMBOL, UsageRecorder, rollup_rows, usage_recorder
+from app.models.ai_usage import AIActiveUserHour, AIUsageHour, AIUsageMinute
+
+# Background task that moves the in-memory usage aggregates (core/usage.py) into the rollup
+# tables, plus the dashboard summary built from them. Rows are upserted with increments, so
+# several workers can write the same bucket.
+
+AI_USAGE_FLUSH_SECONDS = float(os.getenv("AI_USAGE_FLUSH_SECONDS", "15"))
+# Minute rows are for recent charts only; hour rows are kept
+AI_USAGE_MINUTE_RETENTION_HOURS = int(os.getenv("AI_USAGE_MINUTE_RETENTION_HOURS", "48"))
+# Active-user rows only need to cover the dashboard window and the one before it
+AI_ACTIVE_USER_RETENTION_HOURS = int(os.getenv("AI_ACTIVE_USER_RETENTION_HOURS", "72"))
+
+_SUMMED = ("calls", "units", "prompt_tokens", "completion_tokens", "latency_ms_sum", "cost")
+
+
+def _bucket_time(epoch: int) -> datetime:
+    return datetime.fromtimestamp(epoch, tz=dt_timezone.utc)
+
+
+class UsageRollupWriter:
+    def __init__(self, recorder: UsageRecorder = usage_recorder):
+        self.recorder = recorder
+        self._task: Optional[asyncio.Task] = None
+        self._last_purge = 0.0
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(AI_USAGE_FLUSH_SECONDS)
+            await self.flush()
+            if loop.time() - self._last_purge > 3600:
+                self._last_purge = loop.time()
+                try:
+                    await self.purge_minutes()
+                except Exception as e:
+                    print(f"AI usage purge error: {e}")
+
+    async def flush(self):
+        await self._flush_active()
+        pending = self.recorder.drain()
+        if not pending:
+            return
+        try:
+            for key, values in pending.items():
+                await self._upsert(AIUsageMinute, key, values)
+            for key, values in rollup_rows(pending, 3600):
+                await self._upsert(AIUsageHour, key, values)
+        except Exception as e:
+            # Keep the numbers for the next round rather than losing them
+            # (a partially written round is counted twice in that case)
+            print(f"AI usage rollup error: {e}")
+            self.recorder.restore(pending)
+
+    async def _upsert(self, table: Type[Any], key, values: Dict[str, float]):
+        bucket, feature, model, outcome = key
+        lookup = {"bucket": _bucket_time(bucket), "feature": feature[:50], "model": model[:100], "outcome": outcome[:20]}
+        row = await table.get_or_none(**lookup)
+        if row is None:
+            try:
+                await table.create(**lookup, **values)
+                return
+            except IntegrityError:
+                # Another worker created the bucket first
+                row = await table.get(**lookup)
+        await table.filter(id=row.id).update(
+            **{field: F(field) + values[field] for field in _SUMMED},
+            latency_ms_max=max(row.latency_ms_max, values["latency_ms_max"]),
+        )
+
+    async def _flush_active(self):
+        active = self.recorder.drain_active()
+        if not active:
+            return
+        try:
+            # Rows already written by this or another worker are skipped
+            await AIActiveUserHour.bulk_create(
+                [AIActiveUserHour(bucket=_bucket_time(bucket), user_id=user_id) for bucket, user_id in active],
+                ignore_conflicts=True,
+            )
+        except Exception as e:
+            print(f"AI active user rollup error: {e}")
+            self.recorder.restore_active(active)
+
+    async def purge_minutes(self) -> int:
+        now = timezone.now()
+        await AIActiveUserHour.filter(bucket__lt=now - timedelta(hours=AI_ACTIVE_USER_RETENTION_HOURS)).delete()
+        return await AIUsageMinute.filter(bucket__lt=now - timedelta(hours=AI_USAGE_MINUTE_RETENTION_HOURS)).delete()
+
+
+usage_rollups = UsageRollupWriter()
+
+
+def _summarize(rows: List[AIUsageHour]) -> Dict[str, float]:
+    calls = sum(r.calls for r in rows)
+    succeeded = sum(r.calls for r in rows if r.outcome == "success")
+    return {
+        "calls": calls,
+        "succeeded": succeeded,
+        "tokens": sum(r.prompt_tokens + r.completion_tokens for r in rows),
+        "cost": sum(r.cost for r in rows),
+        "latency_ms_sum": sum(r.latency_ms_sum for r in rows),
+    }
+
+
+def _growth(current: float, previous: float) -> float:
+    if not previous:
+        return 0.0
+    return round((current - previous) / previous, 3)
+
+
+async def _active_users(start: datetime, end: Optional[datetime] = None) -> int:
+    query = AIActiveUserHour.filter(bucket__gte=start)
+    if end is not None:
+        query = query.filter(bucket__lt=end)
+    rows = await query.annotate(users=Count("user_id", distinct=True)).values("users")
+    return rows[0]["users"] if rows else 0
+
+
+async def active_user_summary(hours: int = 24) -> Dict[str, Any]:
+    """
+    Distinct users of AI features over the last `hours` (vs. the period before), counted in the
+    database from the per-hour active-user rollup.
+    """
+    now = timezone.now().replace(minute=0, second=0, microsecond=0)
+    start = now - timedelta(hours=hours - 1)
+    active = await _active_users(start)
+    previous = await _active_users(start - timedelta(hours=hours), start)
+    return {"value": active, "growth": _growth(active, previous), "label": f"{active:,}"}
+
+
+async def usage_summary(hours: int = 24) -> Dict[str, Any]:
+    """
+    AI calls, success rate, latency and cost over the last `hours` (vs. the period before),
+    read from the hour rollups only.
+    """
+    now = timezone.now().replace(minute=0, second=0, microsecond=0)
+    start = now - timedelta(hours=hours - 1)
+    previous_start = start - timedelta(hours=hours)
+    rows = await AIUsageHour.filter(bucket__gte=previous_start)
+    current_rows = [r for r in rows if r.bucket >= start]
+    current = _summarize(current_rows)
+    previous = _summarize([r for r in rows if r.bucket < start])
+
+    by_feature: Dict[str, List[AIUsageHour]] = {}
+    for row in current_rows:
+        by_feature.setdefault(row.feature, []).append(row)
+    features = []
+    for feature, feature_rows in by_feature.items():
+        summary = _summarize(feature_rows)
+        features.append({
+            "feature": feature,
+            "calls": summary["calls"],
+            "success_rate": round(summary["succeeded"] / summary["calls"], 3) if summary["calls"] else 1.0,
+            "avg_latency_ms": round(summary["latency_ms_sum"] / summary["calls"]) if summary["calls"] else 0,
+            "tokens": summary["tokens"],
+            "cost": round(summary["cost"], 4),
+        })
+    features.sort(key=lambda item: item["calls"], reverse=True)
+
+    calls = current["calls"]
+    return {
+        "ai_calls": {
+            "value": calls,
+            "growth": _growth(calls, previous["calls"]),
+            "label": f"{calls:,}",
+            "success_rate": round(current["succeeded"] / calls, 3) if calls else 1.0,
+            "avg_latency_ms": round(current["latency_ms_sum"] / calls) if calls else 0,
+            "tokens": current["tokens"],
+        },
+        "token_cost": {
+            "value": round(current["cost"], 2),
+            "growth": _growth(current["cost"], previous["cost"]),
+            "avg_cost": round(current["cost"] / calls, 4) if calls else 0,
+            "label": f"{COST_CURRENCY_SYMBOL}{current['cost']:,.2f}",
+        },
+        "by_feature": features,
+    }
@@ -6,7 +6,12 @@ from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage, ToolMessage, AIMessage
 from mcp.client.sse import sse_client
 from mcp.client.session import ClientSession
+from app.core.circuit_breaker import get_breaker
 from app.core.config import settings
+from app.core.http_clients import get_http_client
+from app.services.chat_memory import chat_memory, format_summary_prompt
+
+amap_mcp_breaker = get_breaker("amap_mcp")
 
 class AmapMCPService:
     def __init__(self):
@@ -21,10 +26,18 @@ class AmapMCPService:
             model="Qwen/Qwen3-8B", # Use a stronger model for tool calling if possible, or Qwen/Qwen3-8B
             temperature=0.7,
             max_tokens=2048,
+            http_async_client=get_http_client("siliconflow"),
         )
 
     async def chat(self, message: str, history: List[Dict[str, Any]], session_id: int = None) -> Dict[str, Any]:
+        # Don't wait for the SSE connect timeout while the MCP endpoint is known to be down
+        breaker = amap_mcp_breaker
+        if not breaker.allow():
+            breaker.reject()
+            return {"answer": "地图服务暂时不可用，请稍后再试。", "thoughts": []}
+
         print(f"Connecting to MCP: {self.amap_mcp_url}")
+        connected = False
         
         try:
             async with sse_client(self.amap_mcp_url) as streams:
@@ -36,7 +49,10 @@ class AmapMCPService:
                         mcp_tools = await session.list_tools()
                     except Exception as e:
                         print(f"Error listing tools: {e}")
+                        breaker.record_failure()
                         return {"answer": "无法获取地图工具列表。", "thoughts": []}
+                    breaker.record_success()
+                    connected = True
                     
                     # Convert MCP tools to OpenAI tool format
                     openai_tools = []
@@ -61,6 +77,11 @@ class AmapMCPService:
                     system_content = "你是高德地图智能助手。你可以使用工具来查询地点、规划路线、查询天气等。请根据用户的需求调用相应的工具。请用中文回答。"
                     system_content += "\n\n重要规则：\n1. 当用户询问“怎么去某个地方”或“导航到某个地方”且没有明确说明起点时，必须默认使用提供的“User's current location”作为起点（origin）。\n2. 只有在用户明确指定了其他起点时（例如“从天安门到故宫怎么走”），才不使用当前位置作为起点。\n3. 注意坐标格式为 'lng,lat'。\n4. 如果用户询问“我在哪”或者“我的位置”，且你已获取到“User's current location”上下文，请调用 maps_regeocode 工具将该坐标转换为地址，然后告诉用户。"
                     
+                    # Keep the replayed history within the token budget; older turns arrive as a summary
+                    memory_key = str(session_id) if session_id else (history[0].get("content", "") if history else "")
+                    summary, history = chat_memory.compact_client_history(f"maps:{memory_key}", history, self.llm)
+                    system_content += format_summary_prompt(summary)
+                    
                     messages = [
                         SystemMessage(content=system_content)
                     ]
@@ -168,7 +189,13 @@ class AmapMCPService:
                         "tool_results": [t.get("result_data") for t in thoughts if t.get("result_data")]
                     }
 
+        except asyncio.CancelledError:
+            if not connected:
+                breaker.record_abandoned()
+            raise
         except Exception as e:
+            if not connected:
+                breaker.record_failure()
             print(f"MCP Chat Error: {e}")
             import traceback
             traceback.print_exc()
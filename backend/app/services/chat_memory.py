@@ -0,0 +1,201 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.messages import HumanMessage
+
+from app.core import metrics
+from app.core.admission import llm_priority
+from app.core.usage import ai_feature
+from app.models.chat import ChatMessage, ChatSession
+
+# Token budget for verbatim history per turn; anything older is folded into the rolling summary
+CHAT_MEMORY_TOKEN_BUDGET = int(os.getenv("CHAT_MEMORY_TOKEN_BUDGET", "2000"))
+# Always keep at least this many recent messages verbatim, even if they exceed the budget
+CHAT_MEMORY_MIN_RECENT = int(os.getenv("CHAT_MEMORY_MIN_RECENT", "2"))
+# Upper bound on the summary itself, in characters
+CHAT_MEMORY_SUMMARY_CHARS = int(os.getenv("CHAT_MEMORY_SUMMARY_CHARS", "600"))
+# Most unsummarized messages loaded per turn (guards against a summary that keeps failing)
+CHAT_MEMORY_MAX_PENDING = 60
+# Client-side conversations whose summaries are kept in process
+CLIENT_SUMMARY_MAX_ENTRIES = 1000
+
+_CJK = re.compile("[\u2e80-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+SUMMARY_PROMPT = """请将以下对话压缩为一段简洁的摘要，供后续对话作为上下文使用。
+保留：用户的偏好与限制（口味、过敏、目标等）、已经确认的事实和结论、用户尚未完成的请求。
+省略寒暄和重复内容。只输出摘要正文，不超过{limit}字。
+
+已有摘要：
+{previous}
+
+新的对话：
+{transcript}"""
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate without a tokenizer: one token per CJK character,
+    roughly four characters per token for everything else, plus per-message overhead.
+    """
+    if not text:
+        return 4
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4 + 4
+
+
+def _transcript(messages: List[Dict[str, Any]]) -> str:
+    names = {"user": "用户", "assistant": "助手"}
+    return "\n".join(f"{names.get(m['role'], m['role'])}: {m['content']}" for m in messages)
+
+
+class ChatMemory:
+    """
+    Token-budgeted conversation memory.
+    Recent turns are kept verbatim up to `budget` tokens; older turns are compressed
+    into a rolling summary that is regenerated in the background, so prompt size per turn
+    stays bounded regardless of conversation length.
+    """
+
+    def __init__(self, budget: int = None, min_recent: int = None):
+        self.budget = budget or CHAT_MEMORY_TOKEN_BUDGET
+        self.min_recent = min_recent if min_recent is not None else CHAT_MEMORY_MIN_RECENT
+        # Background summary tasks by key; at most one per session
+        self._tasks: Dict[str, asyncio.Task] = {}
+        # Client-side histories (no ChatSession): key -> (prefix length, prefix hash, summary)
+        self._prefix_summaries: "OrderedDict[str, Tuple[int, str, str]]" = OrderedDict()
+
+    def split(self, history: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Return (older, recent): the newest messages that fit the budget, and everything before them."""
+        used = 0
+        cut = len(history)
+        for index in range(len(history) - 1, -1, -1):
+            used += estimate_tokens(history[index].get("content") or "")
+            kept = len(history) - index
+            if used > self.budget and kept > self.min_recent:
+                break
+            cut = index
+        return history[:cut], history[cut:]
+
+    async def summarize(self, llm, previous: Optional[str], messages: List[Dict[str, Any]]) -> str:
+        prompt = SUMMARY_PROMPT.format(
+            limit=CHAT_MEMORY_SUMMARY_CHARS // 2,
+            previous=previous or "无",
+            transcript=_transcript(messages),
+        )
+        response = await llm.ainvoke([HumanMessage(content=prompt)])
+        summary = response.content.strip()
+        # Reasoning models may prepend <think>...</think>
+        if "</think>" in summary:
+            summary = summary.split("</think>", 1)[1].strip()
+        metrics.incr("chat_memory_summaries")
+        return summary[:CHAT_MEMORY_SUMMARY_CHARS]
+
+    @staticmethod
+    async def _in_background(coro):
+        # Summaries are spawned from chat requests; they must not queue as interactive calls
+        with llm_priority("background"), ai_feature("chat-summary"):
+            return await coro
+
+    def _schedule(self, key: str, coro):
+        task = self._tasks.get(key)
+        if task is not None and not task.done():
+            # A refresh is already running; the next turn will pick up whatever it missed
+            coro.close()
+            return
+        task = asyncio.create_task(self._in_background(coro))
+        self._tasks[key] = task
+        task.add_done_callback(lambda t, key=key: self._tasks.pop(key, None) if self._tasks.get(key) is t else None)
+
+    # --- Persisted sessions (ChatSession / ChatMessage) ---
+
+    async def load_session_history(self, session: ChatSession, before_id: int, llm) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+        """
+        Context for the next turn of `session`: (summary, recent messages).
+        `before_id` excludes the message that is being answered.
+        If some unsummarized messages no longer fit the budget, a background refresh folds them into the summary.
+        """
+        rows = await ChatMessage.filter(
+            session_id=session.id,
+            id__gt=session.summary_message_id or 0,
+            id__lt=before_id,
+        ).order_by("-id").limit(CHAT_MEMORY_MAX_PENDING).values("id", "role", "content")
+        # Only the text columns: the compressed thoughts payload isn't needed for context
+        history = list(reversed(rows))
+        older, recent = self.split(history)
+        if older:
+            self._schedule(f"session:{session.id}", self._refresh_session_summary(session.id, llm))
+        metrics.observe("chat_memory_prompt_tokens", sum(estimate_tokens(m["content"]) for m in recent))
+        return session.summary, [{"role": m["role"], "content": m["content"]} for m in recent]
+
+    async def _refresh_session_summary(self, session_id: int, llm):
+        try:
+            session = await ChatSession.get_or_none(id=session_id)
+            if not session:
+                return
+            rows = await ChatMessage.filter(
+                session_id=session_id, id__gt=session.summary_message_id or 0
+            ).order_by("id").values("id", "role", "content")
+            history = list(rows)
+            older, _ = self.split(history)
+            if not older:
+                return
+            summary = await self.summarize(llm, session.summary, older)
+            # Only the memory columns: don't clobber a concurrent title update
+            await ChatSession.filter(id=session_id).update(
+                summary=summary, summary_message_id=older[-1]["id"]
+            )
+        except Exception as e:
+            print(f"Chat memory summary error (session {session_id}): {e}")
+
+    # --- Client-supplied histories (e.g. /maps/chat) ---
+
+    def compact_client_history(self, key: str, history: List[Dict[str, Any]], llm) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+        """
+        Same budget for histories the client sends with every request.
+        The summary is kept in process, keyed by conversation, and reused while the client
+        keeps sending the same prefix.
+        """
+        older, recent = self.split(history)
+        if not older:
+            return None, recent
+
+        summary = None
+        covered = 0
+        cached = self._prefix_summaries.get(key)
+        if cached:
+            length, prefix_hash, cached_summary = cached
+            if length <= len(older) and self._hash(older[:length]) == prefix_hash:
+                summary, covered = cached_summary, length
+        if covered < len(older):
+            self._schedule(f"client:{key}", self._refresh_client_summary(key, older, summary, covered, llm))
+        return summary, recent
+
+    async def _refresh_client_summary(self, key: str, older: List[Dict[str, Any]], previous: Optional[str], covered: int, llm):
+        try:
+            summary = await self.summarize(llm, previous, older[covered:])
+            self._prefix_summaries[key] = (len(older), self._hash(older), summary)
+            self._prefix_summaries.move_to_end(key)
+            while len(self._prefix_summaries) > CLIENT_SUMMARY_MAX_ENTRIES:
+                self._prefix_summaries.popitem(last=False)
+        except Exception as e:
+            print(f"Chat memory summary error ({key}): {e}")
+
+    @staticmethod
+    def _hash(messages: List[Dict[str, Any]]) -> str:
+        raw = json.dumps([(m.get("role"), m.get("content")) for m in messages], ensure_ascii=False)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+chat_memory = ChatMemory()
+
+
+def format_summary_prompt(summary: Optional[str]) -> str:
+    """System prompt suffix carrying the rolling summary (empty when there is none)."""
+    if not summary:
+        return ""
+    return f"\n\n此前对话摘要（较早的消息已压缩）：\n{summary}"
@@ -0,0 +1,132 @@
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+
+from tortoise.exceptions import IntegrityError
+from tortoise.expressions import Q
+from tortoise.functions import Count, Sum
+
+from app.models.health import CheckInRollup, CheckInStreak, DailyCheckIn
+
+# Check-in analytics.
+# Every check-in write refreshes the week and month rollup rows it falls in (one SQL aggregate
+# over at most a month of rows) and the user's streak, so summaries and the calendar are served
+# from small tables instead of shipping raw check-ins (with all their meal text) to the client.
+
+PERIODS = ("week", "month")
+STATUSES = ("white", "orange", "red")
+# Heatmap code per day: "0" means no check-in
+STATUS_CODES = {"white": "1", "orange": "2", "red": "3"}
+
+
+def period_start(day: date, period: str) -> date:
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def period_end(start: date, period: str) -> date:
+    """First day after the period."""
+    if period == "week":
+        return start + timedelta(days=7)
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+async def refresh_rollups(user_id: int, day: date):
+    """Recompute the week and month rows that contain `day` from the check-ins themselves."""
+    for period in PERIODS:
+        start = period_start(day, period)
+        rows = await (
+            DailyCheckIn.filter(user_id=user_id, date__gte=start, date__lt=period_end(start, period))
+            .annotate(
+                days=Count("id"),
+                calories_in=Sum("total_calories_in"),
+                calories_burned=Sum("total_calories_burned"),
+                **{f"{status}_days": Count("id", _filter=Q(status=status)) for status in STATUSES},
+            )
+            .values("days", "calories_in", "calories_burned", *(f"{status}_days" for status in STATUSES))
+        )
+        values = {key: int(value or 0) for key, value in (rows[0] if rows else {}).items()}
+        lookup = {"user_id": user_id, "period": period, "period_start": start}
+        updated = await CheckInRollup.filter(**lookup).update(**values)
+        if not updated:
+            try:
+                await CheckInRollup.create(**lookup, **values)
+            except IntegrityError:
+                # Another request created the row first
+                await CheckInRollup.filter(**lookup).update(**values)
+
+
+async def refresh_streak(user_id: int):
+    """Recompute streaks from the user's check-in dates (only dates are read)."""
+    dates = await DailyCheckIn.filter(user_id=user_id).order_by("date").values_list("date", flat=True)
+    longest, run, previous = 0, 0, None
+    for day in dates:
+        run = run + 1 if previous is not None and day - previous == timedelta(days=1) else 1
+        longest = max(longest, run)
+        previous = day
+    values = {"last_date": previous, "current_streak": run, "longest_streak": longest, "total_days": len(dates)}
+    updated = await CheckInStreak.filter(user_id=user_id).update(**values)
+    if not updated:
+        try:
+            await CheckInStreak.create(user_id=user_id, **values)
+        except IntegrityError:
+            await CheckInStreak.filter(user_id=user_id).update(**values)
+
+
+async def record_checkin(user_id: int, day: date, is_new: bool):
+    await refresh_rollups(user_id, day)
+    if is_new:
+        # Edits of an existing day can't change which days are checked in
+        await refresh_streak(user_id)
+
+
+async def rebuild_user(user_id: int) -> int:
+    """Rebuild all rollups and the streak of a user (backfill / repair). Returns the periods written."""
+    dates = await DailyCheckIn.filter(user_id=user_id).values_list("date", flat=True)
+    starts = {period_start(day, "month"): day for day in dates}
+    starts.update({period_start(day, "week"): day for day in dates})
+    for day in starts.values():
+        await refresh_rollups(user_id, day)
+    await refresh_streak(user_id)
+    return len(starts)
+
+
+def _period_to_dict(row: CheckInRollup) -> Dict[str, Any]:
+    days = row.days or 0
+    return {
+        "period_start": row.period_start,
+        "days": days,
+        "calories_in": row.calories_in,
+        "calories_burned": row.calories_burned,
+        "avg_calories_in": round(row.calories_in / days) if days else 0,
+        "avg_calories_burned": round(row.calories_burned / days) if days else 0,
+        "status_counts": {status: getattr(row, f"{status}_days") for status in STATUSES},
+    }
+
+
+async def checkin_stats(user_id: int, period: str, limit: int, today: Optional[date] = None) -> Dict[str, Any]:
+    today = today or date.today()
+    rows = await CheckInRollup.filter(user_id=user_id, period=period).order_by("-period_start").limit(limit)
+    streak = await CheckInStreak.get_or_none(user_id=user_id)
+    current = 0
+    if streak and streak.last_date and streak.last_date >= today - timedelta(days=1):
+        # A streak is still alive until a full day is missed
+        current = streak.current_streak
+    return {
+        "period": period,
+        "periods": [_period_to_dict(row) for row in rows],
+        "current_streak": current,
+        "longest_streak": streak.longest_streak if streak else 0,
+        "total_days": streak.total_days if streak else 0,
+        "last_date": streak.last_date if streak else None,
+    }
+
+
+async def checkin_heatmap(user_id: int, year: int) -> str:
+    """One character per day of `year` (see STATUS_CODES)."""
+    start = date(year, 1, 1)
+    days: List[str] = ["0"] * (date(year + 1, 1, 1) - start).days
+    rows = await DailyCheckIn.filter(user_id=user_id, date__gte=start, date__lt=date(year + 1, 1, 1)).values_list("date", "status")
+    for day, status in rows:
+        days[(day - start).days] = STATUS_CODES.get(status, "1")
+    return "".join(days)
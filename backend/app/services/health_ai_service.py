@@ -1,16 +1,73 @@
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import PromptTemplate
 from app.core.config import settings
-from typing import Dict, Any, Optional
+from app.core.http_clients import get_http_client
+from app.core import metrics
+from app.services.ai_cache import ai_cache, normalize_list, normalize_text
+from app.services.model_router import model_router
+from app.services.nutrition import exercise_table, food_table, split_items
+from typing import Dict, Any, List, Optional
 import json
-import os
-import asyncio
+
+# Health profile math, done locally: BMI (Chinese adult cut-offs) and the Mifflin-St Jeor
+# daily calorie target. Only the advice text comes from the LLM, cached per (BMI bucket, goal).
+
+ACTIVITY_FACTORS = {"sedentary": 1.2, "light": 1.375, "moderate": 1.55, "active": 1.725, "very_active": 1.9}
+GOAL_ADJUSTMENTS = {"lose": -500, "maintain": 0, "gain": 300}
+GOAL_LABELS = {"lose": "减脂", "maintain": "保持体重", "gain": "增重增肌"}
+BMI_BUCKET_LABELS = {"underweight": "偏瘦(BMI<18.5)", "normal": "正常(18.5-24)", "overweight": "超重(24-28)", "obese": "肥胖(BMI≥28)"}
+# Used when the profile doesn't say
+DEFAULT_AGE = 30
+DEFAULT_ACTIVITY_LEVEL = "light"
+MIN_CALORIE_TARGET = 1200
+
+DEFAULT_DIETARY_ADVICE = "无法生成建议，请保持均衡饮食。"
+DEFAULT_EXERCISE_ADVICE = "建议每周进行150分钟中等强度运动。"
+
+
+def bmi(height: float, weight: float) -> float:
+    meters = height / 100
+    return weight / (meters * meters) if meters > 0 else 0.0
+
+
+def bmi_bucket(value: float) -> str:
+    if value < 18.5:
+        return "underweight"
+    if value < 24:
+        return "normal"
+    if value < 28:
+        return "overweight"
+    return "obese"
+
+
+def default_goal(bucket: str) -> str:
+    return {"underweight": "gain", "overweight": "lose", "obese": "lose"}.get(bucket, "maintain")
+
+
+def calorie_target(
+    height: float,
+    weight: float,
+    gender: Optional[str] = None,
+    age: Optional[int] = None,
+    activity_level: Optional[str] = None,
+    goal: str = "maintain",
+) -> int:
+    """Mifflin-St Jeor BMR x activity factor, adjusted for the goal and rounded to 10 kcal."""
+    offset = {"male": 5, "female": -161}.get(gender, -78)  # midpoint when gender is unknown
+    bmr = 10 * weight + 6.25 * height - 5 * (age or DEFAULT_AGE) + offset
+    tdee = bmr * ACTIVITY_FACTORS.get(activity_level or DEFAULT_ACTIVITY_LEVEL, ACTIVITY_FACTORS[DEFAULT_ACTIVITY_LEVEL])
+    target = tdee + GOAL_ADJUSTMENTS.get(goal, 0)
+    return int(round(max(target, MIN_CALORIE_TARGET) / 10) * 10)
+
+
+def advice_key(bucket: str, goal: str) -> str:
+    return f"{bucket}:{goal}"
+
 
 class HealthAIService:
     def __init__(self):
         self.base_url = settings.SILICONFLOW_BASE_URL
         self.api_key = settings.SILICONFLOW_API_KEY
-        self.timeout_seconds = float(os.getenv("AI_TIMEOUT_SECONDS", "60"))
         
         self.llm = ChatOpenAI(
             base_url=self.base_url,
@@ -18,11 +75,9 @@ class HealthAIService:
             model="Qwen/Qwen3-8B",
             temperature=0.7,
             max_tokens=2048,
+            http_async_client=get_http_client("siliconflow"),
         )
 
-    async def _with_timeout(self, coro):
-        return await asyncio.wait_for(coro, timeout=self.timeout_seconds)
-
     def _extract_json(self, content: str) -> Any:
         try:
             content = content.strip()
@@ -37,75 +92,139 @@ class HealthAIService:
             print(f"JSON Extraction Error: {e} for content: {content[:100]}...")
             return None
 
-    async def calculate_health_profile(self, height: float, weight: float) -> Dict[str, Any]:
-        template = """你是一个专业的健康营养师。请根据用户的身高和体重，计算每日推荐摄入热量，并给出饮食和运动建议。
-        
-        用户身高: {height} cm
-        用户体重: {weight} kg
-        
+    async def cached_advice(self, bmi_bucket: str, goal: str) -> Optional[Dict[str, Any]]:
+        """Advice already generated for (BMI bucket, goal), without calling the model."""
+        key = ai_cache.make_key("health-advice", self.llm.model_name, {"bmi": bmi_bucket, "goal": goal})
+        return await ai_cache.get("health-advice", key)
+
+    async def generate_advice(self, bmi_bucket: str, goal: str, use_cache: bool = True) -> Optional[Dict[str, Any]]:
+        template = """你是一个专业的健康营养师。请根据用户的BMI分类和目标，给出饮食和运动建议。
+
+        BMI分类: {bmi}
+        目标: {goal}
+
         请返回严格的JSON格式：
         {{
-            "daily_calorie_target": 2000,
             "dietary_advice": "建议多吃...",
             "exercise_advice": "建议每周..."
         }}
-        
+
         注意：
-        1. daily_calorie_target 必须是整数。
-        2. 建议要具体且实用。
-        3. 只返回JSON，不要其他废话。"""
-        
+        1. 建议要具体且实用。
+        2. 只返回JSON，不要其他废话。"""
+
         prompt = PromptTemplate.from_template(template)
-        chain = prompt | self.llm
-        
-        response = await self._with_timeout(chain.ainvoke({"height": height, "weight": weight}))
-        data = self._extract_json(response.content)
-        if not data:
-            return {
-                "daily_calorie_target": 2000,
-                "dietary_advice": "无法生成建议，请保持均衡饮食。",
-                "exercise_advice": "建议每周进行150分钟中等强度运动。"
-            }
-        return data
-
-    async def calculate_daily_log(self, breakfast: Optional[str], lunch: Optional[str], dinner: Optional[str], exercise: Optional[str]) -> Dict[str, Any]:
-        template = """你是一个卡路里计算助手。请根据用户提供的早中晚摄入食物和运动情况，估算总摄入热量和总消耗热量。
-        
-        早餐: {breakfast}
-        午餐: {lunch}
-        晚餐: {dinner}
-        运动: {exercise}
-        
-        如果用户未提供某项，请视为0。
-        
-        请返回严格的JSON格式：
+        inputs = {"bmi": BMI_BUCKET_LABELS.get(bmi_bucket, bmi_bucket), "goal": GOAL_LABELS.get(goal, goal)}
+
+        async def generate():
+            response = await model_router.invoke("health-advice", self.llm, lambda llm: (prompt | llm).ainvoke(inputs))
+            data = self._extract_json(response.content)
+            if not isinstance(data, dict) or not data.get("dietary_advice"):
+                return None
+            return {"dietary_advice": str(data["dietary_advice"]), "exercise_advice": str(data.get("exercise_advice") or "")}
+
+        return await ai_cache.get_or_generate(
+            "health-advice",
+            self.llm.model_name,
+            {"bmi": bmi_bucket, "goal": goal},
+            generate,
+            use_cache=use_cache,
+        )
+
+    async def estimate_unmatched(self, foods: List[str], exercises: List[str], use_cache: bool = True) -> Dict[str, Any]:
+        """
+        LLM estimate for the foods / activities the local tables don't know.
+        Returns {"foods": {text: {calories, protein, fat, carbs}}, "exercises": {text: calories}}.
+        """
+        template = """你是一个营养与运动热量估算助手。请估算下面每一项食物（按描述的分量）的热量和营养素，以及每一项运动消耗的热量。
+
+        食物: {foods}
+        运动: {exercises}
+
+        请返回严格的JSON格式，键使用原始描述：
         {{
-            "total_calories_in": 1500,
-            "total_calories_burned": 300,
-            "breakdown": "早餐约400大卡，午餐..."
+            "foods": {{"螺蛳粉一碗": {{"calories": 550, "protein": 15, "fat": 20, "carbs": 75}}}},
+            "exercises": {{"冥想10分钟": 15}}
         }}
-        
+
         注意：
-        1. total_calories_in 和 total_calories_burned 必须是整数。
-        2. breakdown 是对计算过程的简要说明。
+        1. 数值均为整数，营养素单位为克，热量单位为大卡。
+        2. 没有分量时按一人份估算，没有时长时按30分钟估算。
         3. 只返回JSON，不要其他废话。"""
-        
+
         prompt = PromptTemplate.from_template(template)
-        chain = prompt | self.llm
-        
-        response = await self._with_timeout(chain.ainvoke({
-            "breakfast": breakfast or "无",
-            "lunch": lunch or "无",
-            "dinner": dinner or "无",
-            "exercise": exercise or "无"
-        }))
-        data = self._extract_json(response.content)
-        if not data:
-            return {
-                "total_calories_in": 0,
-                "total_calories_burned": 0,
-                "breakdown": "AI计算失败，请手动输入。"
-            }
-        return data
+        foods = normalize_list(foods)
+        exercises = normalize_list(exercises)
+        inputs = {
+            "foods": json.dumps(foods, ensure_ascii=False) if foods else "无",
+            "exercises": json.dumps(exercises, ensure_ascii=False) if exercises else "无",
+        }
+
+        async def generate():
+            response = await model_router.invoke("food-estimate", self.llm, lambda llm: (prompt | llm).ainvoke(inputs))
+            return self._extract_json(response.content)
+
+        data = await ai_cache.get_or_generate(
+            "food-estimate",
+            self.llm.model_name,
+            {"foods": foods, "exercises": exercises},
+            generate,
+            use_cache=use_cache,
+        )
+        if not isinstance(data, dict):
+            return {"foods": {}, "exercises": {}}
+        # Keys come back normalized (lowercase / single spaces); look them up the same way
+        return {
+            "foods": {normalize_text(k): v for k, v in (data.get("foods") or {}).items() if isinstance(v, dict)},
+            "exercises": {normalize_text(k): v for k, v in (data.get("exercises") or {}).items()},
+        }
+
+    async def calculate_daily_log(self, breakfast: Optional[str], lunch: Optional[str], dinner: Optional[str], exercise: Optional[str], use_cache: bool = True) -> Dict[str, Any]:
+        """Calories in/out for a day; foods and activities in the local tables never reach the LLM."""
+        meals = {"早餐": breakfast, "午餐": lunch, "晚餐": dinner}
+        results = {label: food_table.analyze((item, None) for item in split_items(text)) for label, text in meals.items()}
+        activity = exercise_table.analyze(split_items(exercise))
+
+        unmatched_foods = [item for result in results.values() for item in result["unmatched"]]
+        estimates = {"foods": {}, "exercises": {}}
+        if unmatched_foods or activity["unmatched"]:
+            metrics.incr("nutrition_llm_fallback_items", len(unmatched_foods) + len(activity["unmatched"]), source="daily-log")
+            estimates = await self.estimate_unmatched(unmatched_foods, activity["unmatched"], use_cache=use_cache)
+
+        total_in = 0.0
+        parts = []
+        for label, result in results.items():
+            meal_calories = result["totals"]["calories"]
+            details = [f"{item['food']}{item['grams']}克{item['calories']}大卡" for item in result["items"]]
+            for text in result["unmatched"]:
+                calories = _number((estimates["foods"].get(normalize_text(text)) or {}).get("calories"))
+                meal_calories += calories
+                details.append(f"{text}约{round(calories)}大卡" if calories else f"{text}未识别")
+            total_in += meal_calories
+            if details:
+                parts.append(f"{label}约{round(meal_calories)}大卡（{'、'.join(details)}）")
+
+        total_burned = activity["calories"]
+        details = [f"{item['text']}{item['calories']}大卡" for item in activity["items"]]
+        for text in activity["unmatched"]:
+            calories = _number(estimates["exercises"].get(normalize_text(text)))
+            total_burned += calories
+            details.append(f"{text}约{round(calories)}大卡" if calories else f"{text}未识别")
+        if details:
+            parts.append(f"运动消耗约{round(total_burned)}大卡（{'、'.join(details)}）")
+
+        return {
+            "total_calories_in": round(total_in),
+            "total_calories_burned": round(total_burned),
+            "breakdown": "；".join(parts) or "未记录饮食和运动。",
+        }
+
+
+def _number(value: Any) -> float:
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
 
 health_ai_service = HealthAIService()
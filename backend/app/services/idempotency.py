@@ -0,0 +1,153 @@
+import asyncio
+import copy
+import hashlib
+import json
+import os
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from tortoise import timezone
+from tortoise.exceptions import IntegrityError
+
+from app.core import metrics
+from app.models.ai_cache import IdempotencyRecord
+
+# Idempotency-Key support for AI POST endpoints.
+# Mobile clients retry on flaky networks; with a key, a retry of a request that is still running
+# attaches to the original, and a retry of a finished one gets the stored response back, so the
+# generation (and its AILog / ChatMessage rows) happens once.
+
+# How long a completed response can be replayed
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+# An in-progress record older than this is treated as abandoned (worker died) and can be taken over
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "300"))
+# How often a retry polls for a request that is running on another worker
+IDEMPOTENCY_POLL_SECONDS = 0.5
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyError(Exception):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+def request_hash(endpoint: str, payload: Any) -> str:
+    raw = json.dumps({"endpoint": endpoint, "payload": payload}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    Runs keyed requests at most once per (user, key).
+    In-process retries share the running task; retries on other workers wait on the DB record.
+    The task is detached from the request that started it: if that client goes away, the work
+    still finishes and is stored, which is exactly what its retry is going to ask for.
+    """
+
+    def __init__(self):
+        self._running: Dict[Tuple[int, str], Tuple[str, asyncio.Task]] = {}
+
+    async def run(
+        self,
+        user_id: int,
+        key: str,
+        endpoint: str,
+        payload: Any,
+        producer: Callable[[], Awaitable[Any]],
+    ) -> Tuple[Any, bool]:
+        """
+        Return (response, replayed). `payload` is the request body; reusing a key with a
+        different body or endpoint raises IdempotencyError(422).
+        """
+        fingerprint = request_hash(endpoint, payload)
+        slot = (user_id, key)
+        deadline = asyncio.get_running_loop().time() + IDEMPOTENCY_LOCK_SECONDS
+
+        while True:
+            running = self._running.get(slot)
+            if running is not None:
+                self._check_fingerprint(running[0], fingerprint)
+                metrics.incr("idempotency_requests", endpoint=endpoint, result="attached")
+                return copy.deepcopy(await asyncio.shield(running[1])), True
+
+            record = await self._load(user_id, key)
+            if record is not None:
+                self._check_fingerprint(record.request_hash, fingerprint)
+                if record.status == "completed":
+                    metrics.incr("idempotency_requests", endpoint=endpoint, result="replayed")
+                    return record.response, True
+                # Running on another worker: wait for its result
+                if asyncio.get_running_loop().time() >= deadline:
+                    metrics.incr("idempotency_requests", endpoint=endpoint, result="conflict")
+                    raise IdempotencyError(409, "A request with this Idempotency-Key is still in progress")
+                await asyncio.sleep(IDEMPOTENCY_POLL_SECONDS)
+                continue
+
+            if await self._claim(user_id, key, endpoint, fingerprint):
+                break
+            # Lost the race to another worker; loop round and wait for it
+
+        metrics.incr("idempotency_requests", endpoint=endpoint, result="executed")
+        task = asyncio.create_task(self._execute(slot, endpoint, producer))
+        self._running[slot] = (fingerprint, task)
+        task.add_done_callback(lambda _: self._running.pop(slot, None))
+        return copy.deepcopy(await asyncio.shield(task)), False
+
+    @staticmethod
+    def _check_fingerprint(stored: str, fingerprint: str):
+        if stored != fingerprint:
+            raise IdempotencyError(422, "Idempotency-Key was already used for a different request")
+
+    async def _load(self, user_id: int, key: str):
+        try:
+            record = await IdempotencyRecord.get_or_none(user_id=user_id, key=key)
+        except Exception as e:
+            print(f"Idempotency read error: {e}")
+            return None
+        if record is not None and record.expires_at <= timezone.now():
+            # Expired replay or abandoned lock: the key is free again
+            await IdempotencyRecord.filter(id=record.id).delete()
+            return None
+        return record
+
+    async def _claim(self, user_id: int, key: str, endpoint: str, fingerprint: str) -> bool:
+        try:
+            await IdempotencyRecord.create(
+                user_id=user_id,
+                key=key,
+                endpoint=endpoint,
+                request_hash=fingerprint,
+                expires_at=timezone.now() + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS),
+            )
+            return True
+        except IntegrityError:
+            return False
+
+    async def _execute(self, slot: Tuple[int, str], endpoint: str, producer: Callable[[], Awaitable[Any]]) -> Any:
+        user_id, key = slot
+        try:
+            response = await producer()
+        except BaseException:
+            # Failures aren't stored: the client's retry should get a fresh attempt
+            try:
+                await IdempotencyRecord.filter(user_id=user_id, key=key, status="in_progress").delete()
+            except Exception as e:
+                print(f"Idempotency release error ({endpoint}): {e}")
+            raise
+        try:
+            await IdempotencyRecord.filter(user_id=user_id, key=key).update(
+                status="completed",
+                response=response,
+                expires_at=timezone.now() + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS),
+            )
+        except Exception as e:
+            print(f"Idempotency write error ({endpoint}): {e}")
+        return response
+
+    async def purge_expired(self) -> int:
+        return await IdempotencyRecord.filter(expires_at__lte=timezone.now()).delete()
+
+
+idempotency_store = IdempotencyStore()
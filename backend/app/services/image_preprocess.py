@@ -0,0 +1,119 @@
+import asyncio
+import base64
+import io
+import os
+from collections import OrderedDict
+from typing import Optional
+
+from app.core import metrics
+from app.services.vision_cache import dhash_image
+
+# Pillow is optional: without it images are sent to the vision model as-is
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+    ImageOps = None
+
+# The vision models downsample internally; anything beyond this is upload time and tokens for nothing
+VISION_MAX_SIDE = int(os.getenv("VISION_MAX_SIDE", "1024"))
+VISION_JPEG_QUALITY = int(os.getenv("VISION_JPEG_QUALITY", "85"))
+
+
+class PreparedImage:
+    """A vision-ready payload: data URI plus the perceptual hash of the decoded image."""
+
+    __slots__ = ("data_uri", "image_hash")
+
+    def __init__(self, data_uri: str, image_hash: Optional[int]):
+        self.data_uri = data_uri
+        self.image_hash = image_hash
+
+
+def _encode_data_uri(image_data: bytes, mime_type: str) -> str:
+    encoded_string = base64.b64encode(image_data).decode('utf-8')
+    return f"data:{mime_type};base64,{encoded_string}"
+
+
+def preprocess_image(image_data: bytes, mime_type: str, max_side: int = None, quality: int = None) -> PreparedImage:
+    """
+    Decode once, then from the same decoded image:
+    - compute the dHash used by the vision result cache
+    - apply EXIF orientation, drop EXIF/ICC metadata, flatten alpha
+    - shrink so the longest side is at most `max_side` and re-encode as JPEG
+    CPU-bound; call through asyncio.to_thread.
+    """
+    if Image is None:
+        return PreparedImage(_encode_data_uri(image_data, mime_type), None)
+
+    max_side = max_side or VISION_MAX_SIDE
+    quality = quality or VISION_JPEG_QUALITY
+    try:
+        with Image.open(io.BytesIO(image_data)) as img:
+            # JPEG fast path: let libjpeg decode at a reduced scale close to the target size
+            img.draft("RGB", (max_side, max_side))
+            img = ImageOps.exif_transpose(img)
+            image_hash = dhash_image(img)
+
+            if img.mode in ("RGBA", "LA", "P"):
+                img = img.convert("RGBA")
+                background = Image.new("RGB", img.size, (255, 255, 255))
+                background.paste(img, mask=img.split()[-1])
+                img = background
+            elif img.mode != "RGB":
+                img = img.convert("RGB")
+
+            img.thumbnail((max_side, max_side), Image.LANCZOS)
+            buffer = io.BytesIO()
+            # No exif/icc_profile passed -> metadata (GPS, device info) is stripped
+            img.save(buffer, format="JPEG", quality=quality, optimize=True)
+            encoded = buffer.getvalue()
+    except Exception as e:
+        print(f"Image preprocess error: {e}")
+        return PreparedImage(_encode_data_uri(image_data, mime_type), None)
+
+    metrics.incr("vision_preprocess_bytes_in", len(image_data))
+    metrics.incr("vision_preprocess_bytes_out", len(encoded))
+    return PreparedImage(_encode_data_uri(encoded, "image/jpeg"), image_hash)
+
+
+class ImagePayloadCache:
+    """
+    LRU of prepared payloads keyed by remote URL or local path + mtime, bounded by total bytes.
+    A hit skips the download, decode, resize and base64 steps entirely.
+    """
+
+    def __init__(self, max_bytes: int = None):
+        self.max_bytes = max_bytes or int(os.getenv("IMAGE_PAYLOAD_CACHE_MB", "64")) * 1024 * 1024
+        self._items: "OrderedDict[str, PreparedImage]" = OrderedDict()
+        self._size = 0
+
+    def get(self, key: str) -> Optional[PreparedImage]:
+        item = self._items.get(key)
+        if item is None:
+            metrics.incr("image_payload_cache_requests", result="miss")
+            return None
+        self._items.move_to_end(key)
+        metrics.incr("image_payload_cache_requests", result="hit")
+        return item
+
+    def set(self, key: str, item: PreparedImage):
+        size = len(item.data_uri)
+        if size > self.max_bytes:
+            return
+        old = self._items.pop(key, None)
+        if old is not None:
+            self._size -= len(old.data_uri)
+        self._items[key] = item
+        self._size += size
+        while self._size > self.max_bytes and self._items:
+            _, evicted = self._items.popitem(last=False)
+            self._size -= len(evicted.data_uri)
+        metrics.set_gauge("image_payload_cache_bytes", self._size)
+
+
+image_payload_cache = ImagePayloadCache()
+
+
+async def prepare_image(image_data: bytes, mime_type: str) -> PreparedImage:
+    return await asyncio.to_thread(preprocess_image, image_data, mime_type)
@@ -1,8 +1,52 @@
-import httpx
+import copy
+import json
+import os
+from collections import OrderedDict
+from typing import Any, Dict
+
+from app.core import metrics
+from app.core.circuit_breaker import CircuitOpenError
 from app.core.config import settings
+from app.core.http_clients import get_http_client
 
 AMAP_BASE_URL = "https://restapi.amap.com/v3"
 
+# Last good response per query, served while Amap is failing or its circuit is open
+AMAP_FALLBACK_CACHE_SIZE = int(os.getenv("AMAP_FALLBACK_CACHE_SIZE", "500"))
+_fallback_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+
+def _fallback_key(path: str, params: Dict[str, Any]) -> str:
+    return path + "?" + json.dumps({k: v for k, v in params.items() if k != "key"}, sort_keys=True, ensure_ascii=False)
+
+
+async def amap_get(path: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    GET an Amap REST endpoint and return its JSON.
+    On failure the last good response for the same query is returned, else {"status": "0", "info": ...}.
+    """
+    key = _fallback_key(path, params)
+    client = get_http_client("amap")
+    try:
+        response = await client.get(f"{AMAP_BASE_URL}{path}", params=params)
+        data = response.json()
+    except Exception as e:
+        cached = _fallback_cache.get(key)
+        if cached is not None:
+            metrics.incr("amap_fallback", result="stale")
+            return copy.deepcopy(cached)
+        metrics.incr("amap_fallback", result="miss")
+        print(f"Amap request {path} failed: {e}")
+        return {"status": "0", "info": "SERVICE_UNAVAILABLE" if isinstance(e, CircuitOpenError) else str(e)}
+
+    if data.get("status") == "1":
+        _fallback_cache[key] = data
+        _fallback_cache.move_to_end(key)
+        if len(_fallback_cache) > AMAP_FALLBACK_CACHE_SIZE:
+            _fallback_cache.popitem(last=False)
+    return data
+
+
 async def geocode_address(address: str, city: str = None):
     """
     Geocoding: convert address to lng,lat
@@ -17,15 +61,9 @@ async def geocode_address(address: str, city: str = None):
     if city:
         params["city"] = city
         
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(f"{AMAP_BASE_URL}/geocode/geo", params=params)
-            data = response.json()
-            if data.get("status") == "1" and data.get("geocodes"):
-                return data["geocodes"][0] # Returns {location: "lng,lat", ...}
-        except Exception as e:
-            print(f"Geocoding error: {e}")
-            return None
+    data = await amap_get("/geocode/geo", params)
+    if data.get("status") == "1" and data.get("geocodes"):
+        return data["geocodes"][0] # Returns {location: "lng,lat", ...}
     return None
 
 async def search_location_api(keywords: str, city: str = None, page: int = 1, page_size: int = 20):
@@ -43,12 +81,7 @@ async def search_location_api(keywords: str, city: str = None, page: int = 1, pa
     if city:
         params["city"] = city
 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(f"{AMAP_BASE_URL}/place/text", params=params)
-            return response.json()
-        except Exception:
-            return None
+    return await amap_get("/place/text", params)
 
 async def regeocode_location_api(location: str):
     if not settings.AMAP_API_KEY:
@@ -62,9 +95,4 @@ async def regeocode_location_api(location: str):
         "roadlevel": 0
     }
         
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(f"{AMAP_BASE_URL}/geocode/regeo", params=params)
-            return response.json()
-        except Exception:
-            return None
+    return await amap_get("/geocode/regeo", params)
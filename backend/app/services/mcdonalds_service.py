@@ -14,6 +14,20 @@ import mcp.types as types
 import asyncio
 import httpx
 import json
+from mcp.shared.exceptions import McpError
+from app.core.circuit_breaker import CircuitOpenError, default_is_failure, get_breaker
+
+
+def _mcp_is_failure(error: BaseException) -> bool:
+    # A JSON-RPC error reply (unknown tool, bad arguments) means the server is up
+    if isinstance(error, McpError):
+        return False
+    return default_is_failure(error)
+
+
+# Shared by all users' connections: it tracks the McDonald's MCP server, not a token, so
+# rejected tokens (401/403, also when wrapped in the transport's ExceptionGroup) don't count
+mcp_breaker = get_breaker("mcdonalds_mcp", is_failure=_mcp_is_failure)
 
 class MCPClientWrapper:
     """
@@ -74,11 +88,12 @@ class MCPClientWrapper:
             # We could add logic to check if session is closed and reconnect
 
     async def list_tools(self) -> List[Dict[str, Any]]:
-        await self.ensure_connected()
-        if not self.session:
-            raise RuntimeError("Failed to connect to MCP server")
-            
-        result = await self.session.list_tools()
+        async with mcp_breaker.guard():
+            await self.ensure_connected()
+            if not self.session:
+                raise RuntimeError("Failed to connect to MCP server")
+                
+            result = await self.session.list_tools()
         
         tools_data = []
         for tool in result.tools:
@@ -238,11 +253,12 @@ class MCPClientWrapper:
             return json_str
 
     async def call_tool(self, name: str, args: Dict[str, Any]) -> Any:
-        await self.ensure_connected()
-        if not self.session:
-            raise RuntimeError("Failed to connect to MCP server")
+        async with mcp_breaker.guard():
+            await self.ensure_connected()
+            if not self.session:
+                raise RuntimeError("Failed to connect to MCP server")
 
-        result = await self.session.call_tool(name, args)
+            result = await self.session.call_tool(name, args)
         
         # Transform result to simple structure
         output = []
@@ -321,6 +337,9 @@ class McDonaldsService:
         try:
             client = await self._get_client(user)
             return await client.list_tools()
+        except CircuitOpenError as e:
+            # The connection itself is fine; the server is down for everyone
+            raise ValueError(f"Failed to list tools: {str(e)}")
         except Exception as e:
             print(f"Error listing tools: {e}")
             # If error, maybe remove client to force reconnect next time
@@ -333,6 +352,8 @@ class McDonaldsService:
         try:
             client = await self._get_client(user)
             return await client.call_tool(tool_name, arguments)
+        except CircuitOpenError as e:
+            raise ValueError(f"Failed to execute tool: {str(e)}")
         except Exception as e:
             print(f"Error calling tool {tool_name}: {e}")
             if user.id in self.clients:
@@ -0,0 +1,291 @@
+import asyncio
+import os
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from langchain_openai import ChatOpenAI
+
+from app.core import metrics
+from app.core.admission import admission
+from app.core.usage import ai_feature
+
+# Latency-aware routing for blocking LLM calls.
+# Each call starts on the feature's primary model. If it hasn't answered by the hedge deadline
+# (recent p95 of that feature/model, capped by the feature SLO), a second request is sent to the
+# fallback model (or the same model when none is configured); whichever answers first wins and the
+# other is cancelled. A fast failure of the primary is hedged the same way.
+# Streams (stream()) are hedged on their first chunk, then every chunk has to arrive within the
+# feature SLO so a stalled upstream cannot hold the connection and its admission slot.
+
+
+def _parse_overrides(value: str) -> Dict[str, float]:
+    return {
+        key.strip(): float(number)
+        for key, _, number in (item.partition("=") for item in value.split(",") if "=" in item)
+    }
+
+
+# Latency target per feature (seconds): the hedge deadline never exceeds it
+FEATURE_SLOS: Dict[str, float] = {
+    "text-to-recipe": 20,
+    "fridge-to-recipe": 20,
+    "what-to-eat": 10,
+    "meal-plan": 45,
+    "image-to-recipe": 30,
+    "image-to-calorie": 20,
+    "recognize-fridge": 20,
+    "chat": 15,
+    "health-advice": 15,
+    "food-estimate": 15,
+    **_parse_overrides(os.getenv("AI_FEATURE_SLOS", "")),
+}
+DEFAULT_SLO_SECONDS = 20
+
+# Faster model to hedge to; empty means a duplicate request on the primary model
+FALLBACK_MODELS: Dict[str, str] = {
+    "Qwen/Qwen3-8B": os.getenv("AI_TEXT_FALLBACK_MODEL", "Qwen/Qwen2.5-7B-Instruct"),
+    "THUDM/GLM-4.1V-9B-Thinking": os.getenv("AI_VISION_FALLBACK_MODEL", ""),
+}
+
+AI_HEDGING_ENABLED = os.getenv("AI_HEDGING_ENABLED", "1") == "1"
+# Latency samples kept per (feature, model), and how many are needed before p95 replaces the SLO
+LATENCY_WINDOW = int(os.getenv("AI_LATENCY_WINDOW", "200"))
+LATENCY_MIN_SAMPLES = int(os.getenv("AI_LATENCY_MIN_SAMPLES", "20"))
+# Never hedge earlier than this, whatever p95 says
+HEDGE_MIN_SECONDS = float(os.getenv("AI_HEDGE_MIN_SECONDS", "2"))
+
+
+class LatencyTracker:
+    """Sliding window of recent latencies per (feature, model)."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.window = window
+        self._samples: Dict[Tuple[str, str], Deque[float]] = {}
+
+    def record(self, feature: str, model: str, seconds: float):
+        samples = self._samples.get((feature, model))
+        if samples is None:
+            samples = self._samples[(feature, model)] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def percentile(self, feature: str, model: str, q: float) -> Optional[float]:
+        samples = self._samples.get((feature, model))
+        if not samples or len(samples) < LATENCY_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Served:
+    """What answered the invoke() calls made inside `served()`."""
+
+    def __init__(self):
+        self.fallback = False
+
+
+_served: ContextVar[Optional[Served]] = ContextVar("model_router_served", default=None)
+
+
+@contextmanager
+def served():
+    """
+    Track whether a fallback model answered any call in this block. Callers that cache results
+    under the primary model's name use it to keep degraded answers out of the cache.
+    """
+    record = Served()
+    token = _served.set(record)
+    try:
+        yield record
+    finally:
+        _served.reset(token)
+
+
+async def _first_chunk(iterator: AsyncIterator[Any]) -> Tuple[bool, Any]:
+    try:
+        return True, await iterator.__anext__()
+    except StopAsyncIteration:
+        return False, None
+
+
+async def _close(iterator: AsyncIterator[Any]):
+    aclose = getattr(iterator, "aclose", None)
+    if aclose is not None:
+        try:
+            await aclose()
+        except Exception:
+            pass
+
+
+class ModelRouter:
+    def __init__(self, timeout_seconds: float = None):
+        self.timeout_seconds = timeout_seconds or float(os.getenv("AI_TIMEOUT_SECONDS", "60"))
+        self.latency = LatencyTracker()
+        self._fallbacks: Dict[Tuple[int, str], ChatOpenAI] = {}
+
+    def hedge_deadline(self, feature: str, model: str) -> float:
+        slo = FEATURE_SLOS.get(feature, DEFAULT_SLO_SECONDS)
+        p95 = self.latency.percentile(feature, model, 0.95)
+        if p95 is None:
+            return slo
+        return max(HEDGE_MIN_SECONDS, min(p95, slo))
+
+    def fallback_for(self, llm: ChatOpenAI) -> ChatOpenAI:
+        """Same client settings with the fallback model swapped in (or the primary itself)."""
+        model = FALLBACK_MODELS.get(llm.model_name)
+        if not model or model == llm.model_name:
+            return llm
+        key = (id(llm), model)
+        fallback = self._fallbacks.get(key)
+        if fallback is None:
+            fallback = self._fallbacks[key] = llm.model_copy(update={"model_name": model})
+        return fallback
+
+    def _can_hedge(self, llm: ChatOpenAI) -> bool:
+        # Hedging a saturated model only makes the queue longer
+        return AI_HEDGING_ENABLED and admission.gate(llm.model_name).queued == 0
+
+    async def invoke(self, feature: str, llm: ChatOpenAI, call: Callable[[ChatOpenAI], Awaitable[Any]], timeout: float = None) -> Any:
+        """
+        Run `call(llm)` with hedging. Raises asyncio.TimeoutError after `timeout` (AI_TIMEOUT_SECONDS),
+        or the primary's error if every attempt failed.
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        hard_deadline = started + (timeout or self.timeout_seconds)
+        # task -> (llm, path, started)
+        attempts: Dict[asyncio.Task, Tuple[ChatOpenAI, str, float]] = {}
+
+        def launch(target: ChatOpenAI, path: str) -> asyncio.Task:
+            # Attempts are metered under this feature (core/usage.py)
+            with ai_feature(feature):
+                task = asyncio.create_task(call(target))
+            attempts[task] = (target, path, loop.time())
+            return task
+
+        primary = launch(llm, "primary")
+        try:
+            hedge_at = min(self.hedge_deadline(feature, llm.model_name), hard_deadline - started)
+            await asyncio.wait({primary}, timeout=hedge_at)
+            primary_failed = primary.done() and primary.exception() is not None
+            if not primary.done() or primary_failed:
+                fallback = self.fallback_for(llm)
+                if self._can_hedge(fallback):
+                    launch(fallback, "fallback" if fallback is not llm else "hedge")
+                    metrics.incr("ai_hedges", feature=feature, reason="error" if primary_failed else "slow")
+
+            while True:
+                for task in attempts:
+                    if task.done() and not task.cancelled() and task.exception() is None:
+                        return self._won(feature, task, attempts, loop.time())
+                pending = [task for task in attempts if not task.done()]
+                if not pending:
+                    metrics.incr("ai_routed_calls", feature=feature, winner="none")
+                    raise primary.exception()
+                remaining = hard_deadline - loop.time()
+                if remaining <= 0:
+                    metrics.incr("ai_routed_calls", feature=feature, winner="timeout")
+                    raise asyncio.TimeoutError()
+                await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            now = loop.time()
+            for task, (target, _, task_started) in attempts.items():
+                if not task.done():
+                    task.cancel()
+                    # Censored sample: it took at least this long
+                    self.latency.record(feature, target.model_name, now - task_started)
+                elif not task.cancelled():
+                    task.exception()  # mark a losing failure as retrieved
+
+    async def stream(
+        self,
+        feature: str,
+        llm: ChatOpenAI,
+        call: Callable[[ChatOpenAI], AsyncIterator[Any]],
+        route: Optional[Served] = None,
+    ) -> AsyncIterator[Any]:
+        """
+        Streaming counterpart of invoke(): `call(llm)` returns the chunk iterator (e.g. `llm.astream(...)`).
+        Nothing has been passed on before the first chunk, so attempts race for it and the loser is
+        closed. Raises asyncio.TimeoutError if no first chunk arrives within AI_TIMEOUT_SECONDS or a
+        later chunk takes longer than the feature SLO. `route.fallback` is set when the fallback streamed.
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        hard_deadline = started + self.timeout_seconds
+        # task (first chunk) -> (llm, path, iterator)
+        attempts: Dict[asyncio.Task, Tuple[ChatOpenAI, str, AsyncIterator[Any]]] = {}
+
+        def launch(target: ChatOpenAI, path: str) -> asyncio.Task:
+            with ai_feature(feature):
+                iterator = call(target).__aiter__()
+                task = asyncio.create_task(_first_chunk(iterator))
+            attempts[task] = (target, path, iterator)
+            return task
+
+        primary = launch(llm, "primary")
+        winner: Optional[asyncio.Task] = None
+        try:
+            # The p95 tracked by invoke() is of whole responses, a generous bound for a first chunk
+            hedge_at = min(self.hedge_deadline(feature, llm.model_name), hard_deadline - started)
+            await asyncio.wait({primary}, timeout=hedge_at)
+            primary_failed = primary.done() and primary.exception() is not None
+            if not primary.done() or primary_failed:
+                fallback = self.fallback_for(llm)
+                if self._can_hedge(fallback):
+                    launch(fallback, "fallback" if fallback is not llm else "hedge")
+                    metrics.incr("ai_hedges", feature=feature, reason="error" if primary_failed else "slow")
+
+            while winner is None:
+                for task in attempts:
+                    if task.done() and not task.cancelled() and task.exception() is None:
+                        winner = task
+                        break
+                else:
+                    pending = [task for task in attempts if not task.done()]
+                    if not pending:
+                        metrics.incr("ai_routed_calls", feature=feature, winner="none")
+                        raise primary.exception()
+                    remaining = hard_deadline - loop.time()
+                    if remaining <= 0:
+                        metrics.incr("ai_routed_calls", feature=feature, winner="timeout")
+                        raise asyncio.TimeoutError(f"No response from the model within {self.timeout_seconds:g}s")
+                    await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            losers = [task for task in attempts if task is not winner]
+            for task in losers:
+                task.cancel()
+            await asyncio.gather(*losers, return_exceptions=True)
+            for task in losers:
+                await _close(attempts[task][2])
+
+        _, path, iterator = attempts[winner]
+        metrics.incr("ai_routed_calls", feature=feature, winner=path)
+        if route is not None and path == "fallback":
+            route.fallback = True
+        stall_seconds = FEATURE_SLOS.get(feature, DEFAULT_SLO_SECONDS)
+        try:
+            has_chunk, chunk = winner.result()
+            while has_chunk:
+                yield chunk
+                try:
+                    has_chunk, chunk = await asyncio.wait_for(_first_chunk(iterator), stall_seconds)
+                except asyncio.TimeoutError:
+                    metrics.incr("ai_stream_stalls", feature=feature)
+                    raise asyncio.TimeoutError(f"Model stream stalled for {stall_seconds:g}s")
+        finally:
+            await _close(iterator)
+
+    def _won(self, feature: str, task: asyncio.Task, attempts, now: float) -> Any:
+        target, path, task_started = attempts[task]
+        self.latency.record(feature, target.model_name, now - task_started)
+        metrics.incr("ai_routed_calls", feature=feature, winner=path)
+        record = _served.get()
+        if record is not None and path == "fallback":
+            record.fallback = True
+        metrics.observe("ai_feature_latency_seconds", now - min(s for _, _, s in attempts.values()), feature=feature)
+        return task.result()
+
+
+model_router = ModelRouter()
@@ -0,0 +1,262 @@
+import csv
+import difflib
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Local nutrition engine.
+# Foods and exercises are looked up in bundled tables (app/data/*.csv, values per 100g / per
+# minute), amounts like "200g", "两个", "半碗", "1勺", "30分钟" are parsed from the text, and the
+# totals are summed with NumPy. Only entries that match nothing in the tables need the LLM
+# (HealthAIService.estimate_unmatched).
+
+DATA_DIR = Path(__file__).resolve().parents[1] / "data"
+NUTRIENTS = ("calories", "protein", "fat", "carbs")
+
+# Fuzzy matches below this similarity are treated as unknown foods
+MATCH_CUTOFF = 0.6
+
+_DIGITS = r"\d+(?:\.\d+)?(?:/\d+)?"
+_CN_DIGITS = "零一二两三四五六七八九十百半"
+_CN_VALUES = {"零": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+
+# Grams (or ml, taken as grams) per unit
+MASS_UNITS = {"g": 1, "克": 1, "kg": 1000, "千克": 1000, "公斤": 1000, "斤": 500, "两": 50, "ml": 1, "毫升": 1, "l": 1000, "升": 1000}
+SPOON_UNITS = {"汤匙": 15, "大勺": 15, "勺": 15, "茶匙": 5, "小勺": 5, "小匙": 5}
+CONTAINER_UNITS = {"杯": 250, "盒": 250, "瓶": 500, "罐": 330}
+# One typical portion of the food
+SERVING_UNITS = ("碗", "份", "盘", "袋", "顿")
+# One piece of the food (falls back to a portion when the table has no piece weight)
+PIECE_UNITS = ("个", "只", "颗", "根", "条", "块", "片", "枚", "粒", "瓣", "把", "张", "串", "头", "棵")
+VAGUE_AMOUNTS = ("适量", "少许", "少量", "一点", "一些", "若干", "适当")
+
+# Minutes per unit, and km per unit for distance-based activities
+TIME_UNITS = {"分钟": 1, "分": 1, "min": 1, "mins": 1, "小时": 60, "个小时": 60, "钟头": 60, "个钟头": 60, "h": 60}
+DISTANCE_UNITS = {"公里": 1, "km": 1, "千米": 1, "步": 0.0007}
+
+_SEPARATORS = re.compile(r"[，,、；;。\n+＋]|以及|还有|加上|和")
+# Entries that mean "nothing" rather than an unknown food
+NOTHING = {"无", "没", "没吃", "没有", "不吃", "未吃", "空腹", "none", "no", "-", "没运动", "无运动", "休息"}
+
+
+def _unit_pattern(units: Iterable[str]) -> str:
+    return "|".join(re.escape(u) for u in sorted(units, key=len, reverse=True))
+
+
+_FOOD_UNITS = _unit_pattern([*MASS_UNITS, *SPOON_UNITS, *CONTAINER_UNITS, *SERVING_UNITS, *PIECE_UNITS])
+_EXERCISE_UNITS = _unit_pattern([*TIME_UNITS, *DISTANCE_UNITS])
+
+
+def _quantity_re(units: str) -> re.Pattern:
+    # Chinese numerals only count when a unit follows, so 三文鱼 / 五花肉 / 四季豆 stay intact
+    return re.compile(
+        rf"(?P<num>{_DIGITS})\s*(?P<unit>{units})?(?P<half>半)?"
+        rf"|(?P<cn>[{_CN_DIGITS}]+)\s*(?P<cn_unit>{units})(?P<cn_half>半)?",
+        re.IGNORECASE,
+    )
+
+
+_FOOD_QUANTITY_RE = _quantity_re(_FOOD_UNITS)
+_EXERCISE_QUANTITY_RE = _quantity_re(_EXERCISE_UNITS)
+
+
+def parse_number(text: str) -> float:
+    """'2' / '1.5' / '1/2' / '两' / '十二' / '半' -> float."""
+    if re.fullmatch(_DIGITS, text):
+        if "/" in text:
+            numerator, denominator = text.split("/")
+            return float(numerator) / float(denominator) if float(denominator) else 0.0
+        return float(text)
+    if text in ("半", "一半"):
+        return 0.5
+    text = text.rstrip("半")
+    value, current = 0, 0
+    for char in text:
+        if char in _CN_VALUES:
+            current = _CN_VALUES[char]
+        elif char == "十":
+            value += (current or 1) * 10
+            current = 0
+        elif char == "百":
+            value += (current or 1) * 100
+            current = 0
+    return float(value + current)
+
+
+def parse_quantity(text: str, pattern: re.Pattern = _FOOD_QUANTITY_RE) -> Tuple[Optional[float], Optional[str], str]:
+    """(amount, unit, rest of the text) for the first quantity in `text`; amount is None when there is none."""
+    match = pattern.search(text)
+    if match is None:
+        return None, None, text
+    if match.group("num") is not None:
+        amount, unit, half = parse_number(match.group("num")), match.group("unit"), match.group("half")
+    else:
+        raw = match.group("cn")
+        amount, unit, half = parse_number(raw), match.group("cn_unit"), match.group("cn_half")
+        if raw.endswith("半") and raw != "半":
+            amount += 0.5
+    if half:
+        amount += 0.5
+    rest = (text[: match.start()] + " " + text[match.end():]).strip()
+    return amount, unit.lower() if unit else None, rest
+
+
+def split_items(text: Optional[str]) -> List[str]:
+    """Split free text such as "两个鸡蛋，一杯牛奶 和 米饭 1碗" into one entry per food / activity."""
+    items = []
+    for part in _SEPARATORS.split(text or ""):
+        tokens = part.split()
+        merged: List[str] = []
+        for token in tokens:
+            # "米饭 1碗": a bare quantity belongs to the token before it
+            amount, _, rest = parse_quantity(token)
+            if merged and amount is not None and not rest:
+                merged[-1] += token
+            else:
+                merged.append(token)
+        items.extend(merged)
+    return [item for item in items if item.strip() and _clean_name(item) not in NOTHING]
+
+
+def _clean_name(text: str) -> str:
+    text = re.sub(r"[（(\[【].*?[）)\]】]", "", text)
+    for word in VAGUE_AMOUNTS:
+        text = text.replace(word, "")
+    return re.sub(r"\s+", "", text).lower()
+
+
+class _Table:
+    """Name/alias lookup with substring and fuzzy fallbacks, shared by the food and exercise tables."""
+
+    def __init__(self, rows: List[Dict[str, str]]):
+        self.rows = rows
+        self.names = [row["name"] for row in rows]
+        self._aliases: Dict[str, int] = {}
+        for index, row in enumerate(rows):
+            for alias in [row["name"], *filter(None, row.get("aliases", "").split("|"))]:
+                self._aliases.setdefault(alias.lower(), index)
+        # Longest first, so 鸡胸肉 wins over 鸡肉 and 番茄炒蛋 over 番茄
+        self._substrings = sorted((a for a in self._aliases if len(a) >= 2), key=len, reverse=True)
+        self._matches: Dict[str, Optional[int]] = {}
+
+    def match(self, name: str) -> Optional[int]:
+        name = _clean_name(name)
+        if not name:
+            return None
+        if name not in self._matches:
+            self._matches[name] = self._lookup(name)
+        return self._matches[name]
+
+    def _lookup(self, name: str) -> Optional[int]:
+        if name in self._aliases:
+            return self._aliases[name]
+        for alias in self._substrings:
+            if alias in name:
+                return self._aliases[alias]
+        close = difflib.get_close_matches(name, self._aliases.keys(), n=1, cutoff=MATCH_CUTOFF)
+        return self._aliases[close[0]] if close else None
+
+
+def _read_csv(filename: str) -> List[Dict[str, str]]:
+    with open(DATA_DIR / filename, encoding="utf-8", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def _float(value: str) -> float:
+    return float(value) if value else np.nan
+
+
+class FoodTable(_Table):
+    def __init__(self, rows: List[Dict[str, str]]):
+        super().__init__(rows)
+        # (foods, 4) matrix of calories / protein / fat / carbs per gram
+        self.per_gram = np.array([[float(row["kcal"]), float(row["protein"]), float(row["fat"]), float(row["carbs"])] for row in rows]) / 100
+        self.piece_grams = np.array([_float(row["piece_g"]) for row in rows])
+        self.serving_grams = np.array([_float(row["serving_g"]) for row in rows])
+
+    def grams(self, index: int, amount: Optional[float], unit: Optional[str]) -> float:
+        serving = self.serving_grams[index]
+        piece = self.piece_grams[index]
+        if amount is None:
+            return float(serving)
+        if unit in MASS_UNITS:
+            return amount * MASS_UNITS[unit]
+        if unit in SPOON_UNITS:
+            return amount * SPOON_UNITS[unit]
+        if unit in CONTAINER_UNITS:
+            return amount * CONTAINER_UNITS[unit]
+        if unit in SERVING_UNITS:
+            return amount * float(serving)
+        # Piece units, or a bare number ("鸡蛋2")
+        return amount * float(piece if not np.isnan(piece) else serving)
+
+    def analyze(self, entries: Iterable[Tuple[str, Optional[str]]]) -> Dict[str, Any]:
+        """
+        entries: (name, amount text) pairs, e.g. ("鸡蛋", "2个") or ("两个鸡蛋", None).
+        Returns totals, per-item results and the entries that matched no food.
+        """
+        indices, grams, labels, unmatched = [], [], [], []
+        for name, amount_text in entries:
+            text = f"{name} {amount_text or ''}".strip()
+            amount, unit, rest = parse_quantity(text)
+            index = self.match(rest)
+            if index is None:
+                if _clean_name(text):
+                    unmatched.append(text)
+                continue
+            indices.append(index)
+            grams.append(self.grams(index, amount, unit))
+            labels.append(text)
+
+        totals = dict.fromkeys(NUTRIENTS, 0.0)
+        items = []
+        if indices:
+            weights = np.asarray(grams)
+            values = self.per_gram[np.asarray(indices)] * weights[:, None]
+            totals = dict(zip(NUTRIENTS, (float(v) for v in values.sum(axis=0))))
+            for label, index, weight, row in zip(labels, indices, weights, values):
+                items.append({"text": label, "food": self.names[index], "grams": round(float(weight)), "calories": round(float(row[0]))})
+        return {"totals": totals, "items": items, "unmatched": unmatched}
+
+
+class ExerciseTable(_Table):
+    def __init__(self, rows: List[Dict[str, str]]):
+        super().__init__(rows)
+        self.per_minute = np.array([float(row["kcal_per_min"]) for row in rows])
+        self.per_km = np.array([_float(row["kcal_per_km"]) for row in rows])
+        self.default_minutes = np.array([float(row["default_minutes"]) for row in rows])
+
+    def analyze(self, entries: Iterable[str]) -> Dict[str, Any]:
+        """Calories burned for entries like "跑步30分钟" / "快走5公里" / "走了8000步"."""
+        indices, minutes, km, labels, unmatched = [], [], [], [], []
+        for text in entries:
+            amount, unit, rest = parse_quantity(text, _EXERCISE_QUANTITY_RE)
+            index = self.match(rest)
+            if index is None:
+                if _clean_name(text):
+                    unmatched.append(text)
+                continue
+            if unit in DISTANCE_UNITS and not np.isnan(self.per_km[index]):
+                minutes.append(0.0)
+                km.append(amount * DISTANCE_UNITS[unit])
+            else:
+                minutes.append(amount * TIME_UNITS.get(unit, 1) if amount is not None else self.default_minutes[index])
+                km.append(0.0)
+            indices.append(index)
+            labels.append(text)
+
+        items = []
+        total = 0.0
+        if indices:
+            index_array = np.asarray(indices)
+            burned = self.per_minute[index_array] * np.asarray(minutes) + np.nan_to_num(self.per_km[index_array]) * np.asarray(km)
+            total = float(burned.sum())
+            for label, index, calories in zip(labels, indices, burned):
+                items.append({"text": label, "exercise": self.names[index], "calories": round(float(calories))})
+        return {"calories": total, "items": items, "unmatched": unmatched}
+
+
+food_table = FoodTable(_read_csv("food_composition.csv"))
+exercise_table = ExerciseTable(_read_csv("exercise_table.csv"))
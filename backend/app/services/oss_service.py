@@ -1,9 +1,20 @@
+import asyncio
 import os
 from fastapi import UploadFile
 import oss2
+from app.core.circuit_breaker import get_breaker
 from app.core.config import settings
 
 
+def _is_cos_failure(error: Exception) -> bool:
+    # oss2 errors carry the HTTP status (negative for network errors); 4xx is a problem with our request
+    status = getattr(error, "status", None)
+    return not (isinstance(status, int) and 400 <= status < 500)
+
+
+cos_breaker = get_breaker("cos", is_failure=_is_cos_failure)
+
+
 class OSSService:
     def __init__(self):
         raw_access_key_id = (
@@ -69,7 +80,9 @@ class OSSService:
         if not self.bucket:
             raise Exception("OSS client not configured")
 
-        self.bucket.put_object(key, content)
+        # put_object is blocking; run it off the event loop so a slow COS doesn't stall every request
+        async with cos_breaker.guard():
+            await asyncio.to_thread(self.bucket.put_object, key, content)
         return self._public_url(key)
 
 
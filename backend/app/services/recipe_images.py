@@ -0,0 +1,111 @@
+import asyncio
+import os
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from app.core.http_clients import get_http_client
+from app.services.ai_log_writer import ai_log_writer
+from app.services.ai_service import ai_service
+from app.services.oss_service import oss_service
+
+# Recipe image generation shared by /ai/generate-recipe-image and the background job of the same name
+
+# Steps of one recipe generated at the same time
+STEP_IMAGE_CONCURRENCY = int(os.getenv("STEP_IMAGE_CONCURRENCY", "4"))
+# Image generations in flight across all requests and jobs of this process
+IMAGE_GENERATION_CONCURRENCY = int(os.getenv("IMAGE_GENERATION_CONCURRENCY", "8"))
+
+_image_slots = asyncio.Semaphore(IMAGE_GENERATION_CONCURRENCY)
+
+
+async def process_and_upload(image_url: str, prefix: str = "ai_gen") -> str:
+    """Copy a (short-lived) provider image to our own storage; fall back to the provider URL."""
+    try:
+        client = get_http_client("media")
+        resp = await client.get(image_url)
+        resp.raise_for_status()
+        image_bytes = resp.content
+
+        filename = f"{prefix}_{uuid.uuid4().hex}.jpg"
+        if oss_service.is_configured():
+            key = f"uploads/{filename}"
+            return await oss_service.upload_bytes(image_bytes, key)
+        return image_url
+    except Exception as e:
+        return image_url
+
+
+async def generate_final_image(recipe: Dict[str, Any]) -> Dict[str, Any]:
+    title = recipe.get('title', '')
+    description = recipe.get('description', '')
+
+    prompt = f"Professional food photography of {title}. {description}. High resolution, 4k, delicious, restaurant quality."
+    async with _image_slots:
+        original_url = await ai_service.generate_image(prompt)
+        final_url = await process_and_upload(original_url, "final")
+    return {"image_url": final_url}
+
+
+async def _generate_step_image(index: int, step_text: str, title: str, request_slots: asyncio.Semaphore) -> Dict[str, Any]:
+    step_prompt = f"Cooking step {index+1} for {title}: {step_text}. Close up shot, professional food photography, bright lighting."
+    try:
+        async with request_slots, _image_slots:
+            original_url = await ai_service.generate_image(step_prompt)
+            step_url = await process_and_upload(original_url, f"step_{index+1}")
+        return {
+            "step_index": index,
+            "image_url": step_url,
+            "text": step_text
+        }
+    except Exception as e:
+        # A failed step doesn't affect the others
+        print(f"Step image {index + 1} failed: {e}")
+        return {"step_index": index, "error": str(e)}
+
+
+async def iter_step_images(recipe: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Generate and mirror all step images concurrently (STEP_IMAGE_CONCURRENCY per request,
+    IMAGE_GENERATION_CONCURRENCY process-wide), yielding each step as it completes.
+    Failed steps are yielded as {"step_index", "error"}.
+    """
+    title = recipe.get('title', '')
+    steps = recipe.get('steps', [])
+    request_slots = asyncio.Semaphore(STEP_IMAGE_CONCURRENCY)
+    tasks = [
+        asyncio.create_task(_generate_step_image(index, step_text, title, request_slots))
+        for index, step_text in enumerate(steps)
+    ]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        # Consumer stopped early (e.g. client disconnected): don't keep generating
+        for task in tasks:
+            task.cancel()
+
+
+async def generate_step_images(
+    recipe: Dict[str, Any],
+    on_progress: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+) -> Dict[str, Any]:
+    total = len(recipe.get('steps', []))
+    steps_images: List[Dict[str, Any]] = []
+    done = 0
+    async for item in iter_step_images(recipe):
+        done += 1
+        if "error" not in item:
+            steps_images.append(item)
+        if on_progress:
+            await on_progress({"done": done, "total": total, "step_index": item["step_index"]})
+
+    steps_images.sort(key=lambda item: item["step_index"])
+    return {"images": steps_images}
+
+
+async def attach_to_source_log(user_id: int, source_log_id: Optional[int], key: str, value: Any):
+    """Store generated images on the AILog of the recipe they belong to (e.g. image_url, step_images)."""
+    if not source_log_id:
+        return
+    # Merged into the log by the write-behind writer; nothing is read back on the request path
+    await ai_log_writer.attach(user_id, source_log_id, key, value)
@@ -0,0 +1,60 @@
+import asyncio
+import copy
+from typing import Any, Awaitable, Callable, Dict
+
+from app.core import metrics
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: the first caller for a key starts the upstream call,
+    later callers with the same key await the same result instead of issuing their own.
+
+    The upstream call runs in its own task, so a cancelled waiter (client went away) doesn't
+    cancel it for the others; it is only cancelled once every waiter has gone.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+
+    def _forget(self, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+            metrics.set_gauge("ai_single_flight_inflight", len(self._flights))
+
+    async def do(self, key: str, producer: Callable[[], Awaitable[Any]], feature: str = "unknown") -> Any:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.create_task(producer()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _, key=key, flight=flight: self._forget(key, flight))
+            metrics.incr("ai_single_flight_calls", feature=feature, result="leader")
+            metrics.set_gauge("ai_single_flight_inflight", len(self._flights))
+        else:
+            metrics.incr("ai_single_flight_calls", feature=feature, result="coalesced")
+
+        flight.waiters += 1
+        try:
+            result = await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                # Last interested caller is gone; new callers must not join a dying flight
+                self._forget(key, flight)
+                flight.task.cancel()
+                metrics.incr("ai_single_flight_calls", feature=feature, result="abandoned")
+            raise
+        finally:
+            flight.waiters -= 1
+        # Every caller gets its own copy; routers may mutate results (e.g. attach image URLs)
+        return copy.deepcopy(result)
+
+
+single_flight = SingleFlight()
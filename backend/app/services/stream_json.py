@@ -0,0 +1,295 @@
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# Incremental JSON parsing over a model's partial output.
+# PartialJSONParser keeps its container stack and the token being read between chunks, so every
+# character is scanned once however small the chunks are (streams arrive a few characters at a time).
+# Completed scalars are returned as-is, containers still being written come back as
+# PartialDict / PartialList holding only finished members.
+
+
+class PartialDict(dict):
+    pass
+
+
+class PartialList(list):
+    pass
+
+
+_WHITESPACE = " \t\r\n"
+_LITERALS = {"true": True, "false": False, "null": None}
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f"}
+_STRING_RUN = re.compile(r'[^"\\]+')
+_LITERAL_RUN = re.compile(r"[^,}\] \t\r\n]+")
+_THINK_OPEN, _THINK_CLOSE = "<think>", "</think>"
+
+# Parser modes: looking for the object, inside a <think> block, parsing, finished, invalid input
+_SEEK, _THINK, _PARSE, _DONE, _BROKEN = range(5)
+# Object states (arrays always expect a value, a comma or "]")
+_KEY, _COLON, _VALUE = range(3)
+
+
+def _literal_value(token: str) -> Any:
+    if token in _LITERALS:
+        return _LITERALS[token]
+    try:
+        return float(token) if any(c in token for c in ".eE") else int(token)
+    except ValueError:
+        return token
+
+
+class _Frame:
+    __slots__ = ("container", "is_object", "state", "key")
+
+    def __init__(self, container, is_object: bool):
+        self.container = container
+        self.is_object = is_object
+        self.state = _KEY
+        self.key = None
+
+
+class PartialJSONParser:
+    """
+    Parses the first JSON object of a growing text, skipping a leading <think>...</think> block
+    (reasoning models such as GLM-4.1V-Thinking and Qwen3 emit one before the answer).
+    """
+
+    def __init__(self):
+        self.value: Optional[Any] = None
+        self._mode = _SEEK
+        self._pending = ""  # text kept back while looking for the object (a tag may be split)
+        self._stack: List[_Frame] = []
+        # Scalar being read: "string" or "literal", its characters so far and an unfinished escape
+        self._token: Optional[str] = None
+        self._chars: List[str] = []
+        self._escape = ""
+        self._is_key = False
+
+    def feed(self, chunk: str) -> Optional[Any]:
+        """Consume `chunk` and return the object parsed so far (None until it starts)."""
+        if self._mode in (_SEEK, _THINK):
+            text = self._pending + chunk
+            start = self._seek(text)
+            if start is None:
+                return None
+            self._pending = ""
+            self._parse(text, start)
+        elif self._mode == _PARSE:
+            self._parse(chunk, 0)
+        return self.value
+
+    def _seek(self, text: str) -> Optional[int]:
+        i = 0
+        while True:
+            if self._mode == _THINK:
+                end = text.find(_THINK_CLOSE, i)
+                if end == -1:
+                    self._pending = text[max(i, len(text) - len(_THINK_CLOSE) + 1):]
+                    return None
+                i = end + len(_THINK_CLOSE)
+                self._mode = _SEEK
+            brace = text.find("{", i)
+            think = text.find(_THINK_OPEN, i)
+            if think != -1 and (brace == -1 or think < brace):
+                i = think + len(_THINK_OPEN)
+                self._mode = _THINK
+                continue
+            if brace == -1:
+                self._pending = text[max(i, len(text) - len(_THINK_OPEN) + 1):]
+                return None
+            self.value = PartialDict()
+            self._stack.append(_Frame(self.value, True))
+            self._mode = _PARSE
+            return brace + 1
+
+    def _parse(self, s: str, i: int):
+        n = len(s)
+        while i < n and self._mode == _PARSE:
+            if self._token == "string":
+                i = self._read_string(s, i)
+                continue
+            if self._token == "literal":
+                match = _LITERAL_RUN.match(s, i)
+                if match:
+                    self._chars.append(match.group())
+                    i = match.end()
+                if i >= n:
+                    # Token may continue in the next chunk
+                    return
+                self._token = None
+                if not self._chars:
+                    # A value can't start here; keep what we have
+                    self._mode = _BROKEN
+                    return
+                self._add(_literal_value("".join(self._chars)))
+                continue
+
+            c = s[i]
+            if c in _WHITESPACE:
+                i += 1
+                continue
+            frame = self._stack[-1]
+            if frame.is_object and frame.state == _KEY:
+                if c == ",":
+                    i += 1
+                elif c == "}":
+                    self._close()
+                    i += 1
+                elif c == '"':
+                    self._start_string(is_key=True)
+                    i += 1
+                else:
+                    # Not valid JSON from here on; keep what we have
+                    self._mode = _BROKEN
+            elif frame.is_object and frame.state == _COLON:
+                if c != ":":
+                    self._mode = _BROKEN
+                frame.state = _VALUE
+                i += 1
+            elif not frame.is_object and c == ",":
+                i += 1
+            elif not frame.is_object and c == "]":
+                self._close()
+                i += 1
+            else:
+                i = self._start_value(s, i)
+
+    def _start_string(self, is_key: bool):
+        self._token = "string"
+        self._chars = []
+        self._is_key = is_key
+
+    def _start_value(self, s: str, i: int) -> int:
+        c = s[i]
+        if c == "{" or c == "[":
+            child = PartialDict() if c == "{" else PartialList()
+            self._add(child)
+            self._stack.append(_Frame(child, c == "{"))
+            return i + 1
+        if c == '"':
+            self._start_string(is_key=False)
+            return i + 1
+        self._token = "literal"
+        self._chars = []
+        return i
+
+    def _read_string(self, s: str, i: int) -> int:
+        n = len(s)
+        while i < n:
+            if self._escape:
+                self._escape += s[i]
+                i += 1
+                escape = self._escape
+                if escape[1] == "u":
+                    if len(escape) < 6:
+                        continue
+                    try:
+                        self._chars.append(chr(int(escape[2:6], 16)))
+                    except ValueError:
+                        self._chars.append(escape[2:6])
+                else:
+                    self._chars.append(_ESCAPES.get(escape[1], escape[1]))
+                self._escape = ""
+                continue
+            c = s[i]
+            if c == '"':
+                self._token = None
+                value = "".join(self._chars)
+                if self._is_key:
+                    frame = self._stack[-1]
+                    frame.key = value
+                    frame.state = _COLON
+                else:
+                    self._add(value)
+                return i + 1
+            if c == "\\":
+                self._escape = c
+                i += 1
+                continue
+            match = _STRING_RUN.match(s, i)
+            self._chars.append(match.group())
+            i = match.end()
+        return i
+
+    def _add(self, value: Any):
+        """Put a finished scalar, or a container that was just opened, into the current container."""
+        frame = self._stack[-1]
+        if frame.is_object:
+            frame.container[frame.key] = value
+            frame.state = _KEY
+        else:
+            frame.container.append(value)
+
+    def _close(self):
+        frame = self._stack.pop()
+        closed = dict(frame.container) if frame.is_object else list(frame.container)
+        if not self._stack:
+            self.value = closed
+            self._mode = _DONE
+            return
+        parent = self._stack[-1]
+        if parent.is_object:
+            parent.container[parent.key] = closed
+        else:
+            parent.container[-1] = closed
+
+
+def parse_partial_json(text: str) -> Optional[Any]:
+    """One-shot parse of a (possibly truncated) model output."""
+    return PartialJSONParser().feed(text)
+
+
+def is_complete(value: Any) -> bool:
+    return not isinstance(value, (PartialDict, PartialList))
+
+
+class JSONFieldStreamer:
+    """
+    Turns a growing JSON object into field events, in the order the model writes them.
+    Scalar/complete fields are emitted once as `(field_name, value)`.
+    Fields listed in `item_fields` are emitted per finished element as `(item_event, {"index", "value"})`.
+    """
+
+    def __init__(self, item_fields: Dict[str, str] = None):
+        self.item_fields = item_fields or {}
+        self._parser = PartialJSONParser()
+        self._chunks: List[str] = []
+        self._emitted_fields = set()
+        self._emitted_items: Dict[str, int] = {}
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        self._chunks.append(chunk)
+        data = self._parser.feed(chunk)
+        if not isinstance(data, dict):
+            return []
+        return self._diff(data)
+
+    def replay(self, data: Dict[str, Any]) -> List[Tuple[str, Any]]:
+        """Events for an already-complete object (e.g. a cache hit)."""
+        return self._diff(data)
+
+    @property
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+    def _diff(self, data: Dict[str, Any]) -> List[Tuple[str, Any]]:
+        events = []
+        for key, value in data.items():
+            if key in self.item_fields:
+                if not isinstance(value, list):
+                    if key not in self._emitted_fields and is_complete(value):
+                        # Model returned a non-list here; surface it as a plain field
+                        self._emitted_fields.add(key)
+                        events.append((key, value))
+                    continue
+                sent = self._emitted_items.get(key, 0)
+                for index in range(sent, len(value)):
+                    item = value[index]
+                    if not is_complete(item):
+                        break
+                    events.append((self.item_fields[key], {"index": index, "value": item}))
+                    self._emitted_items[key] = index + 1
+            elif key not in self._emitted_fields and is_complete(value):
+                self._emitted_fields.add(key)
+                events.append((key, value))
+        return events
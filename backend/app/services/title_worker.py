@@ -0,0 +1,105 @@
+import asyncio
+import os
+from typing import List, Optional, Set
+
+from langchain_core.messages import HumanMessage
+
+from app.core import metrics
+from app.core.admission import llm_priority
+from app.core.usage import ai_feature
+from app.models.chat import ChatSession
+
+TITLE_PROMPT = """请根据以下对话内容，生成一个简短的标题（不超过10个字），概括用户的意图。
+
+用户: {message}
+AI: {answer}...
+
+只返回标题文字，不要包含引号或其他内容。"""
+
+
+def is_default_title(title: str, message: str) -> bool:
+    """True while the session still has a placeholder title (generic, or derived from the first message)."""
+    return (
+        title in ["新对话", "New Chat"] or
+        title.startswith("新对话") or
+        title.startswith("New Chat") or
+        len(title) < 5 or
+        title == message[:20] + "..." or
+        title == message # If title was set to user message
+    )
+
+
+class SessionTitleWorker:
+    """
+    In-process queue that auto-titles chat sessions off the request path.
+    A session is queued at most once at a time, and titled at most once (ChatSession.title_generated).
+    """
+
+    def __init__(self, concurrency: int = None):
+        self.concurrency = concurrency or int(os.getenv("TITLE_WORKER_CONCURRENCY", "2"))
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._pending: Set[int] = set()
+
+    def start(self):
+        if self._workers:
+            return
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._run()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+        self._pending.clear()
+
+    def enqueue(self, session_id: int, message: str, answer: str) -> bool:
+        if session_id in self._pending:
+            metrics.incr("title_worker_jobs", result="deduplicated")
+            return False
+        self.start()
+        self._pending.add(session_id)
+        self._queue.put_nowait((session_id, message, answer))
+        metrics.set_gauge("title_worker_queue_depth", self._queue.qsize())
+        return True
+
+    async def _run(self):
+        with llm_priority("background"), ai_feature("chat-title"):
+            while True:
+                session_id, message, answer = await self._queue.get()
+                try:
+                    await self._generate(session_id, message, answer)
+                except Exception as e:
+                    metrics.incr("title_worker_jobs", result="error")
+                    print(f"Failed to generate title for session {session_id}: {e}")
+                finally:
+                    self._pending.discard(session_id)
+                    self._queue.task_done()
+
+    async def _generate(self, session_id: int, message: str, answer: str):
+        # Imported here: ai_service pulls in the whole LLM stack
+        from app.services.ai_service import ai_service
+
+        session = await ChatSession.get_or_none(id=session_id)
+        if not session or session.title_generated or not is_default_title(session.title, message):
+            metrics.incr("title_worker_jobs", result="skipped")
+            return
+
+        prompt = TITLE_PROMPT.format(message=message, answer=answer[:100])
+        title_response = await ai_service.llm_text.ainvoke([HumanMessage(content=prompt)])
+        new_title = title_response.content.strip().strip('"').strip("《").strip("》")
+        if len(new_title) > 20:
+            new_title = new_title[:20]
+        if not new_title:
+            return
+
+        # Conditional update: a concurrent worker (or another process) may have titled it already
+        updated = await ChatSession.filter(id=session_id, title_generated=False).update(
+            title=new_title, title_generated=True
+        )
+        metrics.incr("title_worker_jobs", result="titled" if updated else "skipped")
+
+
+title_worker = SessionTitleWorker()
@@ -0,0 +1,170 @@
+import asyncio
+import copy
+import os
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from tortoise import timezone
+
+from app.core import metrics
+from app.models.ai_cache import VisionCacheEntry
+from app.services.ai_cache import from_json_field, to_json_field
+
+# Pillow is optional: without it perceptual hashing is disabled and every vision request goes upstream
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+DEFAULT_TTLS: Dict[str, int] = {
+    "image-to-recipe": 7 * 24 * 3600,
+    "image-to-calorie": 7 * 24 * 3600,
+    "recognize-fridge": 24 * 3600,
+}
+# Index refreshes re-read entries expiring up to this long before the newest one already loaded
+REFRESH_OVERLAP_SECONDS = 30
+
+
+def dhash_image(img, hash_size: int = 8) -> int:
+    """
+    64-bit difference hash of a decoded PIL image: grayscale, shrink to 9x8,
+    compare horizontally adjacent pixels. Robust to re-encoding, resizing and small crops.
+    """
+    small = img.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (1 if pixels[offset + col] > pixels[offset + col + 1] else 0)
+    return value
+
+
+class VisionCache:
+    """
+    Near-duplicate cache for vision model results.
+    Results are indexed per (feature, model) by dHash; a lookup reuses the closest prior result
+    within `max_distance` bits (Hamming). Entries live in memory and in `vision_cache_entries`.
+    """
+
+    def __init__(self):
+        self.enabled = Image is not None and os.getenv("VISION_CACHE_ENABLED", "1") != "0"
+        self.max_distance = int(os.getenv("VISION_CACHE_MAX_DISTANCE", "5"))
+        self.max_entries = int(os.getenv("VISION_CACHE_MAX_ENTRIES", "5000"))
+        # How often an index picks up entries stored by other workers
+        self.refresh_seconds = float(os.getenv("VISION_CACHE_REFRESH_SECONDS", "60"))
+        # (feature, model) -> OrderedDict[hash] = (expires_at, value)
+        self._index: Dict[tuple, "OrderedDict[int, tuple]"] = {}
+        # (feature, model) -> (monotonic time of the last load, latest expires_at loaded)
+        self._loaded: Dict[tuple, tuple] = {}
+        self._load_lock = asyncio.Lock()
+
+    def ttl_for(self, feature: str) -> int:
+        env_name = "VISION_CACHE_TTL_" + feature.upper().replace("-", "_")
+        return int(os.getenv(env_name, DEFAULT_TTLS.get(feature, 24 * 3600)))
+
+    def _is_fresh(self, key: tuple) -> bool:
+        loaded = self._loaded.get(key)
+        return loaded is not None and time.monotonic() - loaded[0] < self.refresh_seconds
+
+    async def _get_index(self, feature: str, model: str) -> "OrderedDict[int, tuple]":
+        key = (feature, model)
+        index = self._index.get(key)
+        # While a refresh is running, serve the index we already have
+        if index is not None and (self._is_fresh(key) or self._load_lock.locked()):
+            return index
+        async with self._load_lock:
+            if not self._is_fresh(key):
+                await self._load(key)
+            return self._index[key]
+
+    async def _load(self, key: tuple):
+        """Load an index, or merge in the entries stored since its last load."""
+        feature, model = key
+        index = self._index.get(key)
+        newest = self._loaded[key][1] if key in self._loaded else None
+        if index is None:
+            index = OrderedDict()
+        try:
+            now = timezone.now()
+            query = VisionCacheEntry.filter(feature=feature, model=model, expires_at__gt=now)
+            if newest is not None:
+                # TTLs are fixed per feature, so later writes expire later; the overlap covers slow commits
+                query = query.filter(expires_at__gt=newest - timedelta(seconds=REFRESH_OVERLAP_SECONDS))
+            rows = await query.order_by("-expires_at").limit(self.max_entries)
+            for row in reversed(rows):
+                remaining = (row.expires_at - now).total_seconds()
+                image_hash = int(row.image_hash, 16)
+                index[image_hash] = (time.time() + remaining, from_json_field(row.value))
+                index.move_to_end(image_hash)
+                if newest is None or row.expires_at > newest:
+                    newest = row.expires_at
+            while len(index) > self.max_entries:
+                index.popitem(last=False)
+        except Exception as e:
+            print(f"Vision cache load error: {e}")
+        self._index[key] = index
+        self._loaded[key] = (time.monotonic(), newest)
+
+    async def lookup(self, feature: str, model: str, image_hash: Optional[int]) -> Optional[Any]:
+        if not self.enabled or image_hash is None:
+            return None
+        index = await self._get_index(feature, model)
+        now = time.time()
+        best_hash, best_distance = None, self.max_distance + 1
+        expired = []
+        for candidate, (expires_at, _) in index.items():
+            if expires_at < now:
+                expired.append(candidate)
+                continue
+            distance = (candidate ^ image_hash).bit_count()
+            if distance < best_distance:
+                best_hash, best_distance = candidate, distance
+                if distance == 0:
+                    break
+        for candidate in expired:
+            index.pop(candidate, None)
+
+        if best_hash is None:
+            metrics.incr("vision_cache_requests", feature=feature, result="miss")
+            return None
+        index.move_to_end(best_hash)
+        metrics.incr("vision_cache_requests", feature=feature, result="hit" if best_distance == 0 else "near_hit")
+        return copy.deepcopy(index[best_hash][1])
+
+    async def store(self, feature: str, model: str, image_hash: Optional[int], value: Any):
+        if not self.enabled or image_hash is None or not value:
+            return
+        ttl = self.ttl_for(feature)
+        if ttl <= 0:
+            return
+        index = await self._get_index(feature, model)
+        index[image_hash] = (time.time() + ttl, copy.deepcopy(value))
+        index.move_to_end(image_hash)
+        while len(index) > self.max_entries:
+            index.popitem(last=False)
+        metrics.set_gauge("vision_cache_entries", len(index), feature=feature)
+        try:
+            await VisionCacheEntry.update_or_create(
+                feature=feature,
+                model=model,
+                image_hash=f"{image_hash:016x}",
+                defaults={
+                    "value": to_json_field(value),
+                    "expires_at": timezone.now() + timedelta(seconds=ttl),
+                },
+            )
+        except Exception as e:
+            print(f"Vision cache write error: {e}")
+
+    async def purge_expired(self) -> int:
+        now = time.time()
+        for index in self._index.values():
+            for image_hash in [h for h, (exp, _) in index.items() if exp < now]:
+                index.pop(image_hash, None)
+        return await VisionCacheEntry.filter(expires_at__lte=timezone.now()).delete()
+
+
+vision_cache = VisionCache()
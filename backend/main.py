@@ -6,6 +6,8 @@ from app.core.config import settings
 from tortoise.contrib.fastapi import register_tortoise
 from app.routers import auth, users, profile, inventory, content, explore, ai, upload, notifications, search, shopping, maps, chats, mcdonalds, health, admin
 from app.mcp_server import mcp
+from app.core.http_clients import close_http_clients
+from app.core.cancellation import ClientDisconnected
 from mcp.server.sse import SseServerTransport
 from starlette.routing import Mount, Route
 
@@ -30,6 +32,11 @@ def _cors_headers(request: Request) -> dict:
         "Access-Control-Max-Age": "86400",
     }
 
+@app.exception_handler(ClientDisconnected)
+async def client_disconnected_handler(request: Request, exc: ClientDisconnected):
+    # Nobody is listening any more; 499 (client closed request) keeps these apart from real errors in logs
+    return Response(status_code=499)
+
 # Global Response Middleware
 @app.middleware("http")
 async def standard_response_middleware(request: Request, call_next):
@@ -54,8 +61,13 @@ async def standard_response_middleware(request: Request, call_next):
         process_time = time.time() - start_time
         response.headers["X-Process-Time"] = str(process_time)
         
-        # Handle JSON responses
+        # SSE streams must pass through untouched: never read body_iterator here,
+        # otherwise every event would be buffered until the stream ends
         content_type = response.headers.get("content-type", "")
+        if content_type.startswith("text/event-stream"):
+            return response
+
+        # Handle JSON responses
         if "application/json" in content_type:
             response_body = b""
             async for chunk in response.body_iterator:
@@ -183,6 +195,79 @@ register_tortoise(
     )
 
 
+@app.on_event("startup")
+async def start_title_worker():
+    from app.services.title_worker import title_worker
+    title_worker.start()
+
+
+@app.on_event("shutdown")
+async def stop_title_worker():
+    from app.services.title_worker import title_worker
+    await title_worker.stop()
+
+
+@app.on_event("startup")
+async def start_ai_jobs():
+    from app.services.ai_jobs import job_queue
+    await job_queue.start()
+
+
+@app.on_event("shutdown")
+async def stop_ai_jobs():
+    from app.services.ai_jobs import job_queue
+    await job_queue.stop()
+
+
+@app.on_event("startup")
+async def start_ai_log_writer():
+    from app.services.ai_log_writer import ai_log_writer
+    ai_log_writer.start()
+
+
+@app.on_event("startup")
+async def start_ai_usage_rollups():
+    from app.services.ai_usage import usage_rollups
+    usage_rollups.start()
+
+
+@app.on_event("shutdown")
+async def flush_ai_usage_rollups():
+    from app.services.ai_usage import usage_rollups
+    await usage_rollups.stop()
+
+
+@app.on_event("shutdown")
+async def flush_ai_log_writer():
+    # After the job workers: they may still be writing logs
+    from app.services.ai_log_writer import ai_log_writer
+    await ai_log_writer.stop()
+
+
+@app.on_event("shutdown")
+async def shutdown_http_clients():
+    await close_http_clients()
+
+
+@app.on_event("startup")
+async def purge_expired_ai_cache():
+    from app.services.ai_cache import ai_cache
+    try:
+        await ai_cache.purge_expired()
+    except Exception as e:
+        print(f"Failed to purge AI cache: {e}")
+    from app.services.vision_cache import vision_cache
+    try:
+        await vision_cache.purge_expired()
+    except Exception as e:
+        print(f"Failed to purge vision cache: {e}")
+    from app.services.idempotency import idempotency_store
+    try:
+        await idempotency_store.purge_expired()
+    except Exception as e:
+        print(f"Failed to purge idempotency records: {e}")
+
+
 @app.on_event("startup")
 async def seed_system_notifications():
     from app.models.users import User
@@ -0,0 +1,204 @@
+"""
+Background AI job tests against a local fake provider (no network, no running server).
+
+    python test_ai_jobs.py        or        python -m pytest test_ai_jobs.py
+"""
+import asyncio
+import json
+import os
+
+os.environ.setdefault("DATABASE_URL", "sqlite://:memory:")
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ.setdefault("SILICONFLOW_API_KEY", "test")
+os.environ["SILICONFLOW_BASE_URL"] = "http://fake-provider.local/v1"
+os.environ["AI_JOB_RETRY_BASE_SECONDS"] = "0.01"
+os.environ["AI_CACHE_ENABLED"] = "0"
+
+import httpx
+from tortoise import Tortoise
+
+from app.core import http_clients
+from app.core.config import settings
+from app.models.ai_logs import AIJob
+from app.models.users import User
+from app.services.ai_jobs import JobQueue
+from app.services.ai_log_writer import ai_log_writer
+
+MEAL_PLAN = {"title": "一周减脂餐", "overview": "低油低盐", "daily_plans": [{"day": 1, "meals": []}], "shopping_list": []}
+
+
+class FakeProvider:
+    """Stands in for SiliconFlow: chat completions return queued replies, image generations return fake URLs."""
+
+    def __init__(self, chat_replies=None, image_status=200, chat_status=200):
+        self.chat_replies = list(chat_replies or [])
+        self.image_status = image_status
+        self.chat_status = chat_status
+        self.image_prompts = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path.endswith("/chat/completions"):
+            if self.chat_status != 200:
+                return httpx.Response(self.chat_status, json={"error": {"message": "upstream error"}})
+            content = self.chat_replies.pop(0) if len(self.chat_replies) > 1 else self.chat_replies[0]
+            return httpx.Response(200, json={
+                "id": "fake", "object": "chat.completion", "created": 0, "model": "fake",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            })
+        if path.endswith("/images/generations"):
+            self.image_prompts.append(json.loads(request.content)["prompt"])
+            if self.image_status != 200:
+                return httpx.Response(self.image_status, json={"message": "upstream error"})
+            return httpx.Response(200, json={"images": [{"url": f"http://fake-images.local/{len(self.image_prompts)}.png"}]})
+        return httpx.Response(200, content=b"fake image bytes")
+
+    def install(self):
+        # The LLM clients keep the pooled httpx client they were built with, so it is patched once
+        # and routes to whichever provider is current
+        global _current_provider
+        if _current_provider is None:
+            transport = httpx.MockTransport(lambda request: _current_provider.handler(request))
+            for name in http_clients.UPSTREAMS:
+                http_clients._clients[name] = httpx.AsyncClient(transport=transport)
+        _current_provider = self
+
+
+_current_provider = None
+
+
+async def run_job(provider: FakeProvider, kind: str, params: dict, feature: str, events: list = None, setup=None, check=None) -> AIJob:
+    await Tortoise.init(config=settings.TORTOISE_ORM)
+    await Tortoise.generate_schemas()
+    provider.install()
+    queue = JobQueue(concurrency=2)
+    try:
+        user = await User.create(username="job-user", password_hash="x", nickname="job-user")
+        if setup is not None:
+            await setup(user)
+        job = await queue.submit(user.id, kind, params, feature=feature, input_summary="test")
+        subscriber = queue.subscribe(job.id)
+        while True:
+            event, data = await asyncio.wait_for(subscriber.get(), timeout=10)
+            if events is not None:
+                events.append((event, data))
+            if event in ("done", "error"):
+                break
+        if check is not None:
+            await check(user)
+        return await AIJob.get(id=job.id)
+    finally:
+        await queue.stop()
+        await Tortoise.close_connections()
+
+
+def test_meal_plan_job_succeeds_and_links_log():
+    async def scenario():
+        job = await run_job(FakeProvider([json.dumps(MEAL_PLAN)]), "meal-plan", {"duration_days": 1}, "meal-plan")
+        assert job.status == "succeeded", job.error
+        assert job.attempts == 1
+        assert job.result["title"] == MEAL_PLAN["title"]
+        assert job.log_id is not None
+    asyncio.run(scenario())
+
+
+def test_meal_plan_job_retries_unparseable_output():
+    async def scenario():
+        provider = FakeProvider(["not json", json.dumps(MEAL_PLAN)])
+        events = []
+        job = await run_job(provider, "meal-plan", {"duration_days": 1}, "meal-plan", events)
+        assert job.status == "succeeded", job.error
+        assert job.attempts == 2
+        assert any(e == "status" and d["status"] == "queued" for e, d in events)
+    asyncio.run(scenario())
+
+
+def test_meal_plan_job_retries_when_saving_the_result_fails():
+    async def scenario():
+        original = ai_log_writer.flush
+        failures = []
+
+        async def flaky_flush():
+            if not failures:
+                failures.append(1)
+                raise ConnectionError("database went away")
+            await original()
+
+        async def setup(user):
+            ai_log_writer.flush = flaky_flush
+
+        async def check(user):
+            ai_log_writer.flush = original
+
+        events = []
+        try:
+            job = await run_job(FakeProvider([json.dumps(MEAL_PLAN)]), "meal-plan", {"duration_days": 1}, "meal-plan", events, setup, check)
+        finally:
+            ai_log_writer.flush = original
+        assert job.status == "succeeded", job.error
+        assert job.attempts == 2
+        assert [e for e, _ in events if e in ("done", "error")] == ["done"]
+    asyncio.run(scenario())
+
+
+def test_meal_plan_job_fails_after_max_attempts():
+    async def scenario():
+        job = await run_job(FakeProvider(["still not json"]), "meal-plan", {"duration_days": 1}, "meal-plan")
+        assert job.status == "failed"
+        assert job.attempts == job.max_attempts
+        assert job.log_id is None
+    asyncio.run(scenario())
+
+
+def test_step_images_job_reports_progress():
+    async def scenario():
+        provider = FakeProvider(["{}"])
+        events = []
+        recipe = {"title": "番茄炒蛋", "steps": ["切番茄", "打鸡蛋", "翻炒"]}
+        job = await run_job(provider, "generate-recipe-image", {"recipe_data": recipe, "image_type": "steps"},
+                            "generate-recipe-image-steps", events)
+        assert job.status == "succeeded", job.error
+        assert [img["step_index"] for img in job.result["images"]] == [0, 1, 2]
+        assert len(provider.image_prompts) == 3
+        progress = [d for e, d in events if e == "progress"]
+        assert progress and progress[-1]["done"] == 3
+    asyncio.run(scenario())
+
+
+def test_step_images_job_retries_when_every_step_fails():
+    async def scenario():
+        provider = FakeProvider(["{}"], image_status=500)
+        recipe = {"title": "番茄炒蛋", "steps": ["切番茄", "翻炒"]}
+        job = await run_job(provider, "generate-recipe-image", {"recipe_data": recipe, "image_type": "steps"},
+                            "generate-recipe-image-steps")
+        assert job.status == "failed"
+        assert job.attempts == job.max_attempts
+    asyncio.run(scenario())
+
+
+def test_health_advice_job_marks_profile_failed_when_upstream_errors():
+    from app.models.health import HealthProfile
+    from app.services.health_ai_service import DEFAULT_DIETARY_ADVICE
+
+    async def setup(user):
+        await HealthProfile.create(user=user, height=175, weight=80, advice_key="overweight:lose", advice_status="pending")
+
+    async def check(user):
+        profile = await HealthProfile.get(user=user)
+        assert profile.advice_status == "failed"
+        assert profile.dietary_advice == DEFAULT_DIETARY_ADVICE
+
+    async def scenario():
+        params = {"bmi_bucket": "overweight", "goal": "lose", "advice_key": "overweight:lose"}
+        job = await run_job(FakeProvider(["{}"], chat_status=400), "health-advice", params, "health-advice",
+                            setup=setup, check=check)
+        assert job.status == "failed"
+        assert job.attempts == job.max_attempts
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"{name}: OK")
@@ -0,0 +1,72 @@
+"""
+AILog write-behind tests (app/services/ai_log_writer.py) against an in-memory database.
+
+    python test_ai_log_writer.py        or        python -m pytest test_ai_log_writer.py
+"""
+import asyncio
+import os
+
+os.environ.setdefault("DATABASE_URL", "sqlite://:memory:")
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ.setdefault("SILICONFLOW_API_KEY", "test")
+os.environ.setdefault("SILICONFLOW_BASE_URL", "http://fake-provider.local/v1")
+
+from tortoise import Tortoise
+
+from app.core.config import settings
+from app.models.ai_logs import AILog
+from app.models.users import User
+from app.services.ai_log_writer import AILogWriter
+
+
+async def with_db(body):
+    await Tortoise.init(config=settings.TORTOISE_ORM)
+    await Tortoise.generate_schemas()
+    try:
+        user = await User.create(username="log-user", password_hash="x", nickname="log-user")
+        await body(user)
+    finally:
+        await Tortoise.close_connections()
+
+
+def test_bad_row_does_not_drop_the_batch():
+    async def body(user):
+        writer = AILogWriter()
+        good = [await writer.create(user.id, "text-to-recipe", "番茄", {"title": f"菜{i}"}) for i in range(3)]
+        bad = await writer.create(user.id + 1000, "text-to-recipe", "鸡蛋", {"title": "没有用户"})
+        # The batch is retried once as a whole, then row by row
+        assert await writer._flush_once() is False
+        assert await writer._flush_once() is True
+        assert sorted(await AILog.all().values_list("id", flat=True)) == good
+        assert list(writer._rows) == [bad]
+        for _ in range(2):
+            await writer._flush_once()
+        assert not writer._rows
+
+    asyncio.run(with_db(body))
+
+
+def test_update_for_a_log_written_elsewhere_is_kept_until_it_appears():
+    async def body(user):
+        writer = AILogWriter()
+        # Log inserted by another worker that has not flushed yet
+        log_id = 10_000
+        await writer.attach(user.id, log_id, "image_url", "http://img/1.png")
+        for _ in range(5):
+            await writer._flush_once()
+        assert log_id in writer._patches
+        await AILog.create(id=log_id, user_id=user.id, feature="text-to-recipe", output_result={"title": "番茄炒蛋"})
+        await writer.flush()
+        log = await AILog.get(id=log_id)
+        assert log.output_result == {"title": "番茄炒蛋", "image_url": "http://img/1.png"}
+        assert log.output_summary == {"title": "番茄炒蛋", "image_url": "http://img/1.png"}
+        assert not writer._patches
+
+    asyncio.run(with_db(body))
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"{name}: OK")
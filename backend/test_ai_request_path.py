@@ -0,0 +1,431 @@
+"""
+Tests for the shared machinery in front of upstream AI calls, using fake providers (no network, no running server):
+idempotency keys, single-flight coalescing, admission control, circuit breakers and streamed model calls.
+
+    python test_ai_request_path.py        or        python -m pytest test_ai_request_path.py
+"""
+import asyncio
+import os
+
+os.environ.setdefault("DATABASE_URL", "sqlite://:memory:")
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ.setdefault("SILICONFLOW_API_KEY", "test")
+os.environ.setdefault("SILICONFLOW_BASE_URL", "http://fake-provider.local/v1")
+
+import httpx
+from tortoise import Tortoise
+
+from app.core import admission as admission_module
+from app.core.admission import AdmissionController, AdmissionRejected, AdmissionTransport, TokenBucket, llm_priority
+from app.core.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitBreakerTransport, CircuitOpenError, default_is_failure
+from app.core.config import settings
+from app.services import model_router as model_router_module
+from app.services.idempotency import IdempotencyError, IdempotencyStore
+from app.services.model_router import ModelRouter, Served
+from app.services.single_flight import SingleFlight
+
+
+class FakeProvider:
+    """Stands in for an upstream: answers with queued status codes and can hold requests until released."""
+
+    def __init__(self, statuses=None, hold: bool = False):
+        self.statuses = list(statuses or [200])
+        self.requests = []
+        self.release = asyncio.Event()
+        if not hold:
+            self.release.set()
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        await self.release.wait()
+        status = self.statuses.pop(0) if len(self.statuses) > 1 else self.statuses[0]
+        return httpx.Response(status, json={"model": request.headers.get("x-tag")})
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handler)
+
+
+class CountingProducer:
+    """Fake generation: counts calls and can be held open to test requests that overlap it."""
+
+    def __init__(self, result=None, error: Exception = None):
+        self.result = result if result is not None else {"title": "番茄炒蛋"}
+        self.error = error
+        self.calls = 0
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+        self.release.set()
+        self.cancelled = False
+
+    async def __call__(self):
+        self.calls += 1
+        self.started.set()
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error is not None:
+            raise self.error
+        return dict(self.result)
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def with_db(scenario):
+    async def run():
+        await Tortoise.init(config=settings.TORTOISE_ORM)
+        await Tortoise.generate_schemas()
+        try:
+            await scenario()
+        finally:
+            await Tortoise.close_connections()
+    asyncio.run(run())
+
+
+# --- Idempotency keys ---
+
+def test_idempotency_replays_completed_response():
+    async def scenario():
+        store, producer = IdempotencyStore(), CountingProducer()
+        first, replayed = await store.run(1, "key-1", "text-to-recipe", {"description": "番茄"}, producer)
+        assert not replayed
+        second, replayed = await store.run(1, "key-1", "text-to-recipe", {"description": "番茄"}, producer)
+        assert replayed and second == first
+        assert producer.calls == 1
+        # Keys are per user
+        _, replayed = await store.run(2, "key-1", "text-to-recipe", {"description": "番茄"}, producer)
+        assert not replayed and producer.calls == 2
+    with_db(scenario)
+
+
+def test_idempotency_retry_attaches_to_running_request():
+    async def scenario():
+        store, producer = IdempotencyStore(), CountingProducer()
+        producer.release.clear()
+        payload = {"description": "番茄"}
+        original = asyncio.create_task(store.run(1, "key-2", "text-to-recipe", payload, producer))
+        await producer.started.wait()
+        retry = asyncio.create_task(store.run(1, "key-2", "text-to-recipe", payload, producer))
+        await settle()
+        # The client that started it goes away; the work still finishes for the retry
+        original.cancel()
+        producer.release.set()
+        result, replayed = await retry
+        assert replayed and result == producer.result
+        assert producer.calls == 1
+    with_db(scenario)
+
+
+def test_idempotency_rejects_key_reuse_with_different_body():
+    async def scenario():
+        store, producer = IdempotencyStore(), CountingProducer()
+        await store.run(1, "key-3", "text-to-recipe", {"description": "番茄"}, producer)
+        for endpoint, payload in (("text-to-recipe", {"description": "土豆"}), ("fridge-to-recipe", {"description": "番茄"})):
+            try:
+                await store.run(1, "key-3", endpoint, payload, producer)
+            except IdempotencyError as e:
+                assert e.status_code == 422
+            else:
+                raise AssertionError("key reuse was accepted")
+        assert producer.calls == 1
+    with_db(scenario)
+
+
+def test_idempotency_failure_frees_the_key():
+    async def scenario():
+        store = IdempotencyStore()
+        failing = CountingProducer(error=RuntimeError("upstream down"))
+        try:
+            await store.run(1, "key-4", "text-to-recipe", {}, failing)
+        except RuntimeError:
+            pass
+        producer = CountingProducer()
+        _, replayed = await store.run(1, "key-4", "text-to-recipe", {}, producer)
+        assert not replayed and producer.calls == 1
+    with_db(scenario)
+
+
+# --- Single flight ---
+
+def test_single_flight_coalesces_identical_calls():
+    async def scenario():
+        flights, producer = SingleFlight(), CountingProducer()
+        producer.release.clear()
+        tasks = [asyncio.create_task(flights.do("k", producer)) for _ in range(3)]
+        await settle()
+        producer.release.set()
+        results = await asyncio.gather(*tasks)
+        assert producer.calls == 1
+        assert results == [producer.result] * 3
+        # Every caller gets its own copy
+        results[0]["title"] = "changed"
+        assert results[1]["title"] == "番茄炒蛋"
+    asyncio.run(scenario())
+
+
+def test_single_flight_cancelled_waiter_does_not_cancel_the_others():
+    async def scenario():
+        flights, producer = SingleFlight(), CountingProducer()
+        producer.release.clear()
+        first = asyncio.create_task(flights.do("k", producer))
+        second = asyncio.create_task(flights.do("k", producer))
+        await settle()
+        first.cancel()
+        await settle()
+        assert not producer.cancelled
+        producer.release.set()
+        assert await second == producer.result
+        assert first.cancelled()
+        assert producer.calls == 1
+    asyncio.run(scenario())
+
+
+def test_single_flight_last_waiter_cancels_the_call():
+    async def scenario():
+        flights, producer = SingleFlight(), CountingProducer()
+        producer.release.clear()
+        waiters = [asyncio.create_task(flights.do("k", producer)) for _ in range(2)]
+        await settle()
+        for waiter in waiters:
+            waiter.cancel()
+        await settle()
+        assert producer.cancelled
+        # A new caller starts a fresh flight instead of joining the dying one
+        producer.release.set()
+        assert await flights.do("k", producer) == producer.result
+        assert producer.calls == 2
+    asyncio.run(scenario())
+
+
+# --- Admission control ---
+
+def test_admission_serves_waiters_by_priority():
+    async def scenario():
+        controller = AdmissionController()
+        controller.gate("fake-model").limit = 1
+        provider = FakeProvider(hold=True)
+        client = httpx.AsyncClient(transport=AdmissionTransport(provider.transport(), controller))
+
+        async def call(priority: str):
+            with llm_priority(priority):
+                response = await client.post("http://fake-provider.local/v1/chat/completions",
+                                             json={"model": "fake-model"}, headers={"x-tag": priority})
+            return response.status_code
+
+        # The first call holds the only slot; the rest queue in the worst possible order
+        tasks = [asyncio.create_task(call("background"))]
+        await settle()
+        for priority in ("background", "recipe", "interactive"):
+            tasks.append(asyncio.create_task(call(priority)))
+            await settle()
+        assert controller.gate("fake-model").queued == 3
+        provider.release.set()
+        assert await asyncio.gather(*tasks) == [200] * 4
+        order = [request.headers["x-tag"] for request in provider.requests]
+        assert order == ["background", "interactive", "recipe", "background"]
+        assert controller.gate("fake-model").active == 0
+        await client.aclose()
+    asyncio.run(scenario())
+
+
+def test_token_bucket_refills_over_time():
+    async def scenario():
+        bucket = TokenBucket(rate_per_second=20, capacity=2)
+        assert bucket.take() == 0
+        assert bucket.take() == 0
+        wait = bucket.take()
+        assert 0 < wait <= 0.05  # seconds until the next token
+        await asyncio.sleep(0.06)
+        assert bucket.take() == 0
+        # Refill stops at the burst size
+        await asyncio.sleep(0.2)
+        assert [bucket.take() for _ in range(3)][:2] == [0, 0]
+        assert bucket.tokens < 1
+    asyncio.run(scenario())
+
+
+def test_admission_rate_limits_per_key():
+    controller = AdmissionController()
+    for _ in range(int(admission_module.USER_AI_BURST)):
+        controller.check("interactive", "user:1")
+    try:
+        controller.check("interactive", "user:1")
+    except AdmissionRejected as e:
+        assert e.retry_after >= 1
+    else:
+        raise AssertionError("burst was not limited")
+    # Other users have their own bucket
+    controller.check("interactive", "user:2")
+
+
+def test_admission_rejects_only_on_the_models_it_calls():
+    async def scenario():
+        controller = AdmissionController()
+        busy = controller.gate("vision-model")
+        busy.limit = 1
+        busy.hold_seconds = 30
+        await busy.acquire(0)
+        waiter = asyncio.create_task(busy.acquire(0))
+        await settle()
+        try:
+            controller.check("interactive", "user:1", ("vision-model",))
+        except AdmissionRejected as e:
+            assert e.reason.startswith("AI service is busy")
+        else:
+            raise AssertionError("saturated gate was admitted")
+        # A text request doesn't wait on the vision queue; background work always queues
+        controller.check("interactive", "user:1", ("text-model",))
+        controller.check("background", "user:1", ("vision-model",))
+        waiter.cancel()
+        await settle()
+    asyncio.run(scenario())
+
+
+# --- Circuit breakers ---
+
+def make_breaker() -> CircuitBreaker:
+    return CircuitBreaker("fake-upstream", failure_rate=0.5, min_calls=2, window_seconds=30, open_seconds=0.05, half_open_probes=2)
+
+
+def test_breaker_opens_fails_fast_and_closes_after_probes():
+    async def scenario():
+        breaker = make_breaker()
+        provider = FakeProvider([503, 503, 200])
+        client = httpx.AsyncClient(transport=CircuitBreakerTransport(provider.transport(), breaker))
+        url = "http://fake-provider.local/v1/x"
+        for _ in range(2):
+            assert (await client.get(url)).status_code == 503
+        assert breaker.state == OPEN
+        try:
+            await client.get(url)
+        except CircuitOpenError:
+            pass
+        else:
+            raise AssertionError("open breaker let a call through")
+        assert len(provider.requests) == 2
+
+        await asyncio.sleep(0.06)
+        provider.release.clear()
+        probes = [asyncio.create_task(client.get(url)) for _ in range(2)]
+        await settle()
+        assert breaker.state == HALF_OPEN
+        # Only `half_open_probes` calls go out while half-open
+        assert not breaker.allow()
+        provider.release.set()
+        assert [r.status_code for r in await asyncio.gather(*probes)] == [200, 200]
+        assert breaker.state == CLOSED
+        await client.aclose()
+    asyncio.run(scenario())
+
+
+def test_breaker_failed_probe_reopens():
+    async def scenario():
+        breaker = make_breaker()
+        provider = FakeProvider([503])
+        client = httpx.AsyncClient(transport=CircuitBreakerTransport(provider.transport(), breaker))
+        for _ in range(2):
+            await client.get("http://fake-provider.local/v1/x")
+        await asyncio.sleep(0.06)
+        assert breaker.allow()  # the probe
+        assert breaker.state == HALF_OPEN
+        breaker.record_failure()
+        assert breaker.state == OPEN
+        assert not breaker.allow()
+        await client.aclose()
+    asyncio.run(scenario())
+
+
+def test_breaker_ignores_rejected_requests_inside_exception_groups():
+    request = httpx.Request("POST", "http://fake-provider.local/mcp")
+
+    def status_error(code: int) -> httpx.HTTPStatusError:
+        return httpx.HTTPStatusError("error", request=request, response=httpx.Response(code, request=request))
+
+    assert not default_is_failure(status_error(401))
+    assert not default_is_failure(ExceptionGroup("transport", [status_error(401)]))
+    assert default_is_failure(ExceptionGroup("transport", [ExceptionGroup("inner", [status_error(502)])]))
+    assert default_is_failure(ExceptionGroup("transport", [httpx.ConnectError("refused")]))
+
+    async def scenario():
+        breaker = make_breaker()
+        for _ in range(3):
+            try:
+                async with breaker.guard():
+                    raise ExceptionGroup("transport", [status_error(401)])
+            except ExceptionGroup:
+                pass
+        assert breaker.state == CLOSED
+    asyncio.run(scenario())
+
+
+# --- Streamed model calls ---
+
+class FakeStreamingModel:
+    """Streams queued chunk lists; a None entry is a pause long enough to count as a stall."""
+
+    model_name = "fake/streaming-model"
+
+    def __init__(self, *streams):
+        self.streams = list(streams)
+        self.closed = 0
+
+    async def astream(self):
+        chunks = self.streams.pop(0)
+        try:
+            for chunk in chunks:
+                if chunk is None:
+                    await asyncio.sleep(10)
+                yield chunk
+        finally:
+            self.closed += 1
+
+
+async def collect(stream, chunks: list):
+    async for chunk in stream:
+        chunks.append(chunk)
+
+
+def test_stalled_stream_times_out_and_closes_the_upstream():
+    model_router_module.FEATURE_SLOS["test-stream"] = 0.05
+    async def scenario():
+        llm = FakeStreamingModel(["番茄", "炒蛋", None, "不会到达"])
+        chunks = []
+        try:
+            await collect(ModelRouter(timeout_seconds=1).stream("test-stream", llm, lambda m: m.astream()), chunks)
+            assert False, "stalled stream was not cut off"
+        except asyncio.TimeoutError:
+            pass
+        assert chunks == ["番茄", "炒蛋"]
+        assert llm.closed == 1
+    try:
+        asyncio.run(scenario())
+    finally:
+        model_router_module.FEATURE_SLOS.pop("test-stream")
+
+
+def test_stream_without_a_first_chunk_is_hedged():
+    model_router_module.FEATURE_SLOS["test-stream"] = 0.05
+    async def scenario():
+        # The primary stays silent; the hedged request answers and the primary is closed
+        llm = FakeStreamingModel([None, "慢"], ["快", "答"])
+        route = Served()
+        chunks = []
+        await collect(ModelRouter(timeout_seconds=1).stream("test-stream", llm, lambda m: m.astream(), route), chunks)
+        assert chunks == ["快", "答"]
+        assert llm.closed == 2
+        assert not route.fallback  # no fallback model configured: hedged on the same model
+    try:
+        asyncio.run(scenario())
+    finally:
+        model_router_module.FEATURE_SLOS.pop("test-stream")
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"{name}: OK")
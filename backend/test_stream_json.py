@@ -0,0 +1,153 @@
+"""
+Incremental JSON parsing tests for streamed model output (app/services/stream_json.py).
+
+    python test_stream_json.py        or        python -m pytest test_stream_json.py
+"""
+import json
+import random
+import time
+
+from app.services.stream_json import JSONFieldStreamer, PartialDict, PartialJSONParser, PartialList, is_complete, parse_partial_json
+
+RECIPE = {
+    "title": "番茄炒蛋",
+    "description": "酸甜\"下饭\"\n家常菜 \\ 10分钟",
+    "ingredients": [["番茄", "2个"], ["鸡蛋", "3个"]],
+    "steps": ["番茄切块", "鸡蛋打散，加盐", "大火翻炒"],
+    "nutrition": {"calories": 320, "protein": 18.5, "fat": 20, "carbs": 12},
+    "cooking_time": "10分钟",
+    "vegetarian": True,
+    "note": None,
+}
+
+
+def feed_in_chunks(text: str, size: int, item_fields=None):
+    streamer = JSONFieldStreamer(item_fields)
+    events = []
+    for i in range(0, len(text), size):
+        events.extend(streamer.feed(text[i:i + size]))
+    return events
+
+
+def test_complete_object_matches_json_loads():
+    text = json.dumps(RECIPE, ensure_ascii=False)
+    assert parse_partial_json(text) == RECIPE
+    assert is_complete(parse_partial_json(text))
+
+
+def test_string_split_across_chunks_is_emitted_once_whole():
+    text = json.dumps(RECIPE, ensure_ascii=False)
+    for size in (1, 3, 7):
+        events = feed_in_chunks(text, size, {"steps": "step"})
+        fields = [value for event, value in events if event == "title"]
+        assert fields == ["番茄炒蛋"], size
+        steps = [value for event, value in events if event == "step"]
+        assert steps == [{"index": i, "value": step} for i, step in enumerate(RECIPE["steps"])], size
+
+
+def test_unfinished_string_is_left_out():
+    assert parse_partial_json('{"title": "番茄炒蛋", "description": "酸甜') == {"title": "番茄炒蛋"}
+    assert parse_partial_json('{"title": "番茄') == {}
+
+
+def test_escapes():
+    text = json.dumps({"text": "引号\" 反斜杠\\ 换行\n 制表\t unicodeé"}, ensure_ascii=True)
+    assert parse_partial_json(text) == json.loads(text)
+    # Cut inside an escape sequence: the string is not finished yet
+    assert parse_partial_json('{"a": "x\\') == {}
+    assert parse_partial_json('{"a": "\\u00') == {}
+    assert parse_partial_json('{"a": "\\u00e9"}') == {"a": "é"}
+
+
+def test_markdown_fences_and_think_block():
+    body = json.dumps({"title": "番茄炒蛋", "steps": ["切", "炒"]}, ensure_ascii=False)
+    assert parse_partial_json(f"```json\n{body}\n```") == {"title": "番茄炒蛋", "steps": ["切", "炒"]}
+    assert parse_partial_json(f"好的，这是菜谱：\n```\n{body}\n```") == {"title": "番茄炒蛋", "steps": ["切", "炒"]}
+    # Braces inside the reasoning are not the answer
+    assert parse_partial_json("<think>先想想 {不是JSON}") is None
+    assert parse_partial_json(f"<think>先想想 {{x}}</think>{body}")["title"] == "番茄炒蛋"
+
+
+def test_nested_arrays_keep_only_finished_members():
+    value = parse_partial_json('{"ingredients": [["番茄", "2个"], ["鸡蛋", "3')
+    assert isinstance(value, PartialDict)
+    ingredients = value["ingredients"]
+    assert isinstance(ingredients, PartialList)
+    assert ingredients[0] == ["番茄", "2个"] and is_complete(ingredients[0])
+    assert ingredients[1] == ["鸡蛋"] and not is_complete(ingredients[1])
+
+    events = feed_in_chunks(json.dumps(RECIPE, ensure_ascii=False), 5, {"ingredients": "ingredient"})
+    items = [value["value"] for event, value in events if event == "ingredient"]
+    assert items == RECIPE["ingredients"]
+
+
+def test_truncated_input():
+    text = json.dumps(RECIPE, ensure_ascii=False)
+    for end in range(len(text) + 1):
+        value = parse_partial_json(text[:end])
+        if value is None:
+            assert "{" not in text[:end]
+            continue
+        # Every field seen so far is a finished value (or a container still being written)
+        for key, field in value.items():
+            if is_complete(field):
+                assert field == RECIPE[key], (end, key)
+    # A number at the very end may still be growing
+    assert parse_partial_json('{"calories": 32') == {}
+    assert parse_partial_json('{"calories": 320,') == {"calories": 320}
+    assert parse_partial_json('{"ok": tr') == {}
+
+
+def test_streamer_emits_fields_once_in_order():
+    events = feed_in_chunks(json.dumps(RECIPE, ensure_ascii=False), 4, {"steps": "step"})
+    names = [event for event, _ in events if event != "step"]
+    assert names == [key for key in RECIPE if key != "steps"]
+    assert len(names) == len(set(names))
+
+
+def test_replay_of_cached_result():
+    streamer = JSONFieldStreamer({"steps": "step"})
+    events = streamer.replay(RECIPE)
+    assert ("title", "番茄炒蛋") in events
+    assert [value["index"] for event, value in events if event == "step"] == [0, 1, 2]
+    assert streamer.replay(RECIPE) == []
+
+
+def test_chunk_boundaries_do_not_change_the_result():
+    text = "<think>先看看有哪些食材</think>```json\n" + json.dumps(RECIPE, ensure_ascii=True) + "\n```"
+    expected = feed_in_chunks(text, len(text), {"steps": "step"})
+    rng = random.Random(7)
+    for _ in range(20):
+        streamer = JSONFieldStreamer({"steps": "step"})
+        events, i = [], 0
+        while i < len(text):
+            size = rng.randint(1, 9)
+            events.extend(streamer.feed(text[i:i + size]))
+            i += size
+        assert events == expected
+        assert streamer.text == text
+    parser = PartialJSONParser()
+    for char in text:
+        value = parser.feed(char)
+    assert value == RECIPE and is_complete(value)
+
+
+def test_feeding_is_linear_in_output_length():
+    # A long meal plan streamed one character at a time; re-parsing the buffer per chunk takes minutes
+    day = {"day": 1, "meals": [{"type": "午餐", "name": "鸡胸肉沙拉", "calories": 450, "ingredients": ["鸡胸肉 150g", "生菜"]}] * 3}
+    plan = {"title": "一周减脂餐", "daily_plans": [dict(day, day=i) for i in range(200)], "shopping_list": ["鸡胸肉"] * 50}
+    text = json.dumps(plan, ensure_ascii=False)
+    assert len(text) > 50000
+    streamer = JSONFieldStreamer({"daily_plans": "day"})
+    started = time.perf_counter()
+    days = sum(1 for i in range(len(text)) for event, _ in streamer.feed(text[i]) if event == "day")
+    elapsed = time.perf_counter() - started
+    assert days == 200
+    assert elapsed < 2.0, elapsed
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"{name}: OK")
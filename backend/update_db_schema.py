@@ -1,5 +1,43 @@
+import json
+
 from tortoise import Tortoise, run_async
 from app.core.config import settings
+from app.models.ai_logs import summarize_output
+from app.models.fields import encode_payload
+from app.models.health import DailyCheckIn
+from app.services.checkin_stats import rebuild_user
+
+# Rows per batch when moving payloads to their compressed columns
+MIGRATION_BATCH_SIZE = 500
+
+async def backfill_compressed_payloads(conn, table, old_column, new_column, summary_column=None):
+    """Copy a JSON column into its compressed replacement, in id order and in batches (safe to re-run)."""
+    last_id, total = 0, 0
+    while True:
+        _, rows = await conn.execute_query(
+            f"SELECT `id`, `{old_column}` AS `value` FROM `{table}` "
+            f"WHERE `id` > %s AND `{new_column}` IS NULL AND `{old_column}` IS NOT NULL "
+            f"ORDER BY `id` LIMIT %s",
+            [last_id, MIGRATION_BATCH_SIZE],
+        )
+        if not rows:
+            break
+        updates = []
+        for row in rows:
+            value = row["value"]
+            if isinstance(value, (str, bytes)):
+                value = json.loads(value)
+            params = [encode_payload(value)]
+            if summary_column:
+                summary = summarize_output(value)
+                params.append(json.dumps(summary, ensure_ascii=False) if summary else None)
+            updates.append(params + [row["id"]])
+        assignments = f"`{new_column}` = %s" + (f", `{summary_column}` = %s" if summary_column else "")
+        await conn.execute_many(f"UPDATE `{table}` SET {assignments} WHERE `id` = %s", updates)
+        last_id = rows[-1]["id"]
+        total += len(rows)
+        print(f"Compressed {total} rows of {table}.{old_column}")
+    return total
 
 async def upgrade_db():
     await Tortoise.init(config=settings.TORTOISE_ORM)
@@ -164,6 +202,127 @@ async def upgrade_db():
     except Exception as e:
         print(f"Failed to create users_roles table: {e}")
 
+    # Rolling conversation summary on chat_sessions
+    try:
+        await conn.execute_script("ALTER TABLE `chat_sessions` ADD COLUMN `summary` LONGTEXT NULL;")
+        print("Added summary to chat_sessions")
+    except Exception as e:
+        print(f"Failed to add summary to chat_sessions (might already exist): {e}")
+
+    try:
+        await conn.execute_script("ALTER TABLE `chat_sessions` ADD COLUMN `summary_message_id` BIGINT NULL;")
+        print("Added summary_message_id to chat_sessions")
+    except Exception as e:
+        print(f"Failed to add summary_message_id to chat_sessions (might already exist): {e}")
+
+    try:
+        await conn.execute_script("ALTER TABLE `chat_sessions` ADD COLUMN `title_generated` BOOL NOT NULL DEFAULT 0;")
+        print("Added title_generated to chat_sessions")
+    except Exception as e:
+        print(f"Failed to add title_generated to chat_sessions (might already exist): {e}")
+
+    # Compressed payload columns (app/models/fields.py). The old JSON columns are kept until the
+    # backfill has been verified; drop them by hand afterwards.
+    try:
+        await conn.execute_script("ALTER TABLE `ai_logs` ADD COLUMN `output_payload` LONGBLOB NULL;")
+        print("Added output_payload to ai_logs")
+    except Exception as e:
+        print(f"Failed to add output_payload to ai_logs (might already exist): {e}")
+
+    try:
+        await conn.execute_script("ALTER TABLE `ai_logs` ADD COLUMN `output_summary` JSON NULL;")
+        print("Added output_summary to ai_logs")
+    except Exception as e:
+        print(f"Failed to add output_summary to ai_logs (might already exist): {e}")
+
+    try:
+        await conn.execute_script("ALTER TABLE `chat_messages` ADD COLUMN `thoughts_payload` LONGBLOB NULL;")
+        print("Added thoughts_payload to chat_messages")
+    except Exception as e:
+        print(f"Failed to add thoughts_payload to chat_messages (might already exist): {e}")
+
+    try:
+        await backfill_compressed_payloads(conn, "ai_logs", "output_result", "output_payload", "output_summary")
+        await backfill_compressed_payloads(conn, "chat_messages", "thoughts", "thoughts_payload")
+    except Exception as e:
+        print(f"Failed to backfill compressed payloads: {e}")
+
+    # Inputs of the locally computed calorie target, and state of the advice generated in the background
+    try:
+        await conn.execute_script("ALTER TABLE `health_profiles` ADD COLUMN `gender` VARCHAR(10) NULL;")
+        print("Added gender to health_profiles")
+    except Exception as e:
+        print(f"Failed to add gender to health_profiles (might already exist): {e}")
+
+    try:
+        await conn.execute_script("ALTER TABLE `health_profiles` ADD COLUMN `age` INT NULL;")
+        print("Added age to health_profiles")
+    except Exception as e:
+        print(f"Failed to add age to health_profiles (might already exist): {e}")
+
+    try:
+        await conn.execute_script("ALTER TABLE `health_profiles` ADD COLUMN `activity_level` VARCHAR(20) NULL;")
+        print("Added activity_level to health_profiles")
+    except Exception as e:
+        print(f"Failed to add activity_level to health_profiles (might already exist): {e}")
+
+    try:
+        await conn.execute_script("ALTER TABLE `health_profiles` ADD COLUMN `goal` VARCHAR(20) NULL;")
+        print("Added goal to health_profiles")
+    except Exception as e:
+        print(f"Failed to add goal to health_profiles (might already exist): {e}")
+
+    try:
+        await conn.execute_script("ALTER TABLE `health_profiles` ADD COLUMN `advice_key` VARCHAR(50) NULL;")
+        print("Added advice_key to health_profiles")
+    except Exception as e:
+        print(f"Failed to add advice_key to health_profiles (might already exist): {e}")
+
+    try:
+        await conn.execute_script("ALTER TABLE `health_profiles` ADD COLUMN `advice_status` VARCHAR(20) NOT NULL DEFAULT 'ready';")
+        print("Added advice_status to health_profiles")
+    except Exception as e:
+        print(f"Failed to add advice_status to health_profiles (might already exist): {e}")
+
+    # Vision cache: one row per (feature, model, image hash); keep the newest of any duplicates
+    try:
+        await conn.execute_script("""
+            DELETE `older` FROM `vision_cache_entries` `older`
+            JOIN `vision_cache_entries` `newer`
+              ON `older`.`feature` = `newer`.`feature`
+             AND `older`.`model` = `newer`.`model`
+             AND `older`.`image_hash` = `newer`.`image_hash`
+             AND `older`.`id` < `newer`.`id`;
+        """)
+        await conn.execute_script(
+            "ALTER TABLE `vision_cache_entries` ADD UNIQUE INDEX `uid_vision_cache_feature_model_hash` (`feature`, `model`, `image_hash`);"
+        )
+        print("Added unique (feature, model, image_hash) index to vision_cache_entries")
+    except Exception as e:
+        print(f"Failed to add vision_cache_entries index (might already exist): {e}")
+
+    # Check-in rollups / streaks (new tables) for check-ins made before they existed
+    try:
+        await Tortoise.generate_schemas(safe=True)
+        user_ids = await DailyCheckIn.all().distinct().values_list("user_id", flat=True)
+        for user_id in user_ids:
+            await rebuild_user(user_id)
+        print(f"Rebuilt check-in rollups for {len(user_ids)} users")
+    except Exception as e:
+        print(f"Failed to rebuild check-in rollups: {e}")
+
+    # Active-user rollup (new table): seed the dashboard window from existing AI logs
+    try:
+        await conn.execute_script("""
+            INSERT IGNORE INTO `ai_active_user_hour` (`bucket`, `user_id`)
+            SELECT DISTINCT DATE_FORMAT(`created_at`, '%Y-%m-%d %H:00:00'), `user_id`
+            FROM `ai_logs`
+            WHERE `created_at` >= NOW() - INTERVAL 72 HOUR;
+        """)
+        print("Seeded ai_active_user_hour from ai_logs")
+    except Exception as e:
+        print(f"Failed to seed ai_active_user_hour: {e}")
+
     await Tortoise.close_connections()
 
 if __name__ == "__main__":
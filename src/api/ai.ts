@@ -28,7 +28,9 @@ export interface AILog {
   id: number;
   feature: string;
   input_summary: string;
-  output_result: any;
+  // Small preview (title / image_url / url); the full result comes from getHistoryDetail
+  output_summary: any;
+  output_result?: any;
   created_at: string;
 }
 
@@ -174,6 +176,11 @@ export const getHistory = async (limit: number = 20, offset: number = 0, feature
   return response.data.history;
 };
 
+export const getHistoryDetail = async (logId: number): Promise<AILog> => {
+  const response = await client.get(`/ai/history/${logId}`);
+  return response.data;
+};
+
 export const generateRecipeImage = async (recipeData: RecipeResult, imageType: 'final' | 'steps' = 'final', sourceLogId?: number): Promise<any> => {
   const response = await client.post('/ai/generate-recipe-image', {
     recipe_data: recipeData,
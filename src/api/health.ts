@@ -4,9 +4,15 @@ export interface HealthProfile {
   id: number;
   height: number;
   weight: number;
+  gender?: 'male' | 'female' | null;
+  age?: number | null;
+  activity_level?: 'sedentary' | 'light' | 'moderate' | 'active' | 'very_active' | null;
+  goal?: 'lose' | 'maintain' | 'gain' | null;
   daily_calorie_target: number;
   dietary_advice: string;
   exercise_advice: string;
+  // 'pending' while the advice is generated in the background
+  advice_status: 'pending' | 'ready' | 'failed';
 }
 
 export interface CheckIn {
@@ -30,11 +36,59 @@ export const getHealthProfile = async (): Promise<HealthProfile | null> => {
   }
 };
 
-export const createOrUpdateHealthProfile = async (height: number, weight: number): Promise<HealthProfile> => {
-  const response = await client.post('/health/profile', { height, weight });
+export const createOrUpdateHealthProfile = async (
+  height: number,
+  weight: number,
+  extra: Pick<Partial<HealthProfile>, 'gender' | 'age' | 'activity_level' | 'goal'> = {}
+): Promise<HealthProfile> => {
+  const response = await client.post('/health/profile', { height, weight, ...extra });
   return response.data;
 };
 
+export interface CheckInPeriodStats {
+  period_start: string;
+  days: number;
+  calories_in: number;
+  calories_burned: number;
+  avg_calories_in: number;
+  avg_calories_burned: number;
+  status_counts: { white: number; orange: number; red: number };
+}
+
+export interface CheckInStats {
+  period: 'week' | 'month';
+  periods: CheckInPeriodStats[];
+  current_streak: number;
+  longest_streak: number;
+  total_days: number;
+  last_date?: string | null;
+}
+
+// Heatmap codes, one character per day starting Jan 1
+export const HEATMAP_STATUS: Record<string, CheckIn['status'] | null> = { '0': null, '1': 'white', '2': 'orange', '3': 'red' };
+
+export const getCheckInStats = async (period: 'week' | 'month' = 'week', limit: number = 12): Promise<CheckInStats> => {
+  const response = await client.get('/health/checkins/stats', { params: { period, limit } });
+  return response.data;
+};
+
+export const getCheckInHeatmap = async (year?: number): Promise<{ year: number; days: string }> => {
+  const response = await client.get('/health/checkins/heatmap', { params: { year } });
+  return response.data;
+};
+
+// Heatmap -> { 'YYYY-MM-DD': status } for the days that have a check-in
+export const heatmapToStatusMap = (year: number, days: string): Record<string, CheckIn['status']> => {
+  const map: Record<string, CheckIn['status']> = {};
+  for (let i = 0; i < days.length; i++) {
+    const status = HEATMAP_STATUS[days[i]];
+    if (status) {
+      map[new Date(Date.UTC(year, 0, 1 + i)).toISOString().split('T')[0]] = status;
+    }
+  }
+  return map;
+};
+
 export const getCheckIns = async (startDate?: string, endDate?: string): Promise<CheckIn[]> => {
   const response = await client.get('/health/checkins', { params: { start_date: startDate, end_date: endDate } });
   return response.data;
@@ -4,7 +4,7 @@ import { SafeAreaView } from 'react-native-safe-area-context';
 import { useNavigation } from '@react-navigation/native';
 import { Ionicons } from '@expo/vector-icons';
 import { theme } from '../../styles/theme';
-import { getHistory, AILog } from '../../../api/ai';
+import { getHistory, getHistoryDetail, AILog } from '../../../api/ai';
 
 const AIGenerationHistoryScreen = () => {
   const navigation = useNavigation<any>();
@@ -26,6 +26,17 @@ const AIGenerationHistoryScreen = () => {
     }
   };
 
+  const openRecipe = async (item: AILog) => {
+    try {
+      const detail = await getHistoryDetail(item.id);
+      if (detail.output_result) {
+        navigation.navigate('GeneratedRecipeResult', { recipe: detail.output_result });
+      }
+    } catch (error) {
+      console.error("Failed to fetch history item", error);
+    }
+  };
+
   const renderItem = ({ item }: { item: AILog }) => {
     // Determine title and image based on log content
     let title = "Generated Content";
@@ -33,13 +44,12 @@ const AIGenerationHistoryScreen = () => {
     let type = "Recipe";
 
     if (item.feature === 'text-to-recipe') {
-      title = item.output_result?.title || "Untitled Recipe";
+      title = item.output_summary?.title || "Untitled Recipe";
+      image = item.output_summary?.image_url || image;
       type = "Recipe";
-      // If we saved the generated image in output_result, use it
-      // For now, use placeholder if not available
     } else if (item.feature === 'text-to-image') {
       title = item.input_summary || "Generated Image";
-      image = item.output_result?.url || image;
+      image = item.output_summary?.url || image;
       type = "Image";
     }
 
@@ -47,8 +57,8 @@ const AIGenerationHistoryScreen = () => {
       <TouchableOpacity 
         style={styles.card}
         onPress={() => {
-          if (item.feature === 'text-to-recipe' && item.output_result) {
-            navigation.navigate('GeneratedRecipeResult', { recipe: item.output_result });
+          if (item.feature === 'text-to-recipe') {
+            openRecipe(item);
           }
         }}
       >
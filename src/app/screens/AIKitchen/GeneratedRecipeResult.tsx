@@ -6,7 +6,7 @@ import { Ionicons } from '@expo/vector-icons';
 import { LinearGradient } from 'expo-linear-gradient';
 import { theme } from '../../styles/theme';
 import { RootStackParamList } from '../../navigation/types';
-import { generateRecipeImage, getHistory, AILog } from '../../../api/ai';
+import { generateRecipeImage, getHistory, getHistoryDetail, AILog } from '../../../api/ai';
 
 type GeneratedRecipeResultRouteProp = RouteProp<RootStackParamList, 'GeneratedRecipeResult'>;
 
@@ -249,9 +249,14 @@ const GeneratedRecipeResult = () => {
     </View>
   );
 
-  const handleHistoryPress = (item: AILog) => {
+  const handleHistoryPress = async (item: AILog) => {
     if (item.feature === 'text-to-recipe' || item.feature === 'image-to-recipe' || item.feature === 'fridge-to-recipe') {
-      (navigation as any).navigate('GeneratedRecipeResult', { recipe: item.output_result });
+      try {
+        const detail = await getHistoryDetail(item.id);
+        (navigation as any).navigate('GeneratedRecipeResult', { recipe: detail.output_result });
+      } catch (error) {
+        console.error('Failed to fetch history item', error);
+      }
     } else {
       // For image generation or others, we might just show an alert or handle differently
       Alert.alert('History Item', 'This is an image generation record.');
@@ -5,7 +5,7 @@ import { Ionicons } from '@expo/vector-icons';
 import { useNavigation, useFocusEffect } from '@react-navigation/native';
 import { LinearGradient } from 'expo-linear-gradient';
 import { theme } from '../../../styles/theme';
-import { fridgeToRecipe, getHistory, AILog } from '../../../../api/ai';
+import { fridgeToRecipe, getHistory, getHistoryDetail, AILog } from '../../../../api/ai';
 import { getFridgeItems, FridgeItem } from '../../../../api/inventory';
 import AIGeneratingModal from '../../../components/AIGeneratingModal';
 
@@ -89,9 +89,14 @@ const FridgeToRecipeFeature = () => {
     }
   };
 
-  const handleHistoryPress = (item: AILog) => {
-    if (item.output_result) {
-      navigation.navigate('GeneratedRecipeResult', { recipe: item.output_result, logId: item.id });
+  const handleHistoryPress = async (item: AILog) => {
+    try {
+      const detail = await getHistoryDetail(item.id);
+      if (detail.output_result) {
+        navigation.navigate('GeneratedRecipeResult', { recipe: detail.output_result, logId: item.id });
+      }
+    } catch (error) {
+      console.error('Failed to fetch history item:', error);
     }
   };
 
@@ -192,15 +197,15 @@ const FridgeToRecipeFeature = () => {
                     onPress={() => handleHistoryPress(item)}
                   >
                     <View style={styles.historyIcon}>
-                      {item.output_result?.image_url ? (
-                        <Image source={{ uri: item.output_result.image_url }} style={styles.historyImage} />
+                      {item.output_summary?.image_url ? (
+                        <Image source={{ uri: item.output_summary.image_url }} style={styles.historyImage} />
                       ) : (
                         <Ionicons name="nutrition-outline" size={20} color={theme.colors.textTertiary} />
                       )}
                     </View>
                     <View style={styles.historyContent}>
                       <Text style={styles.historyTitle} numberOfLines={1}>
-                        {item.output_result?.title || item.input_summary || '未命名推荐'}
+                        {item.output_summary?.title || item.input_summary || '未命名推荐'}
                       </Text>
                       <Text style={styles.historyDate}>
                         {new Date(item.created_at).toLocaleDateString()}
@@ -6,7 +6,7 @@ import { useNavigation } from '@react-navigation/native';
 import * as ImagePicker from 'expo-image-picker';
 import { theme } from '../../../styles/theme';
 import { uploadFile } from '../../../../api/upload';
-import { imageToCalorie, CalorieResult, getHistory, AILog } from '../../../../api/ai';
+import { imageToCalorie, CalorieResult, getHistory, getHistoryDetail, AILog } from '../../../../api/ai';
 import AIGeneratingModal from '../../../components/AIGeneratingModal';
 
 const ImageToCalorieFeature = () => {
@@ -70,17 +70,21 @@ const ImageToCalorieFeature = () => {
     }
   };
 
-  const handleHistoryPress = (item: AILog) => {
+  const handleHistoryPress = async (item: AILog) => {
     // For calorie feature, we just populate the result state
-    // We assume the output_result is compatible with CalorieResult
-    if (item.output_result) {
+    // The list only carries a summary, so load the full result first
+    const detail = await getHistoryDetail(item.id).catch((e) => {
+        console.error('Failed to fetch history item', e);
+        return null;
+    });
+    if (detail && detail.output_result) {
         // If the result is a string (legacy), we might need parsing, 
         // but our updated backend returns object/dict.
         // Assuming CalorieResult structure match.
         try {
-            const res = typeof item.output_result === 'string' 
-                ? JSON.parse(item.output_result) 
-                : item.output_result;
+            const res = typeof detail.output_result === 'string' 
+                ? JSON.parse(detail.output_result) 
+                : detail.output_result;
             setResult(res);
             // Optionally scroll to result or alert
             Alert.alert('History Loaded', 'Showing historical analysis result.');
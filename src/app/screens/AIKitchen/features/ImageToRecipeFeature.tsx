@@ -6,7 +6,7 @@ import { useNavigation } from '@react-navigation/native';
 import * as ImagePicker from 'expo-image-picker';
 import { theme } from '../../../styles/theme';
 import { uploadFile } from '../../../../api/upload';
-import { imageToRecipe, getHistory, AILog } from '../../../../api/ai';
+import { imageToRecipe, getHistory, getHistoryDetail, AILog } from '../../../../api/ai';
 import AIGeneratingModal from '../../../components/AIGeneratingModal';
 
 const ImageToRecipeFeature = () => {
@@ -73,9 +73,14 @@ const ImageToRecipeFeature = () => {
     }
   };
 
-  const handleHistoryPress = (item: AILog) => {
-    if (item.output_result) {
-      navigation.navigate('GeneratedRecipeResult', { recipe: item.output_result, logId: item.id });
+  const handleHistoryPress = async (item: AILog) => {
+    try {
+      const detail = await getHistoryDetail(item.id);
+      if (detail.output_result) {
+        navigation.navigate('GeneratedRecipeResult', { recipe: detail.output_result, logId: item.id });
+      }
+    } catch (error) {
+      console.error('Failed to fetch history item:', error);
     }
   };
 
@@ -145,15 +150,15 @@ const ImageToRecipeFeature = () => {
                     onPress={() => handleHistoryPress(item)}
                   >
                     <View style={styles.historyIcon}>
-                      {item.output_result?.image_url ? (
-                        <Image source={{ uri: item.output_result.image_url }} style={styles.historyImage} />
+                      {item.output_summary?.image_url ? (
+                        <Image source={{ uri: item.output_summary.image_url }} style={styles.historyImage} />
                       ) : (
                         <Ionicons name="image-outline" size={20} color="#999" />
                       )}
                     </View>
                     <View style={styles.historyContent}>
                       <Text style={styles.historyTitle} numberOfLines={1}>
-                        {item.output_result?.title || '未命名菜谱'}
+                        {item.output_summary?.title || '未命名菜谱'}
                       </Text>
                       <Text style={styles.historyDate}>
                         {new Date(item.created_at).toLocaleDateString()}
@@ -3,7 +3,7 @@ import { View, Text, StyleSheet, TextInput, TouchableOpacity, ScrollView, Alert,
 import { SafeAreaView } from 'react-native-safe-area-context';
 import { Ionicons } from '@expo/vector-icons';
 import { useNavigation } from '@react-navigation/native';
-import { generateMealPlan, MealPlanResult, getHistory, AILog } from '../../../../api/ai';
+import { generateMealPlan, MealPlanResult, getHistory, getHistoryDetail, AILog } from '../../../../api/ai';
 import AIGeneratingModal from '../../../components/AIGeneratingModal';
 import { LinearGradient } from 'expo-linear-gradient';
 import { theme } from '../../../styles/theme';
@@ -67,9 +67,14 @@ const MealPlanFeature = () => {
     }
   };
 
-  const handleHistoryPress = (item: AILog) => {
-    if (item.output_result) {
-      setResult(item.output_result);
+  const handleHistoryPress = async (item: AILog) => {
+    try {
+      const detail = await getHistoryDetail(item.id);
+      if (detail.output_result) {
+        setResult(detail.output_result);
+      }
+    } catch (error) {
+      console.error('Failed to fetch history item:', error);
     }
   };
 
@@ -275,7 +280,7 @@ const MealPlanFeature = () => {
                     </View>
                     <View style={styles.historyContent}>
                       <Text style={styles.historyTitle} numberOfLines={1}>
-                        {item.output_result?.title || item.input_summary || '未命名计划'}
+                        {item.output_summary?.title || item.input_summary || '未命名计划'}
                       </Text>
                       <Text style={styles.historyDate}>
                         {new Date(item.created_at).toLocaleDateString()}
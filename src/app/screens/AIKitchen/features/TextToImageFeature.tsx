@@ -50,8 +50,8 @@ const TextToImageFeature = () => {
   };
 
   const handleHistoryPress = (item: AILog) => {
-    if (item.output_result && item.output_result.url) {
-      setGeneratedImage(item.output_result.url);
+    if (item.output_summary && item.output_summary.url) {
+      setGeneratedImage(item.output_summary.url);
       setPrompt(item.input_summary); // Restore prompt
     }
   };
@@ -5,7 +5,7 @@ import { Ionicons } from '@expo/vector-icons';
 import { useNavigation } from '@react-navigation/native';
 import { LinearGradient } from 'expo-linear-gradient';
 import { theme } from '../../../styles/theme';
-import { textToRecipe, getHistory, AILog } from '../../../../api/ai';
+import { textToRecipe, getHistory, getHistoryDetail, AILog } from '../../../../api/ai';
 import AIGeneratingModal from '../../../components/AIGeneratingModal';
 
 const TextToRecipeFeature = () => {
@@ -52,9 +52,14 @@ const TextToRecipeFeature = () => {
     }
   };
 
-  const handleHistoryPress = (item: AILog) => {
-    if (item.output_result) {
-      navigation.navigate('GeneratedRecipeResult', { recipe: item.output_result, logId: item.id });
+  const handleHistoryPress = async (item: AILog) => {
+    try {
+      const detail = await getHistoryDetail(item.id);
+      if (detail.output_result) {
+        navigation.navigate('GeneratedRecipeResult', { recipe: detail.output_result, logId: item.id });
+      }
+    } catch (error) {
+      console.error('Failed to fetch history item:', error);
     }
   };
 
@@ -144,15 +149,15 @@ const TextToRecipeFeature = () => {
                       onPress={() => handleHistoryPress(item)}
                     >
                       <View style={styles.historyIcon}>
-                        {item.output_result?.image_url ? (
-                          <Image source={{ uri: item.output_result.image_url }} style={styles.historyImage} />
+                        {item.output_summary?.image_url ? (
+                          <Image source={{ uri: item.output_summary.image_url }} style={styles.historyImage} />
                         ) : (
                           <Ionicons name="restaurant-outline" size={20} color="#999" />
                         )}
                       </View>
                       <View style={styles.historyContent}>
                         <Text style={styles.historyTitle} numberOfLines={1}>
-                          {item.output_result?.title || item.input_summary || '未命名菜谱'}
+                          {item.output_summary?.title || item.input_summary || '未命名菜谱'}
                         </Text>
                         <Text style={styles.historyDate}>
                           {new Date(item.created_at).toLocaleDateString()}
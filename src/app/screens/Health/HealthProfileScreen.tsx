@@ -18,6 +18,16 @@ const HealthProfileScreen = () => {
     loadProfile();
   }, []);
 
+  // Advice is generated in the background after saving; refresh until it is there
+  useEffect(() => {
+    if (profile?.advice_status !== 'pending') return;
+    const timer = setTimeout(async () => {
+      const data = await getHealthProfile();
+      if (data) setProfile(data);
+    }, 3000);
+    return () => clearTimeout(timer);
+  }, [profile]);
+
   const loadProfile = async () => {
     const data = await getHealthProfile();
     if (data) {
@@ -90,11 +100,20 @@ const HealthProfileScreen = () => {
               </View>
             </View>
             
-            <Text style={styles.sectionTitle}>饮食建议</Text>
-            <Text style={styles.adviceText}>{profile.dietary_advice}</Text>
-            
-            <Text style={styles.sectionTitle}>运动建议</Text>
-            <Text style={styles.adviceText}>{profile.exercise_advice}</Text>
+            {profile.advice_status === 'pending' && !profile.dietary_advice ? (
+              <View style={styles.pendingRow}>
+                <ActivityIndicator color={theme.colors.primary} />
+                <Text style={styles.adviceText}>正在生成个性化建议...</Text>
+              </View>
+            ) : (
+              <>
+                <Text style={styles.sectionTitle}>饮食建议</Text>
+                <Text style={styles.adviceText}>{profile.dietary_advice}</Text>
+                
+                <Text style={styles.sectionTitle}>运动建议</Text>
+                <Text style={styles.adviceText}>{profile.exercise_advice}</Text>
+              </>
+            )}
             
             <TouchableOpacity 
               style={styles.linkButton}
@@ -164,6 +183,7 @@ const styles = StyleSheet.create({
   statLabel: { fontSize: 12, color: '#9A9A9A', fontWeight: '700', marginTop: 4 },
   sectionTitle: { fontSize: 13, fontWeight: '900', marginTop: 14, marginBottom: 8, letterSpacing: 0.6, fontStyle: 'italic', color: '#1A1A1A' },
   adviceText: { fontSize: 14, color: '#3A3A3A', lineHeight: 22, fontWeight: '600' },
+  pendingRow: { flexDirection: 'row', alignItems: 'center', gap: 10, marginTop: 12 },
   linkButton: {
     marginTop: 18,
     backgroundColor: '#1A1A1A',
@@ -9,7 +9,7 @@ import { RootStackParamList } from '../../navigation/types';
 import { LinearGradient } from 'expo-linear-gradient';
 import { getRecommendations, getHealthNews, HealthNews, FeedItem } from '../../../api/explore';
 import { getDailyRecommendation, Recipe } from '../../../api/content';
-import { getCheckIns, CheckIn } from '../../../api/health';
+import { getCheckInHeatmap, heatmapToStatusMap, CheckIn } from '../../../api/health';
 import FeedCard from '../../components/FeedCard';
 import Svg, { Circle } from 'react-native-svg';
 import { useTranslation } from 'react-i18next';
@@ -29,7 +29,7 @@ const RecommendScreen = () => {
   const [recipes, setRecipes] = useState<FeedItem[]>([]);
   const [banners, setBanners] = useState<HealthNews[]>([]);
   const [dailyRecs, setDailyRecs] = useState<Recipe[]>([]);
-  const [checkIns, setCheckIns] = useState<CheckIn[]>([]);
+  const [checkInStatus, setCheckInStatus] = useState<Record<string, CheckIn['status']>>({});
   const [loading, setLoading] = useState(true);
   const [modalVisible, setModalVisible] = useState(false);
   const [carouselWidth, setCarouselWidth] = useState(0);
@@ -86,7 +86,14 @@ const RecommendScreen = () => {
       if (recipes.length === 0) {
         fetchData(1);
       }
-      getCheckIns().then(setCheckIns).catch(console.error);
+      // The week shown can start in the previous year
+      const today = new Date();
+      const monday = new Date(today);
+      monday.setDate(today.getDate() - ((today.getDay() + 6) % 7));
+      const years = Array.from(new Set([monday.getFullYear(), today.getFullYear()]));
+      Promise.all(years.map(year => getCheckInHeatmap(year)))
+        .then(maps => setCheckInStatus(Object.assign({}, ...maps.map(m => heatmapToStatusMap(m.year, m.days)))))
+        .catch(console.error);
     }, [])
   );
 
@@ -264,16 +271,16 @@ const RecommendScreen = () => {
                <View style={styles.daysRow}>
                  {days.map((day, index) => {
                    const dateStr = day.toISOString().split('T')[0];
-                   const checkIn = checkIns.find(c => c.date === dateStr);
+                   const status = checkInStatus[dateStr];
                    const isToday = dateStr === today.toISOString().split('T')[0];
                    
                    let bgColor = '#F5F5F5';
                    let textColor = '#333';
                    
-                   if (checkIn) {
-                     if (checkIn.status === 'white') { bgColor = '#E8F5E9'; textColor = '#2ECC71'; } // Healthy
-                     else if (checkIn.status === 'orange') { bgColor = '#FFF3E0'; textColor = '#FFA502'; } // Warning
-                     else if (checkIn.status === 'red') { bgColor = '#FFEBEE'; textColor = '#FF4757'; } // Bad
+                   if (status) {
+                     if (status === 'white') { bgColor = '#E8F5E9'; textColor = '#2ECC71'; } // Healthy
+                     else if (status === 'orange') { bgColor = '#FFF3E0'; textColor = '#FFA502'; } // Warning
+                     else if (status === 'red') { bgColor = '#FFEBEE'; textColor = '#FF4757'; } // Bad
                    }
                    
                    if (isToday) {
@@ -283,7 +290,7 @@ const RecommendScreen = () => {
                    return (
                      <View key={index} style={[styles.modalDayItem, { backgroundColor: bgColor, borderWidth: isToday ? 1 : 0, borderColor: '#2ECC71' }]}>
                        <Text style={[styles.modalDayText, { color: textColor }]}>{day.getDate()}</Text>
-                       {checkIn && <View style={[styles.modalStatusDot, { backgroundColor: textColor }]} />}
+                       {status && <View style={[styles.modalStatusDot, { backgroundColor: textColor }]} />}
                      </View>
                    );
                  })}